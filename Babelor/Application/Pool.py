@@ -0,0 +1,231 @@
+# coding=utf-8
+# Copyright 2019 StrTrek Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# System Required
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+# Outer Required
+# Inner Required
+from Babelor.Presentation import URL
+from Babelor.Session import MQ
+from Babelor.Data import SQL
+# Global Parameters
+from Babelor.Config import CONFIG
+
+
+class POOL:
+    def __init__(self, idle_time: float = None, check_time: float = None, max_age: float = None,
+                 capacity: int = None):
+        """
+        # 进程内端点池：按规范化 URL 复用 MQ, SQL, FTP, FILE 句柄
+        :param idle_time: float     # 空闲回收时间（秒），默认 CONFIG.POOL_IDLE_TIME
+        :param check_time: float    # 健康检查及空闲扫描间隔（秒），默认 CONFIG.POOL_CHECK_TIME
+        :param max_age: float       # 最长存活时间（秒），到期重建，默认 CONFIG.POOL_MAX_AGE，None 为不限
+        :param capacity: int        # 最多句柄数，超出回收最久未用的，默认 CONFIG.POOL_CAPACITY，None 为不限
+        """
+        if idle_time is None:
+            self.idle_time = CONFIG.POOL_IDLE_TIME
+        else:
+            self.idle_time = idle_time
+        if check_time is None:
+            self.check_time = CONFIG.POOL_CHECK_TIME
+        else:
+            self.check_time = check_time
+        if max_age is None:
+            self.max_age = CONFIG.POOL_MAX_AGE
+        else:
+            self.max_age = max_age
+        if capacity is None:
+            self.capacity = CONFIG.POOL_CAPACITY
+        else:
+            self.capacity = capacity
+        self.handles = OrderedDict()        # 按最近使用排序 {(URL 字符串, 线程): [句柄, 最近使用时间, 最近检查时间, 创建时间,
+                                            #                                  待回收原因]}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()              # 子进程继承的句柄不可复用
+        self.swept = time.time()            # 最近空闲扫描时间
+        self.counters = {
+            "hits": 0,                      # 复用次数
+            "misses": 0,                    # 新建次数
+            "evicted": 0,                   # 空闲回收数
+            "expired": 0,                   # 到期回收数
+            "overflow": 0,                  # 超出容量回收数
+            "invalidated": 0,               # 主动失效数
+            "unhealthy": 0,                 # 健康检查失败数
+        }
+
+    def get(self, conn: URL, factory: callable):
+        """
+        :param conn: URL            # 端点
+        :param factory: callable    # 新建句柄  factory(URL) -> handle
+        :return: handle
+        """
+        thread = threading.get_ident()
+        key = (conn.to_string(), thread)        # 句柄非线程安全（zmq 套接字、FTP 连接），各线程独立
+        now = time.time()
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.handles = OrderedDict()
+            if now - self.swept >= self.check_time:
+                self._evict(now, thread)
+            # ------------------------------------------------------------------
+            entry = self.handles.get(key, None)
+            if (entry is not None) and (entry[4] is not None):
+                # 其他线程标记待回收，由本线程释放     marked stale by another thread, released by its owner
+                logging.debug("POOL::{0} {1}, reconnect.".format(key, entry[4]))
+                self._release(key)
+                entry = None
+            if (entry is not None) and (self.max_age is not None) and (now - entry[3] >= self.max_age):
+                logging.debug("POOL::{0} expired, reconnect.".format(key))
+                self.counters["expired"] += 1
+                release_handle(self.handles.pop(key)[0])
+                entry = None
+            if (entry is not None) and (now - entry[2] >= self.check_time):
+                if is_healthy(entry[0]):
+                    entry[2] = now
+                else:
+                    logging.warning("POOL::{0} unhealthy, reconnect.".format(key))
+                    self.counters["unhealthy"] += 1
+                    release_handle(entry[0])
+                    del self.handles[key]
+                    entry = None
+            # ------------------------------------------------------------------
+            if entry is None:
+                self.counters["misses"] += 1
+                handle = factory(conn)
+                self.handles[key] = [handle, now, now, now, None]
+                logging.debug("POOL::{0} create:{1}".format(key, type(handle).__name__))
+                if self.capacity is not None:
+                    self._overflow(thread)
+            else:
+                self.counters["hits"] += 1
+                entry[1] = now
+                self.handles.move_to_end(key)
+                handle = entry[0]
+        return handle
+
+    def _evict(self, now: float, thread: int):
+        for key in list(self.handles.keys()):
+            if now - self.handles[key][1] >= self.idle_time:
+                self._retire(key, thread, "evicted")
+            elif (self.max_age is not None) and (now - self.handles[key][3] >= self.max_age):
+                self._retire(key, thread, "expired")
+        self.swept = now
+
+    def _overflow(self, thread: int):
+        # 超出容量时按最近最少使用回收，已标记待回收的句柄不计入容量
+        live = len([entry for entry in self.handles.values() if entry[4] is None])
+        for key in list(self.handles.keys())[:-1]:
+            if live <= self.capacity:
+                break
+            if self.handles[key][4] is None:
+                self._retire(key, thread, "overflow")
+                live -= 1
+
+    def _retire(self, key: tuple, thread: int, reason: str):
+        """
+        # 本线程的句柄立即释放；其他线程的句柄仅标记，由其所属线程下次 get 时释放（句柄非线程安全）
+        :param key: tuple           # (URL 字符串, 线程)
+        :param thread: int          # 调用线程 threading.get_ident()
+        :param reason: str          # ["evicted", "expired", "overflow", "invalidated"]
+        :return: None
+        """
+        if key[1] == thread:
+            self.handles[key][4] = reason
+            self._release(key)
+        elif self.handles[key][4] is None:
+            self.handles[key][4] = reason
+            logging.debug("POOL::{0} mark {1}.".format(key, reason))
+
+    def _release(self, key: tuple):
+        entry = self.handles.pop(key)
+        release_handle(entry[0])
+        self.counters[entry[4]] += 1
+        logging.debug("POOL::{0} release {1}.".format(key, entry[4]))
+
+    def invalidate(self, conn: URL) -> int:
+        """
+        # 主动失效（如对端重启、凭据变更）：释放本线程的句柄，其他线程的句柄由其下次使用时释放并重建
+        :param conn: URL            # 端点
+        :return: int                # 失效的句柄数
+        """
+        url = conn.to_string()
+        thread = threading.get_ident()
+        with self.lock:
+            keys = [key for key in self.handles.keys() if key[0] == url]
+            for key in keys:
+                self._retire(key, thread, "invalidated")
+        logging.debug("POOL::{0} invalidate:{1}".format(url, len(keys)))
+        return len(keys)
+
+    def close(self, thread: int = None) -> int:
+        """
+        # 关闭时释放句柄（MQ 子进程、SQL 连接池、FTP 连接）
+        :param thread: int          # 仅释放该线程的句柄 threading.get_ident()，None 为全部（各线程已退出时）
+        :return: int                # 释放的句柄数
+        """
+        with self.lock:
+            if self.pid != os.getpid():     # 继承自父进程的句柄不属于本进程
+                self.pid = os.getpid()
+                self.handles = OrderedDict()
+            keys = [key for key in self.handles.keys() if (thread is None) or (key[1] == thread)]
+            for key in keys:
+                release_handle(self.handles.pop(key)[0])
+        if len(keys) > 0:
+            logging.debug("POOL close:{0} stats:{1}".format(len(keys), self.stats()))
+        return len(keys)
+
+    def stats(self) -> dict:
+        """
+        :return: dict   # {"hits": 免去的新建次数, "misses", "evicted", "expired", "overflow", "invalidated",
+                        #  "unhealthy", "size", "stale": 待所属线程回收数, "reuse": 复用率}
+        """
+        rt = dict(self.counters)
+        rt["size"] = len(self.handles)
+        rt["stale"] = len([entry for entry in self.handles.values() if entry[4] is not None])
+        total = rt["hits"] + rt["misses"]
+        rt["reuse"] = rt["hits"] / total if total else 0
+        return rt
+
+
+def is_healthy(handle: object) -> bool:
+    if isinstance(handle, MQ):
+        if handle.process is not None:
+            return handle.process.is_alive()
+        if handle.socket is not None:
+            return not handle.socket.closed
+        return True
+    if isinstance(handle, SQL):
+        try:
+            with handle.engine.connect():
+                return True
+        except Exception as e:
+            logging.warning("POOL::{0} health check failed:{1}".format(handle.conn, e))
+            return False
+    return True
+
+
+def release_handle(handle: object):
+    if isinstance(handle, MQ):
+        handle.release()
+    elif isinstance(handle, SQL):
+        handle.engine.dispose()
+
+
+POOLED_SCHEMES = ["tcp", "oracle", "mysql", "ftp", "file"]     # 可复用端点，TOMAIL 与 FTPD 有状态不复用
+pool = POOL()       # 进程级端点池
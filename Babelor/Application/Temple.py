@@ -14,87 +14,295 @@
 # limitations under the License.
 
 # System Required
+import os
 import time
+import zlib
 import logging
-from multiprocessing import Process, Pipe, Queue
+import queue
+import asyncio
+import threading
+from collections import OrderedDict
+from multiprocessing import Process, Pipe
+from multiprocessing.sharedctypes import RawArray
+from multiprocessing.connection import wait as connection_wait
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait as futures_wait
 # Outer Required
 # Inner Required
-from Babelor.Presentation import URL
-from Babelor.Session import MQ
+from Babelor.Presentation import MSG, URL
+from Babelor.Session import MQ, AsyncMQ, stop_process
 from Babelor.Data import SQL, FTP, FTPD, TOMAIL, FILE
+from Babelor.Application.Pool import pool, POOLED_SCHEMES
 # Global Parameters
 from Babelor.Config import CONFIG
 
 
-def priest(conn: URL, queue_ctrl: Queue, pipe_in: Pipe):
-    mq = MQ(conn)
-    is_active = queue_ctrl.get()
-    while is_active:
-        if queue_ctrl.empty():
-            msg_in = mq.pull()
-            logging.info("TEMPLE::{0} pull:{1}".format(conn, msg_in))
-            pipe_in.send(msg_in)
-            logging.debug("TEMPLE::{0}::PIPE IN send:{1}".format(conn, msg_in))
+class Congregation:
+    def __init__(self, pipes_in: list, ordered: bool = False, timeout: int = None, prefetch: int = None):
+        """
+        # 信徒分派：优先分给未完成最少的信徒，每个信徒至多 prefetch 条未完成；
+        # 按 case 有序时同一 case 固定由同一信徒处理，该信徒已满则暂停拉入；路由计划汇合的消息总是如此（同一进程内汇合）
+        # 信徒回报暂缓（汇合未到齐）的消息释放名额，待汇合完成再确认/否认
+        :param pipes_in: list       # 各信徒的消息管道 [Pipe, ]
+        :param ordered: bool        # 按 case 有序
+        :param timeout: int         # 可见性超时（毫秒），超时未回报视为失败，None 为不限
+        :param prefetch: int        # 每个信徒最多未完成的消息数，默认 CONFIG.TEMPLE_PREFETCH
+        """
+        self.pipes = pipes_in
+        self.ordered = ordered
+        self.timeout = None if timeout is None else timeout / 1000
+        if prefetch is None:
+            self.prefetch = CONFIG.TEMPLE_PREFETCH
         else:
-            is_active = queue_ctrl.get()
+            self.prefetch = prefetch
+        self.sequence = 0
+        self.pending = [OrderedDict() for pipe in pipes_in]     # 各信徒未完成 {序号: [确认标识, 超时时刻]}
+        self.held = None                                        # 指定信徒已满时暂存 (信徒, 序号, MSG, 确认标识)
+        self.deferred = OrderedDict()                           # 暂缓回报的消息 {序号: 确认标识}，不占名额
+
+    def choose(self, msg: MSG) -> int:
+        if self.ordered or is_joined(msg):
+            return zlib.crc32(str(msg.case).encode(CONFIG.Coding)) % len(self.pipes)
+        return min(range(0, len(self.pipes), 1), key=lambda i: len(self.pending[i]))
+
+    def is_free(self) -> bool:
+        self._send_held()
+        return (self.held is None) and any([len(pending) < self.prefetch for pending in self.pending])
+
+    def dispatch(self, msg: MSG, tokens: list):
+        self.sequence += 1
+        self.held = (self.choose(msg), self.sequence, msg, tokens)
+        self._send_held()
+
+    def _send_held(self):
+        if (self.held is not None) and (len(self.pending[self.held[0]]) < self.prefetch):
+            i, sequence, msg, tokens = self.held
+            self.pipes[i].send((sequence, msg))
+            self.pending[i][sequence] = [tokens, None if self.timeout is None else time.time() + self.timeout]
+            self.held = None
+
+    def confessed(self) -> list:
+        """
+        # 收集信徒回报的处理结果，及超过可见性超时未回报的消息（视为失败，信徒回报后才释放名额）
+        :return: list               # [(确认标识, 是否成功), ]
+        """
+        rt = []
+        for i, pipe in enumerate(self.pipes):
+            while pipe.poll(0):
+                sequence, is_ok = pipe.recv()
+                entry = self.pending[i].pop(sequence, None)
+                tokens = self.deferred.pop(sequence, None) if entry is None else entry[0]
+                if tokens is None:
+                    continue
+                if is_ok is None:       # 汇合未到齐，暂缓确认
+                    self.deferred[sequence] = tokens
+                else:
+                    rt.append((tokens, is_ok))
+        now = time.time()
+        for i, pending in enumerate(self.pending):
+            for sequence, entry in pending.items():
+                if (entry[0] is not None) and (entry[1] is not None) and (entry[1] <= now):
+                    logging.warning("TEMPLE::BELIEVER:{0} timeout:{1}".format(i, sequence))
+                    rt.append((entry[0], None))
+                    entry[0] = None
+        return rt
+
+    def wait_time(self) -> (int, None):
+        """
+        :return: (int, None)        # 距最近可见性超时的时间（毫秒），None 为无
+        """
+        deadlines = [entry[1] for pending in self.pending for entry in pending.values()
+                     if (entry[0] is not None) and (entry[1] is not None)]
+        if len(deadlines) == 0:
+            return None
+        return max(0, int((min(deadlines) - time.time()) * 1000))
+
+    def outstanding(self) -> int:
+        return sum([len(pending) for pending in self.pending])
+
+    def release(self) -> list:
+        """
+        :return: list               # 尚未分派的暂存消息及暂缓回报的消息的确认标识（汇合尚在信徒内存中）
+        """
+        tokens = [token for deferred in self.deferred.values() for token in deferred]
+        self.deferred = OrderedDict()
+        if self.held is not None:
+            tokens, self.held = tokens + self.held[3], None
+        return tokens
+
+
+def priest(conn: URL, pipe_ctrl: Pipe, pipes_in: list, reliable: dict = None, ordered: bool = False,
+           prefetch: int = None):
+    """
+    # 司祭：拉入消息分派给信徒，按信徒回报的处理结果确认/否认（启用持久化缓冲或确认重发时）
+    :param conn: URL             # 本节点地址
+    :param pipe_ctrl: Pipe       # 控制管道 (关闭期限[毫秒],)，收到后不再拉入，等待已分派的消息处理完成后退出
+    :param pipes_in: list        # 各信徒的消息管道 [Pipe, ]，发出 (序号, MSG)，回传 (序号, 是否成功)，None 为暂缓
+    :param reliable: dict        # 确认重发 {"timeout": int(毫秒), "retries": int, "batch": int}，None 为不确认
+    :param ordered: bool         # 同一 case 的消息按到达顺序由同一信徒处理
+    :param prefetch: int         # 每个信徒最多未完成的消息数，默认 CONFIG.TEMPLE_PREFETCH
+    :return: None
+    """
+    def settle():
+        for tokens, is_ok in congregation.confessed():
+            if is_ok:
+                mq.ack(tokens)
+            else:
+                logging.warning("TEMPLE::{0} nack:{1} done:{2}".format(conn, tokens, is_ok))
+                mq.nack(tokens)
+
+    mq = MQ(conn, reliable=reliable)
+    mq.start("PULL")
+    congregation = Congregation(pipes_in, ordered, None if reliable is None else reliable["timeout"], prefetch)
+    waits = [pipe_ctrl] + pipes_in
+    while not pipe_ctrl.poll(0):
+        if congregation.is_free():
+            if mq.poll(congregation.wait_time(), waits):
+                msg_in = mq.pull()
+                logging.info("TEMPLE::{0} pull:{1}".format(conn, msg_in))
+                congregation.dispatch(msg_in, mq.detach())
+        else:
+            wait = congregation.wait_time()
+            connection_wait(waits, None if wait is None else wait / 1000)
+        settle()
     else:
-        queue_ctrl.close()
+        timeout = pipe_ctrl.recv()
+        deadline = time.time() + timeout / 1000
+        mq.nack(congregation.release())
+        while (congregation.outstanding() > 0) and (time.time() < deadline):
+            connection_wait(pipes_in, max(0, deadline - time.time()))
+            settle()
+        mq.release(max(0, int((deadline - time.time()) * 1000)))
+        logging.debug("TEMPLE::{0} priest stopped".format(conn))
 
 
 class TEMPLE:
-    def __init__(self, conn: (URL, str)):
-        # "tcp://*:<port>"
+    def __init__(self, conn: (URL, str), reliable: dict = None):
+        """
+        :param conn: (URL, str)      # "tcp://*:<port>"
+        :param reliable: dict        # 确认重发，默认 CONFIG.MQ_RELIABLE；信徒处理完成后才确认消息
+        """
         self.me = conn
-        self.priest_pipe_in = Pipe()
-        self.priest_queue_ctrl = Queue(CONFIG.MQ_MAX_DEPTH)
-        self.believer_queue_ctrl = Queue(CONFIG.MQ_MAX_DEPTH)
+        if reliable is None:
+            self.reliable = CONFIG.MQ_RELIABLE
+        else:
+            self.reliable = reliable
+        self.priest_pipes = []              # 司祭与各信徒的消息管道，每次启动新建
+        self.priest_pipe_ctrl = None        # 每次启动新建
         self.priest = None
-        self.believer = None
+        self.believers = []                 # [(Process, 控制管道), ]
+        self.stage_stats = []               # 流水线模式各信徒的分段统计 [RawArray, ]
 
-    def start(self):
-        is_active = True
-        self.priest_queue_ctrl.put(is_active)
+    def start(self, workers: int = 1, ordered: bool = False, prefetch: int = None):
+        self.priest_pipes = [Pipe() for i in range(0, workers, 1)]
+        self.priest_pipe_ctrl = Pipe()
         self.priest = Process(target=priest,
-                              args=(self.me, self.priest_queue_ctrl, self.priest_pipe_in[0]))
+                              args=(self.me, self.priest_pipe_ctrl[1], [pipe[0] for pipe in self.priest_pipes],
+                                    self.reliable, ordered, prefetch))
         self.priest.start()
 
-    def open(self, role: str, func: callable = None):
-        is_active = True
-        self.start()
-        self.believer_queue_ctrl.put(is_active)
+    def open(self, role: str, func: callable = None, workers: int = None, ordered: bool = None,
+             thread: bool = None, pipelined: bool = None):
+        """
+        :param role: str             # ["sender", "treater", "encrypter", "receiver"]，默认 treater
+        :param func: callable        # 自定义处理过程
+        :param workers: int          # 信徒数，默认 CONFIG.TEMPLE_WORKERS
+        :param ordered: bool         # 同一 case 的消息由同一信徒按序处理，默认 CONFIG.TEMPLE_ORDERED
+        :param thread: bool          # 信徒以线程运行于同一进程（适合 I/O 等待为主），默认 CONFIG.TEMPLE_THREAD
+        :param pipelined: bool       # 信徒内分段流水线（来源读取与目的端写入重叠），默认 CONFIG.TEMPLE_PIPELINE
+        """
+        if workers is None:
+            workers = CONFIG.TEMPLE_WORKERS
+        if ordered is None:
+            ordered = CONFIG.TEMPLE_ORDERED
+        if thread is None:
+            thread = CONFIG.TEMPLE_THREAD
+        if pipelined is None:
+            pipelined = CONFIG.TEMPLE_PIPELINE
+        if pipelined:
+            # 流水线各段同时在途，放宽每个信徒未完成的消息数
+            self.stage_stats = [RawArray("d", len(PIPELINE_STAGES) * 3) for i in range(0, workers, 1)]
+            self.start(workers, ordered, CONFIG.TEMPLE_PREFETCH * len(PIPELINE_STAGES))
+        else:
+            self.stage_stats = [None] * workers
+            self.start(workers, ordered)
         if role in ["sender"]:
-            self.believer = Process(target=sender, args=(self.priest_pipe_in[1], self.believer_queue_ctrl, func))
-        elif role in ["treater", "encrypter"]:
-            self.believer = Process(target=treater, args=(self.priest_pipe_in[1], self.believer_queue_ctrl, func))
+            target = sender
         elif role in ["receiver"]:
-            self.believer = Process(target=receiver, args=(self.priest_pipe_in[1], self.believer_queue_ctrl, func))
-        else:       # default is treater
-            self.believer = Process(target=treater, args=(self.priest_pipe_in[1], self.believer_queue_ctrl, func))
-        self.believer.start()
+            target = receiver
+        else:       # default is treater: ["treater", "encrypter"]
+            target = treater
+        pipes_in = [pipe[1] for pipe in self.priest_pipes]
+        if thread:
+            pipe_ctrl = Pipe()
+            believer = Process(target=congregate, args=(target, pipes_in, pipe_ctrl[1], func, self.stage_stats))
+            believer.start()
+            self.believers.append((believer, pipe_ctrl))
+            return
+        for pipe_in, stats in zip(pipes_in, self.stage_stats):
+            pipe_ctrl = Pipe()
+            believer = Process(target=target, args=(pipe_in, pipe_ctrl[1], func, stats))
+            believer.start()
+            self.believers.append((believer, pipe_ctrl))
 
-    def close(self):
-        is_active = False
-        if isinstance(self.believer, Process):
-            self.believer_queue_ctrl.put(is_active)
-            time.sleep(CONFIG.MQ_BLOCK_TIME)
-            self.believer.terminate()
-        while not self.believer_queue_ctrl.empty():
-            self.believer_queue_ctrl.get()
-        self.believer = None
-
-    def stop(self):
-        self.close()
-        is_active = False
+    def close(self, timeout: int = None):
+        """
+        # 关闭信徒：处理完已转来的消息后退出，超过期限才终止
+        :param timeout: int          # 关闭期限（毫秒），默认 CONFIG.MQ_LINGER
+        """
+        if timeout is None:
+            timeout = CONFIG.MQ_LINGER
+        for believer, pipe_ctrl in self.believers:
+            pipe_ctrl[0].send(timeout)      # 同时通知，各信徒并行排空
+        for believer, pipe_ctrl in self.believers:
+            stop_process(believer, None, timeout)
+            for end in pipe_ctrl:
+                end.close()
+        self.believers = []
+
+    def stop(self, timeout: int = None):
+        """
+        # 先停止司祭（不再拉入，等待已分派的消息处理完成并确认），再关闭信徒
+        :param timeout: int          # 各自的关闭期限（毫秒），默认 CONFIG.MQ_LINGER
+        """
         if isinstance(self.priest, Process):
-            self.priest_queue_ctrl.put(is_active)
-            time.sleep(CONFIG.MQ_BLOCK_TIME)
-            self.priest.terminate()
-        while not self.priest_queue_ctrl.empty():
-            self.priest_queue_ctrl.get()
+            stop_process(self.priest, self.priest_pipe_ctrl[0], timeout)
+            for end in self.priest_pipe_ctrl:
+                end.close()
+        self.priest_pipe_ctrl = None
         self.priest = None
+        self.close(timeout)
+        for pipe in self.priest_pipes:
+            for end in pipe:
+                end.close()
+        self.priest_pipes = []
+
+    def stats(self) -> dict:
+        """
+        :return: dict   # 流水线模式各段合计 {段名: {"count": 处理数, "avg_ms": 平均耗时, "depth": 段前队列深度}}
+        """
+        rt = {}
+        for i, stage in enumerate(PIPELINE_STAGES):
+            count, cost, depth = 0, 0.0, 0
+            for stats in self.stage_stats:
+                if stats is not None:
+                    count += int(stats[i * 3])
+                    cost += stats[i * 3 + 1]
+                    depth += int(stats[i * 3 + 2])
+            rt[stage] = {"count": count, "avg_ms": round(cost / count * 1000, 3) if count else 0, "depth": depth}
+        return rt
 
 
 def allocator(conn: URL):
+    # 可复用端点由进程级端点池按 URL 分配
+    if conn is None:
+        return None
+    elif conn.scheme in POOLED_SCHEMES:
+        return pool.get(conn, connector)
+    else:
+        return connector(conn)
+
+
+def connector(conn: URL):
     if conn is None:
         return None
     else:
@@ -112,200 +320,751 @@ def allocator(conn: URL):
             return FILE(conn)
 
 
-def sender(pipe_in: Pipe, queue_ctrl: Queue, func: callable = None):
+def is_mq(conn: URL) -> bool:
+    # 按端点 scheme 判断是否为 MQ（同 connector），不分配端点
+    return (conn is not None) and (conn.scheme in ["tcp"])
+
+
+PIPELINE_STAGES = ("origination", "encryption", "treatment", "function", "destination")     # 流水线各段
+
+
+class Pipeline:
+    def __init__(self, role: str, func: callable, done: callable, stats: RawArray = None, depth: int = None):
+        """
+        # 分段流水线：加密、处理、自定义处理、目的端各一个线程，段间有界队列；来源读取在调用者线程
+        # 相邻消息的各段重叠执行（读取下一条时写入上一条）
+        # 段间传递 [序号, 指令消息, 数据消息, 是否结束标记]，结束标记经过全部段后回报 done(序号, 是否成功)
+        :param role: str             # 角色名 ["SENDER", "RECEIVER", "TREATER"]
+        :param func: callable        # 自定义处理过程
+        :param done: callable        # 一条指令消息的全部数据消息处理完成  done(序号, 是否成功)
+        :param stats: RawArray       # 各段 [处理数, 累计耗时(秒), 段前队列深度] * PIPELINE_STAGES，可跨进程读取
+        :param depth: int            # 段间队列深度，默认 CONFIG.TEMPLE_PIPELINE_DEPTH
+        """
+        if depth is None:
+            depth = CONFIG.TEMPLE_PIPELINE_DEPTH
+        self.role = role
+        self.func = func
+        self.done = done
+        if stats is None:
+            self.stats = RawArray("d", len(PIPELINE_STAGES) * 3)
+        else:
+            self.stats = stats
+        self.failed = set()             # 处理失败的序号，其余数据消息跳过，结束标记回报失败
+        self.lock = threading.Lock()    # 各段线程共用 failed
+        self.queues = [queue.Queue(depth) for stage in STAGES]
+        self.threads = [threading.Thread(target=self._run, args=(i,)) for i in range(0, len(STAGES), 1)]
+        for thread in self.threads:
+            thread.start()
+
+    def feed(self, sequence: int, msg_head: MSG):
+        """
+        # 读取来源，数据消息逐条进入流水线，队列已满时阻塞（背压）
+        :param sequence: int         # 序号
+        :param msg_head: MSG         # 指令消息
+        """
+        try:
+            start = time.time()
+            for msg in originate(self.role, msg_head):
+                self._record(0, time.time() - start)
+                self.queues[0].put([sequence, msg_head, msg, False])
+                start = time.time()
+        except Exception as e:
+            logging.exception("TEMPLE::{0}::ORIGINATION error:{1}".format(self.role, e))
+            with self.lock:
+                self.failed.add(sequence)
+        self.queues[0].put([sequence, msg_head, None, True])
+
+    def _record(self, i: int, cost: float):
+        self.stats[i * 3] += 1
+        self.stats[i * 3 + 1] += cost
+
+    def _run(self, i: int):
+        name, stage = STAGES[i]
+        while True:
+            envelope = self.queues[i].get()
+            self.stats[(i + 1) * 3 + 2] = self.queues[i].qsize()
+            if envelope is None:
+                if i + 1 < len(self.queues):
+                    self.queues[i + 1].put(None)
+                pool.close(threading.get_ident())       # 本段线程复用的端点
+                return
+            sequence, msg_head, msg, is_end = envelope
+            with self.lock:
+                is_failed = sequence in self.failed
+            if (not is_end) and (not is_failed):
+                start = time.time()
+                try:
+                    envelope[2] = stage(self.role, msg_head, msg, self.func)
+                except Exception as e:
+                    logging.exception("TEMPLE::{0}::{1} error:{2}".format(self.role, name.upper(), e))
+                    with self.lock:
+                        self.failed.add(sequence)
+                self._record(i + 1, time.time() - start)
+            if i + 1 < len(self.queues):
+                self.queues[i + 1].put(envelope)
+            elif is_end:
+                with self.lock:
+                    is_ok = sequence not in self.failed
+                    self.failed.discard(sequence)
+                self.done(sequence, is_ok)
+
+    def close(self):
+        # 已进入流水线的消息处理完成后退出
+        self.queues[0].put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+def believe(pipe_in: Pipe, pipe_ctrl: Pipe, func: callable, role: str, stats: RawArray = None):
     """
-    :param pipe_in: Pipe         # 消息管道 （MSG, ）
-    :param queue_ctrl: Queue     # 控制 ("is_active",):(bool,)
+    # 信徒循环：逐条接收司祭分派的消息并处理，回报处理结果 (序号, 是否成功)，由司祭确认/否认及分派
+    # 收到关闭期限后，在期限内处理完已转来的消息再退出
+    # 汇合未到齐的消息先回报 (序号, None) 暂缓，汇合完成后再回报结果
+    :param pipe_in: Pipe         # 消息管道 (序号, MSG)
+    :param pipe_ctrl: Pipe       # 控制管道 (关闭期限[毫秒],)
     :param func: callable        # 自定义处理过程
+    :param role: str             # 角色名 ["SENDER", "RECEIVER", "TREATER"]
+    :param stats: RawArray       # 流水线分段统计，None 为逐条串行处理
     :return: None
     """
-    is_active = queue_ctrl.get()
-    while is_active:
-        # ----------------------------------------- Queue
-        if queue_ctrl.empty():
-            try:
-                msg_sender = pipe_in.recv()
-                logging.info("TEMPLE::SENDER PIPE IN recv:{0}".format(msg_sender))
-            except EOFError:
-                is_active = False
-                continue
-            origination = allocator(msg_sender.origination)    # Data.read(msg)
-            treatment = allocator(msg_sender.treatment)        # MessageQueue
-            encryption = allocator(msg_sender.encryption)      # MessageQueue
-            destination = allocator(msg_sender.destination)    # MessageQueue
-            # --------- origination -----------------------------------------
-            if isinstance(origination, MQ):
-                msg_origination = origination.request(msg_sender)
-                logging.debug("TEMPLE::SENDER::{0}::ORIG request:{1}".format(msg_sender.origination, msg_origination))
-            else:
-                msg_origination = origination.read(msg_sender)
-                logging.debug("TEMPLE::SENDER::{0}::ORIG read:{1}".format(msg_sender.origination, msg_origination))
-            # --------- encryption ------------------------------------------
-            if encryption is None:
-                msg_encryption = msg_origination
-            else:
-                msg_encryption = encryption.request(msg_origination)
-                logging.debug("TEMPLE::SENDER::{0}::ENCRYPT request:{1}".format(msg_sender.encryption, msg_encryption))
-            del msg_origination
-            # --------- treatment -------------------------------------------
-            if treatment is None:
-                msg_treatment = msg_encryption
-            else:
-                msg_treatment = treatment.request(msg_encryption)
-                logging.debug("TEMPLE::SENDER::{0}::TREAT request:{1}".format(msg_sender.treatment, msg_treatment))
-            del msg_encryption
-            # --------- function --------------------------------------------
-            if func is None:
-                msg_function = msg_treatment
-            else:
-                msg_function = func(msg_treatment)
-                logging.debug("TEMPLE::SENDER func:{0}".format(msg_function))
-            del msg_treatment
-            # --------- destination -----------------------------------------
-            if isinstance(destination, MQ):
-                destination.push(msg_function)
-                logging.info("TEMPLE::SENDER::{0}::DEST push:{1}".format(msg_sender.destination, msg_function))
-            else:
-                destination.write(msg_function)
-                logging.info("TEMPLE::SENDER::{0}::DEST write:{1}".format(msg_sender.destination, msg_function))
-        else:
-            is_active = queue_ctrl.get()
-    else:
-        while not queue_ctrl.empty():
-            queue_ctrl.get()
+    lock = threading.Lock()     # 流水线末段线程与本线程都会回报
 
+    def confess(sequence: int, is_ok: bool):
+        with lock:
+            pipe_in.send((sequence, is_ok))
 
-def receiver(pipe_in: Pipe, queue_ctrl: Queue, func: callable = None):
+    def work_once():
+        sequence, msg_in = pipe_in.recv()
+        logging.info("TEMPLE::{0} PIPE IN recv:{1}".format(role, msg_in))
+        # 处理者以 MQ 为来源时须同步应答处理结果，路由计划汇合的消息须暂缓回报，均不经流水线
+        if (pipeline is not None) and not is_joined(msg_in) and \
+                not ((role in ["TREATER"]) and is_mq(msg_in.origination)):
+            pipeline.feed(sequence, msg_in)
+            return
+        confession = Confession(lambda is_ok: confess(sequence, is_ok))
+        fanout.hold(confession)
+        try:
+            WORKS[role](msg_in, func)
+            is_ok = True
+        except Exception as e:
+            logging.exception("TEMPLE::{0} work error:{1}".format(role, e))
+            is_ok = False
+        fanout.hold(None)
+        confession.vote(is_ok)
+
+    pipeline = None if stats is None else Pipeline(role, func, confess, stats)
+    try:
+        while pipe_ctrl not in connection_wait([pipe_ctrl, pipe_in]):
+            work_once()
+        timeout = pipe_ctrl.recv()
+        deadline = time.time() + timeout / 1000
+        while pipe_in.poll(0) and (time.time() < deadline):
+            work_once()
+    except EOFError:
+        pass
+    if pipeline is not None:
+        pipeline.close()
+    pool.close(threading.get_ident())       # 本信徒复用的端点
+    if threading.current_thread() is threading.main_thread():
+        fanout.close()                      # 进程信徒独占路由线程池，线程信徒由 congregate 关闭
+    logging.debug("TEMPLE::{0} believer stopped".format(role))
+
+
+def congregate(target: callable, pipes_in: list, pipe_ctrl: Pipe, func: callable = None, stats: list = None):
     """
-    :param pipe_in: Pipe         # 消息管道 （MSG, ）
-    :param queue_ctrl: Queue     # 控制 ("is_active",):(bool,)
+    # 线程信徒：同一进程内每条消息管道一个信徒线程，收到关闭期限后转告各线程并等待退出
+    :param target: callable      # sender, receiver, treater
+    :param pipes_in: list        # 各信徒的消息管道 [Pipe, ]
+    :param pipe_ctrl: Pipe       # 控制管道 (关闭期限[毫秒],)
     :param func: callable        # 自定义处理过程
+    :param stats: list           # 各信徒的流水线分段统计 [RawArray 或 None, ]
     :return: None
     """
-    is_active = queue_ctrl.get()
-    while is_active:
-        # ----------------------------------------- Queue
-        if queue_ctrl.empty():
-            try:
-                msg_receiver = pipe_in.recv()
-                logging.info("TEMPLE::RECEIVER PIPE IN recv:{0}".format(msg_receiver))
-            except EOFError:
-                is_active = False
-                continue
-            origination = allocator(msg_receiver.origination)    # MessageQueue
-            treatment = allocator(msg_receiver.treatment)        # MessageQueue
-            encryption = allocator(msg_receiver.encryption)      # MessageQueue
-            destination = allocator(msg_receiver.destination)    # Data.write
-            # --------- origination -----------------------------------------
-            if isinstance(origination, MQ):
-                msg_origination = origination.pull()
-                logging.info("TEMPLE::RECEIVER::{0}::ORIG pull:{1}".format(msg_receiver.origination, msg_origination))
-            else:
-                msg_origination = origination.read(msg_receiver)
-                logging.info("TEMPLE::RECEIVER::{0}::ORIG read:{1}".format(msg_receiver.origination, msg_origination))
-            # --------- encryption ------------------------------------------
-            if encryption is None:
-                msg_encryption = msg_origination
-            else:
-                msg_encryption = encryption.request(msg_origination)
-                logging.debug("TEMPLE::RECEIVER::{0}::ENCRYPT request:{1}".format(msg_receiver.encryption,
-                                                                                  msg_encryption))
-            del msg_origination
-            # --------- treatment -------------------------------------------
-            if treatment is None:
-                msg_treatment = msg_encryption
-            else:
-                msg_treatment = treatment.request(msg_encryption)
-                logging.debug("TEMPLE::RECEIVER::{0}::TREAT request:{1}".format(msg_receiver.treatment,
-                                                                                msg_treatment))
-            del msg_encryption
-            # --------- function --------------------------------------------
-            if func is None:
-                msg_function = msg_treatment
-            else:
-                msg_function = func(msg_treatment)
-                logging.debug("TEMPLE::RECEIVER func:{0}".format(msg_function))
-            del msg_treatment
-            # --------- destination -----------------------------------------
-            if isinstance(destination, MQ):
-                destination.request(msg_function)
-                logging.info("TEMPLE::RECEIVER::{0}::DEST request:{1}".format(msg_receiver.destination,
-                                                                              msg_function))
-            else:
-                destination.write(msg_function)
-                logging.info("TEMPLE::RECEIVER::{0}::DEST write:{1}".format(msg_receiver.destination,
-                                                                            msg_function))
-        else:
-            is_active = queue_ctrl.get()
-    else:
-        while not queue_ctrl.empty():
-            queue_ctrl.get()
+    if stats is None:
+        stats = [None] * len(pipes_in)
+    pipes_ctrl = [Pipe() for pipe_in in pipes_in]
+    threads = [threading.Thread(target=target, args=(pipe_in, ctrl[1], func, stage_stats))
+               for pipe_in, ctrl, stage_stats in zip(pipes_in, pipes_ctrl, stats)]
+    for thread in threads:
+        thread.start()
+    timeout = pipe_ctrl.recv()
+    for ctrl in pipes_ctrl:
+        ctrl[0].send(timeout)
+    for thread in threads:
+        thread.join()
+    fanout.close()
+
+
+def sender(pipe_in: Pipe, pipe_ctrl: Pipe, func: callable = None, stats: RawArray = None):
+    """
+    :param pipe_in: Pipe         # 消息管道 (序号, MSG)
+    :param pipe_ctrl: Pipe       # 控制管道 (关闭期限[毫秒],)
+    :param func: callable        # 自定义处理过程
+    :param stats: RawArray       # 流水线分段统计，None 为逐条串行处理
+    :return: None
+    """
+    believe(pipe_in, pipe_ctrl, func, "SENDER", stats)
+
+
+def send_once(msg_sender: MSG, func: callable = None):
+    for msg_origination in originate("SENDER", msg_sender):
+        run_stages("SENDER", msg_sender, msg_origination, func)
+
+
+def receiver(pipe_in: Pipe, pipe_ctrl: Pipe, func: callable = None, stats: RawArray = None):
+    """
+    :param pipe_in: Pipe         # 消息管道 (序号, MSG)
+    :param pipe_ctrl: Pipe       # 控制管道 (关闭期限[毫秒],)
+    :param func: callable        # 自定义处理过程
+    :param stats: RawArray       # 流水线分段统计，None 为逐条串行处理
+    :return: None
+    """
+    believe(pipe_in, pipe_ctrl, func, "RECEIVER", stats)
+
 
+def receive_once(msg_receiver: MSG, func: callable = None):
+    for msg_origination in originate("RECEIVER", msg_receiver):
+        run_stages("RECEIVER", msg_receiver, msg_origination, func)
 
-def treater(pipe_in: Pipe, queue_ctrl: Queue, func: callable = None):
+
+def treater(pipe_in: Pipe, pipe_ctrl: Pipe, func: callable = None, stats: RawArray = None):
     """
-    :param pipe_in: Pipe         # 消息管道 （MSG, ）
-    :param queue_ctrl: Queue     # 控制 ("is_active",):(bool,)
+    :param pipe_in: Pipe         # 消息管道 (序号, MSG)
+    :param pipe_ctrl: Pipe       # 控制管道 (关闭期限[毫秒],)
     :param func: callable        # 自定义处理过程
+    :param stats: RawArray       # 流水线分段统计，None 为逐条串行处理
     :return: None
     """
-    def treat_msg(msg_orig):
-        # --------- encryption ------------------------------------------
-        if encryption is None:
-            msg_encryption = msg_orig
+    believe(pipe_in, pipe_ctrl, func, "TREATER", stats)
+
+
+def treat_once(msg_treater: MSG, func: callable = None):
+    origination = allocator(msg_treater.origination)    # MessageQueue or Data.read()
+    if isinstance(origination, MQ):
+        origination.reply(func=lambda msg_orig: run_stages("TREATER", msg_treater, msg_orig, func))
+    else:
+        for msg_origination in originate("TREATER", msg_treater):
+            run_stages("TREATER", msg_treater, msg_origination, func)
+
+
+WORKS = {"SENDER": send_once, "RECEIVER": receive_once, "TREATER": treat_once}     # 逐条串行处理
+
+
+def originate(role: str, msg_head: MSG):
+    """
+    # 来源：发送者 MQ 请求 / 文件分块读取 / 读取；接收者 MQ 拉入 / 读取；处理者读取
+    :param role: str             # 角色名
+    :param msg_head: MSG         # 指令消息
+    :return: iterable            # [MSG, ] 或 分块消息生成器
+    """
+    origination = allocator(msg_head.origination)
+    if isinstance(origination, MQ):
+        if role in ["RECEIVER"]:
+            msg_origination = origination.pull()
+            logging.info("TEMPLE::{0}::{1}::ORIG pull:{2}".format(role, msg_head.origination, msg_origination))
         else:
-            msg_encryption = encryption.request(msg_orig)
-            logging.debug("TEMPLE::TREATER::{0}::ENCRYPT request:{1}".format(msg_orig.encryption,
-                                                                             msg_encryption))
-        # --------- treatment -------------------------------------------
-        if treatment is None:
-            msg_treatment = msg_encryption
+            msg_origination = origination.request(msg_head)
+            logging.debug("TEMPLE::{0}::{1}::ORIG request:{2}".format(role, msg_head.origination, msg_origination))
+        return [msg_origination, ]
+    elif isinstance(origination, FILE) and (role in ["SENDER"]):
+        return origination.read_iter(msg_head)     # 大文件分块读取   chunked
+    else:
+        msg_origination = origination.read(msg_head)
+        logging.info("TEMPLE::{0}::{1}::ORIG read:{2}".format(role, msg_head.origination, msg_origination))
+        return [msg_origination, ]
+
+
+def encrypt(role: str, msg_head: MSG, msg: MSG, func: callable = None) -> MSG:
+    encryption = allocator(msg_head.encryption)         # MessageQueue
+    if encryption is None:
+        return msg
+    msg_encryption = encryption.request(msg)
+    logging.debug("TEMPLE::{0}::{1}::ENCRYPT request:{2}".format(role, msg_head.encryption, msg_encryption))
+    return msg_encryption
+
+
+def treat(role: str, msg_head: MSG, msg: MSG, func: callable = None) -> MSG:
+    treatment = allocator(msg_head.treatment)           # MessageQueue
+    if treatment is None:
+        return msg
+    msg_treatment = treatment.request(msg)
+    logging.debug("TEMPLE::{0}::{1}::TREAT request:{2}".format(role, msg_head.treatment, msg_treatment))
+    return msg_treatment
+
+
+def apply_func(role: str, msg_head: MSG, msg: MSG, func: callable = None) -> MSG:
+    if func is None:
+        return msg
+    msg_function = func(msg)
+    logging.debug("TEMPLE::{0} func:{1}".format(role, msg_function))
+    return msg_function
+
+
+def destine(role: str, msg_head: MSG, msg: MSG, func: callable = None) -> MSG:
+    if msg_head.route is not None:
+        return run_route(role, msg_head, msg)           # 路由计划取代单一目的端
+    destination = allocator(msg_head.destination)       # MessageQueue or Data.write()
+    if destination is None:
+        logging.info("TEMPLE::{0}::NONE::DEST return:{1}".format(role, msg))
+    elif isinstance(destination, MQ):
+        if role in ["SENDER"]:
+            destination.push(msg)
+            logging.info("TEMPLE::{0}::{1}::DEST push:{2}".format(role, msg_head.destination, msg))
         else:
-            msg_treatment = treatment.request(msg_encryption)
-            logging.debug("TEMPLE::TREATER::{0}::TREAT request:{1}".format(msg_orig.treatment,
-                                                                           msg_treatment))
-        del msg_encryption
-        # --------- function --------------------------------------------
-        if func is None:
-            msg_func = msg_treatment
+            destination.request(msg)
+            logging.info("TEMPLE::{0}::{1}::DEST request:{2}".format(role, msg_head.destination, msg))
+    else:
+        destination.write(msg)
+        logging.info("TEMPLE::{0}::{1}::DEST write:{2}".format(role, msg_head.destination, msg))
+    return msg
+
+
+STAGES = [("encryption", encrypt), ("treatment", treat), ("function", apply_func), ("destination", destine)]
+
+
+def run_stages(role: str, msg_head: MSG, msg: MSG, func: callable = None) -> MSG:
+    # 逐段串行：加密 --> 处理 --> 自定义处理 --> 目的端
+    for name, stage in STAGES:
+        msg = stage(role, msg_head, msg, func)
+    return msg
+
+
+def is_joined(msg_head: MSG) -> bool:
+    # 路由计划汇合多条消息
+    route = msg_head.route
+    return (route is not None) and (route.join is not None) and (route.join > 1)
+
+
+class Confession:
+    def __init__(self, confess: callable):
+        """
+        # 消息回报：信徒处理完毕投一票，其中每个暂缓的汇合完成时各投一票，全部投出后回报是否全部成功
+        # 首次暂缓时先回报 None，司祭暂缓确认并释放该信徒的名额
+        :param confess: callable     # confess(是否成功)，None 为暂缓
+        """
+        self.confess = confess
+        self.votes = 1                      # 未投出的票数
+        self.is_ok = True
+        self.deferred = False
+        self.lock = threading.Lock()
+
+    def defer(self):
+        with self.lock:
+            self.votes += 1
+            deferred, self.deferred = self.deferred, True
+        if not deferred:
+            self.confess(None)
+
+    def vote(self, is_ok: bool):
+        with self.lock:
+            self.votes -= 1
+            self.is_ok = self.is_ok and is_ok
+            if self.votes > 0:
+                return
+        self.confess(self.is_ok)
+
+
+class Fanout:
+    def __init__(self, workers: int = None):
+        """
+        # 路由扇出：同一消息的各分支在线程池并行执行，进程内首次使用时新建；同一 case、同一批次的消息在此汇合
+        :param workers: int          # 线程数，默认 CONFIG.TEMPLE_ROUTE_WORKERS
+        """
+        if workers is None:
+            self.workers = CONFIG.TEMPLE_ROUTE_WORKERS
         else:
-            msg_func = func(msg_treatment)
-            logging.debug("TEMPLE::TREATER func:{0}".format(msg_func))
-        del msg_treatment
-        # --------- destination -----------------------------------------
-        if destination is None:
-            logging.info("TEMPLE::TREATER::NONE::DEST return:{0}".format(msg_func))
+            self.workers = workers
+        self.executor = None
+        self.threads = []                   # 线程标识，关闭时释放各线程复用的端点
+        self.joins = {}                     # 汇合中的消息 {汇合键: [首条到达时间, {成员: [MSG, [Confession, ]]}]}
+        self.joined = OrderedDict()         # 已完成的汇合 {汇合键: 完成时间}，其后重复投递的消息跳过
+        self.local = threading.local()      # 各信徒线程正在处理的消息 [Confession, 序数]
+        self.lock = threading.Lock()
+        self.pid = None                     # 子进程继承的线程池不可用
+
+    def _initial(self):
+        self.threads.append(threading.get_ident())
+
+    def submit(self, func: callable, *args) -> Future:
+        with self.lock:
+            if (self.executor is None) or (self.pid != os.getpid()):
+                self.pid = os.getpid()
+                self.threads = []
+                self.joins = {}
+                self.joined = OrderedDict()
+                self.executor = ThreadPoolExecutor(self.workers, initializer=self._initial)
+            executor = self.executor
+        return executor.submit(func, *args)
+
+    def hold(self, confession: (Confession, None)):
+        """
+        # 信徒登记正在处理的消息的回报，处理完毕后登记 None；汇合未到齐时暂缓该回报
+        :param confession: Confession  # 未登记时（AsyncTEMPLE 等不确认消息）汇合不暂缓回报、不去重
+        """
+        self.local.held = None if confession is None else [confession, 0]
+
+    def join(self, msg_head: MSG, msg: MSG, count: int) -> (tuple, None):
+        """
+        # 汇合：同一 case、同一批次的消息到齐后合并；同一条消息（消息头相同）重复投递只计一次
+        # 超过 CONFIG.TEMPLE_JOIN_TIMEOUT 仍未到齐的丢弃，其回报为失败（否认后重发）
+        :param msg_head: MSG         # 指令消息，route.batch 为批次标识
+        :param msg: MSG              # 数据消息
+        :param count: int            # 汇合的消息数
+        :return: (tuple, None)       # (合并后的消息, 暂缓的回报 [Confession, ])，已完成批次的重复投递为 (None, [])，
+                                     # 未到齐为 None
+        """
+        key = "{0}#{1}".format(msg_head.case, msg_head.route.batch)
+        held = getattr(self.local, "held", None)
+        if held is None:
+            confession, member = None, str(id(msg))
         else:
-            if isinstance(destination, MQ):
-                destination.request(msg_func)
-                logging.info("TEMPLE::TREATER::{0}::DEST request:{1}".format(msg_orig.destination, msg_func))
+            # 消息以消息头（时间戳除外）标识，同一指令来源的多条数据消息以序数区分
+            confession, member = held[0], "{0}#{1}#{2}#{3}#{4}#{5}".format(
+                msg_head.origination, msg_head.encryption, msg_head.treatment, msg_head.destination,
+                msg_head.activity, held[1])
+            held[1] += 1
+        now = time.time()
+        expired = []
+        with self.lock:
+            for key_expired in [k for k, entry in self.joins.items() if now - entry[0] >= CONFIG.TEMPLE_JOIN_TIMEOUT]:
+                members = self.joins.pop(key_expired)[1]
+                logging.warning("TEMPLE::ROUTE::JOIN {0} timeout, drop:{1}".format(key_expired, len(members)))
+                expired += [c for m in members.values() for c in m[1]]
+            while (len(self.joined) > 0) and (now - next(iter(self.joined.values())) >= CONFIG.TEMPLE_JOIN_TIMEOUT):
+                self.joined.popitem(last=False)
+            if key in self.joined.keys():
+                logging.info("TEMPLE::ROUTE::JOIN {0} done, skip redelivered".format(key))
+                joined = (None, [])
             else:
-                destination.write(msg_func)
-                logging.info("TEMPLE::TREATER::{0}::DEST write:{1}".format(msg_orig.destination, msg_func))
-        return msg_func
+                entry = self.joins.setdefault(key, [now, OrderedDict()])
+                if member in entry[1].keys():
+                    logging.info("TEMPLE::ROUTE::JOIN {0} redelivered:{1}".format(key, member))
+                member_msg = entry[1].setdefault(member, [msg, []])
+                if len(entry[1]) < count:
+                    if confession is not None:
+                        confession.defer()
+                        member_msg[1].append(confession)
+                    joined = None
+                else:
+                    members = self.joins.pop(key)[1]
+                    self.joined[key] = now
+                    joined = (merge_msgs([m[0] for m in members.values()]), [c for m in members.values() for c in m[1]])
+        for confession_expired in expired:
+            confession_expired.vote(False)
+        return joined
+
+    def close(self):
+        # 等待进行中的分支完成，释放路由线程复用的端点；未到齐的汇合回报失败
+        with self.lock:
+            executor, threads, joins = self.executor, self.threads, self.joins
+            self.executor, self.threads, self.joins = None, [], {}
+        if (executor is not None) and (self.pid == os.getpid()):
+            executor.shutdown(wait=True)
+            for thread in threads:
+                pool.close(thread)
+        for key, entry in joins.items():
+            logging.warning("TEMPLE::ROUTE::JOIN {0} closed, drop:{1}".format(key, len(entry[1])))
+            for member_msg in entry[1].values():
+                for confession in member_msg[1]:
+                    confession.vote(False)
+
+
+fanout = Fanout()       # 进程级路由线程池
+
+
+def merge_msgs(msgs: list) -> MSG:
+    # 汇合：以第一条的消息头为准，依次追加各消息的数据与参数
+    msg = msgs[0].copy()
+    for msg_other in msgs[1:]:
+        msg.merge(msg_other)
+    return msg
+
+
+def run_route(role: str, msg_head: MSG, msg: MSG) -> MSG:
+    """
+    # 路由计划：一次读取，各分支并行写入；步骤在全部前驱完成后开始，以前驱输出的合并为输入
+    # 某步骤失败时其后继不执行，其余分支照常完成，之后抛出该异常（整条消息视为失败）
+    # 汇合：同一批次的消息须发往同一 TEMPLE，到齐后以合并的消息执行一次，各条消息随其结果回报
+    :param role: str             # 角色名
+    :param msg_head: MSG         # 指令消息，route 为路由计划
+    :param msg: MSG              # 数据消息
+    :return: MSG                 # 最后完成的步骤的输出；汇合未到齐时为原消息
+    """
+    route = msg_head.route
+    confessions = []
+    if is_joined(msg_head):
+        if route.batch is None:
+            raise ValueError("Route join without batch, use ROUTE.set_join.")
+        joined = fanout.join(msg_head, msg, route.join)
+        if joined is None:
+            logging.info("TEMPLE::{0}::ROUTE::JOIN case:{1} batch:{2} waiting".format(role, msg_head.case,
+                                                                                     route.batch))
+            return msg
+        if joined[0] is None:
+            return msg
+        msg, confessions = joined
+    try:
+        msg_out = run_plan(role, msg_head, msg)
+    except Exception:
+        for confession in confessions:
+            confession.vote(False)
+        raise
+    for confession in confessions:
+        confession.vote(True)
+    return msg_out
+
 
-    is_active = queue_ctrl.get()
-    while is_active:
-        if queue_ctrl.empty():
+def run_plan(role: str, msg_head: MSG, msg: MSG) -> MSG:
+    # 按路由计划执行：无前驱的步骤同时开始，每完成一步即开始其已就绪的后继
+    route = msg_head.route
+    outputs = {}
+    futures = {}
+    errors = []
+    msg_out = msg
+
+    def start(name: str):
+        after = route.steps[name]["after"]
+        msg_in = msg.copy() if len(after) == 0 else merge_msgs([outputs[parent] for parent in after])
+        futures[fanout.submit(run_step, role, msg_head, name, route.steps[name], msg_in)] = name
+
+    for root in route.roots():
+        start(root)
+    while len(futures) > 0:
+        done, pending = futures_wait(list(futures.keys()), return_when=FIRST_COMPLETED)
+        for future in done:
+            name = futures.pop(future)
             try:
-                msg_treater = pipe_in.recv()
-                logging.info("TEMPLE::TREATER PIPE IN recv:{0}".format(msg_treater))
-            except EOFError:
-                is_active = False
+                outputs[name] = msg_out = future.result()
+            except Exception as e:
+                logging.warning("TEMPLE::{0}::ROUTE::{1} error:{2}".format(role, name, e))
+                errors.append(e)
                 continue
-            origination = allocator(msg_treater.origination)    # Data.read()
-            treatment = allocator(msg_treater.treatment)        # MessageQueue
-            encryption = allocator(msg_treater.encryption)      # MessageQueue
-            destination = allocator(msg_treater.destination)    # Data.write()
-            # --------- origination -----------------------------------------
-            if isinstance(origination, MQ):
-                origination.reply(func=treat_msg)
-            else:
-                msg_origination = origination.read(msg_treater)
-                logging.info("TEMPLE::TREATER::{0}::ORIG read:{1}".format(msg_treater.origination, msg_origination))
-                treat_msg(msg_origination)
+            for child in route.children(name):
+                if all([parent in outputs.keys() for parent in route.steps[child]["after"]]):
+                    start(child)
+    if len(errors) > 0:
+        raise errors[0]
+    return msg_out
+
+
+def run_step(role: str, msg_head: MSG, name: str, step: dict, msg: MSG) -> MSG:
+    # 路由步骤：以步骤端点为该段的单一端点，复用逐段处理
+    msg_step = msg_head.copy_head()
+    msg_step.route = None
+    msg_step.encryption = None
+    msg_step.treatment = None
+    msg_step.destination = None
+    setattr(msg_step, step["stage"], step["url"])
+    logging.debug("TEMPLE::{0}::ROUTE::{1} {2}:{3}".format(role, name, step["stage"], step["url"]))
+    return dict(STAGES)[step["stage"]](role, msg_step, msg)
+
+
+ASYNC_SCHEMES = ["tcp"]     # 协程端点（AsyncMQ），其余端点阻塞（SQL, FTP, TOMAIL, FILE），经执行器调用
+
+
+class AsyncTEMPLE:
+    def __init__(self, conn: (URL, str), executor: object = None):
+        """
+        # 协程 TEMPLE：司祭拉入循环、信徒各段、MQ 端点均为同一事件循环上的协程，阻塞端点经执行器调用
+        # 单个进程（单个事件循环）可承载多个 TEMPLE 节点；消息不确认（同 AsyncMQ），关闭时已拉入的消息在期限内处理完成
+        :param conn: (URL, str)      # "tcp://*:<port>"
+        :param executor: object      # 阻塞端点执行器 concurrent.futures.Executor，None 为事件循环默认线程池
+        """
+        if isinstance(conn, str):
+            self.me = URL(conn)
         else:
-            is_active = queue_ctrl.get()
-    else:
-        while not queue_ctrl.empty():
-            queue_ctrl.get()
+            self.me = conn
+        self.executor = executor
+        self.role = None                    # 角色名 ["SENDER", "RECEIVER", "TREATER"]
+        self.func = None                    # 自定义处理过程，普通函数或协程函数
+        self.active = False
+        self.priest = None                  # 司祭协程任务
+        self.tasks = set()                  # 处理中的信徒协程任务
+        self.chains = {}                    # 按 case 有序时各 case 最后一条消息的任务 {case: Task}
+        self.sockets = {}                   # 本节点复用的协程端点 {URL 字符串: AsyncMQ}
+        self.locks = {}                     # 非 ROUTER 模式请求/应答须逐条进行 {URL 字符串: asyncio.Lock}
+        self.stage_stats = [[0, 0.0, 0] for stage in PIPELINE_STAGES]   # 各段 [处理数, 累计耗时(秒), 处理中]
+
+    def open(self, role: str, func: callable = None, workers: int = None, ordered: bool = None):
+        """
+        # 须在事件循环内调用
+        :param role: str             # ["sender", "treater", "encrypter", "receiver"]，默认 treater
+        :param func: callable        # 自定义处理过程，普通函数或协程函数  func(MSG) -> MSG
+        :param workers: int          # 同时处理的消息数，默认 CONFIG.TEMPLE_ASYNC_WORKERS
+        :param ordered: bool         # 同一 case 的消息按到达顺序处理，默认 CONFIG.TEMPLE_ORDERED
+        """
+        if workers is None:
+            workers = CONFIG.TEMPLE_ASYNC_WORKERS
+        if ordered is None:
+            ordered = CONFIG.TEMPLE_ORDERED
+        if role in ["sender"]:
+            self.role = "SENDER"
+        elif role in ["receiver"]:
+            self.role = "RECEIVER"
+        else:       # default is treater: ["treater", "encrypter"]
+            self.role = "TREATER"
+        self.func = func
+        self.active = True
+        self.priest = asyncio.get_running_loop().create_task(self._priest(workers, ordered))
+
+    async def stop(self, timeout: int = None):
+        """
+        # 停止拉入，等待已拉入的消息处理完成，超过期限才取消
+        :param timeout: int          # 关闭期限（毫秒），默认 CONFIG.MQ_LINGER
+        """
+        if timeout is None:
+            timeout = CONFIG.MQ_LINGER
+        deadline = time.time() + timeout / 1000
+        self.active = False
+        if self.priest is not None:
+            await self.priest
+            self.priest = None
+        if len(self.tasks) > 0:
+            done, pending = await asyncio.wait(list(self.tasks), timeout=max(0, deadline - time.time()))
+            for task in pending:
+                task.cancel()
+            if len(pending) > 0:
+                logging.warning("TEMPLE::ASYNC::{0} cancel:{1}".format(self.me, len(pending)))
+                await asyncio.gather(*pending, return_exceptions=True)
+        for mq in self.sockets.values():
+            mq.release()
+        self.sockets = {}
+        self.locks = {}
+        logging.debug("TEMPLE::ASYNC::{0} stopped".format(self.me))
+
+    close = stop
+
+    def stats(self) -> dict:
+        """
+        :return: dict   # 各段合计 {段名: {"count": 处理数, "avg_ms": 平均耗时, "depth": 处理中}}
+        """
+        rt = {}
+        for stage, (count, cost, depth) in zip(PIPELINE_STAGES, self.stage_stats):
+            rt[stage] = {"count": count, "avg_ms": round(cost / count * 1000, 3) if count else 0, "depth": depth}
+        return rt
+
+    async def _priest(self, workers: int, ordered: bool):
+        # 司祭：至多 workers 条在处理中，定期检查停止信号
+        mq = AsyncMQ(self.me)
+        mq.start("PULL")
+        semaphore = asyncio.Semaphore(workers)
+        while self.active:
+            await semaphore.acquire()
+            msgs_in = await mq.pull_many(1, CONFIG.MQ_POLL_TIME)
+            if len(msgs_in) == 0:
+                semaphore.release()
+                continue
+            logging.info("TEMPLE::ASYNC::{0} pull:{1}".format(self.me, msgs_in[0]))
+            self._dispatch(msgs_in[0], semaphore, ordered)
+        if len(mq.buffer) > 0:
+            logging.warning("TEMPLE::ASYNC::{0} drop buffered:{1}".format(self.me, len(mq.buffer)))
+        mq.release()
+        logging.debug("TEMPLE::ASYNC::{0} priest stopped".format(self.me))
+
+    def _dispatch(self, msg_in: MSG, semaphore: asyncio.Semaphore, ordered: bool):
+        key = str(msg_in.case) if ordered else None
+        previous = self.chains.get(key, None)
+        task = asyncio.ensure_future(self._believe(msg_in, previous, semaphore))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        if key is not None:
+            self.chains[key] = task
+            task.add_done_callback(lambda done: self.chains.pop(key) if self.chains.get(key) is done else None)
+
+    async def _believe(self, msg_in: MSG, previous: asyncio.Task, semaphore: asyncio.Semaphore):
+        # 信徒：同一 case 的上一条处理完成（无论成败）后才开始
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await self._work(msg_in)
+        except Exception as e:
+            logging.exception("TEMPLE::ASYNC::{0} work error:{1}".format(self.role, e))
+        finally:
+            semaphore.release()
+
+    async def _work(self, msg_head: MSG):
+        # 来源：MQ 为协程，其余经执行器读取（文件分块逐块读取）
+        conn = msg_head.origination
+        if (conn is not None) and (conn.scheme in ASYNC_SCHEMES):
+            if self.role in ["TREATER"]:
+                # 处理者以 MQ 为来源时须同步应答处理结果
+                await self._mq_call(conn, "REPLY", lambda msg_orig: self._run_stages(msg_head, msg_orig))
+                return
+            start = time.time()
+            if self.role in ["RECEIVER"]:
+                msg_origination = await self._mq_call(conn, "PULL")
+            else:
+                msg_origination = await self._mq_call(conn, "REQUEST", msg_head)
+            self._record(0, time.time() - start)
+            logging.info("TEMPLE::ASYNC::{0}::{1}::ORIG:{2}".format(self.role, conn, msg_origination))
+            await self._run_stages(msg_head, msg_origination)
+            return
+        start = time.time()
+        messages = iter(await self._blocking(originate, self.role, msg_head))
+        while True:
+            msg_origination = await self._blocking(next, messages, None)
+            if msg_origination is None:
+                break
+            self._record(0, time.time() - start)
+            await self._run_stages(msg_head, msg_origination)
+            start = time.time()
+
+    async def _run_stages(self, msg_head: MSG, msg: MSG) -> MSG:
+        # 逐段：加密 --> 处理 --> 自定义处理 --> 目的端；MQ 端点为协程，其余端点经执行器
+        for i, (name, stage) in enumerate(STAGES):
+            conn = None if name in ["function"] else getattr(msg_head, name)
+            start = time.time()
+            self.stage_stats[i + 1][2] += 1
+            try:
+                if (conn is not None) and (conn.scheme in ASYNC_SCHEMES):
+                    if (name in ["destination"]) and (self.role in ["SENDER"]):
+                        await self._mq_call(conn, "PUSH", msg)
+                    else:
+                        msg_out = await self._mq_call(conn, "REQUEST", msg)
+                        msg = msg if name in ["destination"] else msg_out
+                    logging.info("TEMPLE::ASYNC::{0}::{1}::{2}:{3}".format(self.role, conn, name.upper(), msg))
+                elif (name in ["destination"]) and (msg_head.route is not None):
+                    msg = await self._blocking(stage, self.role, msg_head, msg, self.func)
+                elif (name in ["function"]) and asyncio.iscoroutinefunction(self.func):
+                    msg = await self.func(msg)
+                elif conn is None:
+                    msg = stage(self.role, msg_head, msg, self.func)
+                else:
+                    msg = await self._blocking(stage, self.role, msg_head, msg, self.func)
+            finally:
+                self.stage_stats[i + 1][2] -= 1
+            self._record(i + 1, time.time() - start)
+        return msg
+
+    def _record(self, i: int, cost: float):
+        self.stage_stats[i][0] += 1
+        self.stage_stats[i][1] += cost
+
+    async def _blocking(self, func: callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _mq_call(self, conn: URL, me: str, arg: object = None):
+        """
+        # 本节点复用的协程端点，非 ROUTER 模式的请求/应答按端点逐条进行
+        :param conn: URL             # 端点
+        :param me: str               # ["REQUEST", "REPLY", "PUSH", "PULL"]
+        :param arg: object           # REQUEST/PUSH 为 MSG，REPLY 为处理函数
+        :return: MSG
+        """
+        key = conn.to_string()
+        if key not in self.sockets.keys():
+            self.sockets[key] = AsyncMQ(conn)
+            self.locks[key] = asyncio.Lock()
+        mq = self.sockets[key]
+        if me in ["PUSH"]:
+            return await mq.push(arg)
+        if me in ["PULL"]:
+            return await mq.pull()
+        if mq.router:
+            if me in ["REPLY"]:
+                return await mq.reply(arg, times=1)
+            return await mq.request(arg)
+        async with self.locks[key]:
+            if me in ["REPLY"]:
+                return await mq.reply(arg, times=1)
+            return await mq.request(arg)
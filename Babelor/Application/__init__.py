@@ -14,4 +14,5 @@
 # limitations under the License.
 
 # Inner Required
-from Babelor.Application.Temple import TEMPLE
+from Babelor.Application.Temple import TEMPLE, AsyncTEMPLE
+from Babelor.Application.Pool import POOL
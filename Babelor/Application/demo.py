@@ -14,15 +14,20 @@
 # limitations under the License.
 
 # System Required
+import os
+import shutil
 import logging
 import sched
 import time
+import tempfile
+import threading
+import asyncio
 from multiprocessing import Process
 # Outer Required
 # Inner Required
-from Babelor.Application import TEMPLE
-from Babelor.Presentation import MSG, URL, CASE
-from Babelor.Session import MQ
+from Babelor.Application import TEMPLE, AsyncTEMPLE
+from Babelor.Presentation import MSG, URL, CASE, ROUTE
+from Babelor.Session import MQ, AsyncMQ
 # Global Parameters
 # logging.basicConfig(level=logging.INFO,
 #                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -136,6 +141,249 @@ def main():
     temple["sender_init"].start()
 
 
+def demo_pool(times: int = 10000):
+    from Babelor.Application.Temple import allocator, connector
+    from Babelor.Application.Pool import pool
+    urls = [origination_url, destination_url, treater_url["outer"], encrypter_url["outer"]]
+    for name, func in [("connector", connector), ("allocator", allocator)]:
+        start = time.time()
+        for i in range(0, times, 1):
+            for url in urls:
+                func(url)
+        cost = time.time() - start
+        logging.warning("DEMO::POOL::{0} allocations:{1} cost:{2:.3f}s".format(name, times * len(urls), cost))
+    logging.warning("DEMO::POOL stats:{0}".format(pool.stats()))
+    pool.invalidate(origination_url)
+    pool.close()
+    logging.warning("DEMO::POOL closed stats:{0}".format(pool.stats()))
+
+
+def func_slow(msg: MSG):
+    # 模拟慢速目的端写入（SQL、FTP、SMTP），记录完成顺序
+    time.sleep(0.01)
+    with open(msg.destination.path, "a") as file:
+        file.write("{0} {1}\n".format(msg.case.destination.port, msg.activity))
+    return msg
+
+
+def try_workers(port: int, count: int, workers: int, ordered: bool = False, thread: bool = False) -> float:
+    record = tempfile.NamedTemporaryFile(prefix="babelor.workers.", delete=False)
+    record.close()
+    temple = TEMPLE("tcp://*:{0}".format(port))
+    temple.open(role="treater", func=func_slow, workers=workers, ordered=ordered, thread=thread)
+    mq = MQ("tcp://127.0.0.1:{0}".format(port))
+    cases = [CASE("tcp://127.0.0.1:10001#tcp://127.0.0.1:{0}".format(20100 + i)) for i in range(0, 8, 1)]
+    start = time.time()
+    for i in range(0, count, 1):
+        msg = MSG()
+        msg.case = cases[i % len(cases)]
+        msg.origination = URL("file://{0}/".format(tempfile.gettempdir()))
+        msg.destination = URL("file://{0}".format(record.name))
+        msg.activity = str(i)
+        mq.push(msg)
+    while True:
+        with open(record.name) as file:
+            lines = file.read().splitlines()
+        if len(lines) >= count:
+            break
+        time.sleep(0.01)
+    cost = time.time() - start
+    mq.release()
+    temple.stop()
+    os.remove(record.name)
+    if ordered:
+        seen = {}
+        for line in lines:
+            case, activity = line.split(" ")
+            if int(activity) < seen.get(case, -1):
+                logging.warning("DEMO::WORKERS out of order case:{0} activity:{1}".format(case, activity))
+            seen[case] = int(activity)
+    return cost
+
+
+def demo_workers(count: int = 400):
+    # 慢速目的端下信徒数与吞吐
+    logging.getLogger().setLevel(logging.WARNING)
+    port = 20101
+    for thread in [False, True]:
+        for workers in [1, 2, 4, 8]:
+            cost = try_workers(port, count, workers, thread=thread)
+            port += 1
+            logging.warning("DEMO::WORKERS::{0} workers:{1} count:{2} cost:{3:.3f}s msgs/s:{4:.0f}".format(
+                "THREAD" if thread else "PROCESS", workers, count, cost, count / cost))
+    cost = try_workers(port, count, 4, ordered=True)
+    logging.warning("DEMO::WORKERS::ORDERED workers:4 count:{0} cost:{1:.3f}s msgs/s:{2:.0f}".format(
+        count, cost, count / cost))
+
+
+def try_slow_reply(url: str, count: int):
+    # 模拟慢速来源（SQL 查询、FTP 下载）
+    def reply_func(msg: MSG):
+        time.sleep(0.01)
+        return msg
+    mq = MQ(url, direct=True)
+    for i in range(0, count, 1):
+        mq.reply(reply_func)
+    mq.release()
+
+
+def demo_pipeline(count: int = 200):
+    # 慢速来源 + 慢速目的端，逐条串行与分段流水线
+    logging.getLogger().setLevel(logging.WARNING)
+    for i, pipelined in enumerate([False, True]):
+        record = tempfile.NamedTemporaryFile(prefix="babelor.pipeline.", delete=False)
+        record.close()
+        origination = threading.Thread(target=try_slow_reply, args=("tcp://*:{0}".format(20121 + i), count))
+        origination.start()
+        temple = TEMPLE("tcp://*:{0}".format(20131 + i))
+        temple.open(role="sender", func=func_slow, pipelined=pipelined)
+        mq = MQ("tcp://127.0.0.1:{0}".format(20131 + i))
+        case = CASE("tcp://127.0.0.1:10001#tcp://127.0.0.1:20100")
+        start = time.time()
+        for j in range(0, count, 1):
+            msg = MSG()
+            msg.case = case
+            msg.origination = URL("tcp://127.0.0.1:{0}".format(20121 + i))
+            msg.destination = URL("file://{0}".format(record.name))
+            msg.activity = str(j)
+            mq.push(msg)
+        while True:
+            with open(record.name) as file:
+                if len(file.read().splitlines()) >= count:
+                    break
+            time.sleep(0.01)
+        cost = time.time() - start
+        logging.warning("DEMO::PIPELINE::{0} count:{1} cost:{2:.3f}s msgs/s:{3:.0f} stages:{4}".format(
+            "ON" if pipelined else "OFF", count, cost, count / cost, temple.stats()))
+        mq.release()
+        temple.stop()
+        origination.join()
+        os.remove(record.name)
+
+
+async def try_async(endpoints: int, count: int) -> float:
+    done = []
+
+    async def func_async_slow(msg: MSG):
+        # 模拟慢速目的端写入，以协程等待
+        await asyncio.sleep(0.01)
+        done.append(msg.activity)
+        return msg
+
+    temples = [AsyncTEMPLE("tcp://*:{0}".format(20141 + i)) for i in range(0, endpoints, 1)]
+    for temple in temples:
+        temple.open(role="treater", func=func_async_slow)
+    pushers = [AsyncMQ("tcp://127.0.0.1:{0}".format(20141 + i)) for i in range(0, endpoints, 1)]
+    case = CASE("tcp://127.0.0.1:10001#tcp://127.0.0.1:20100")
+    start = time.time()
+    for i in range(0, count, 1):
+        msg = MSG()
+        msg.case = case
+        msg.origination = URL("file://{0}/".format(tempfile.gettempdir()))     # 阻塞来源，经执行器读取
+        msg.activity = str(i)
+        await pushers[i % endpoints].push(msg)
+    while len(done) < count:
+        await asyncio.sleep(0.01)
+    cost = time.time() - start
+    logging.warning("DEMO::ASYNC threads:{0} stages:{1}".format(threading.active_count(), temples[0].stats()))
+    for pusher in pushers:
+        pusher.release()
+    for temple in temples:
+        await temple.stop()
+    return cost
+
+
+def demo_async(endpoints: int = 16, count: int = 800):
+    # 单个进程（单个事件循环）承载多个 TEMPLE 节点
+    logging.getLogger().setLevel(logging.WARNING)
+    cost = asyncio.run(try_async(endpoints, count))
+    logging.warning("DEMO::ASYNC endpoints:{0} count:{1} cost:{2:.3f}s msgs/s:{3:.0f}".format(
+        endpoints, count, cost, count / cost))
+
+
+def try_slow_source(url: str, count: int):
+    # 模拟慢速来源，每条读取一个文件
+    def reply_func(msg: MSG):
+        time.sleep(0.01)
+        msg.add_datum(b"babelor", "{0}.txt".format(msg.activity))
+        return msg
+    mq = MQ(url, direct=True)
+    for i in range(0, count, 1):
+        mq.reply(reply_func)
+    mq.release()
+
+
+def demo_route(count: int = 100, branches: int = 3):
+    # 一份数据送往多个目的端（各经慢速处理）：逐个目的端各发送一次，与一次读取按路由计划并行写入
+    logging.getLogger().setLevel(logging.WARNING)
+    source_url = URL("tcp://127.0.0.1:20271")
+    treatment_urls = [URL("tcp://127.0.0.1:{0}".format(20272 + i)) for i in range(0, branches, 1)]
+    threads = [threading.Thread(target=try_slow_source, args=("tcp://*:20271", count * (branches + 1) * 2))]
+    threads += [threading.Thread(target=try_slow_reply, args=("tcp://*:{0}".format(20272 + i), count * 2))
+                for i in range(0, branches, 1)]
+    for thread in threads:
+        thread.start()
+    temple = TEMPLE("tcp://*:20279")
+    temple.open(role="sender")
+    mq = MQ("tcp://127.0.0.1:20279")
+    case = CASE("tcp://127.0.0.1:10001#tcp://127.0.0.1:20100")
+    for routed in [False, True]:
+        directories = [tempfile.mkdtemp(prefix="babelor_route_") for i in range(0, branches, 1)]
+        route = ROUTE()
+        for i in range(0, branches, 1):
+            route.add("treat{0}".format(i), "treatment", treatment_urls[i])
+            route.add("dest{0}".format(i), "destination", "file://{0}/".format(directories[i]),
+                      after=["treat{0}".format(i)])
+        start = time.time()
+        for j in range(0, count, 1):
+            for i in range(0, 1 if routed else branches, 1):
+                msg = MSG()
+                msg.case = case
+                msg.origination = source_url
+                msg.activity = str(j)
+                if routed:
+                    msg.route = route
+                else:
+                    msg.treatment = treatment_urls[i]
+                    msg.destination = URL("file://{0}/".format(directories[i]))
+                mq.push(msg)
+        while sum([len(os.listdir(directory)) for directory in directories]) < count * branches:
+            time.sleep(0.01)
+        cost = time.time() - start
+        logging.warning("DEMO::ROUTE::{0} count:{1} branches:{2} cost:{3:.3f}s msgs/s:{4:.0f}".format(
+            "ON" if routed else "OFF", count, branches, cost, count / cost))
+        for directory in directories:
+            shutil.rmtree(directory)
+    mq.release()
+    temple.stop()
+    # 汇合：每批 branches 条消息（其一重复投递）由多个进程信徒接收，到齐后合并写入一次
+    temple = TEMPLE("tcp://*:20432")
+    temple.open(role="sender", workers=2, ordered=False, thread=False)
+    mq = MQ("tcp://127.0.0.1:20432")
+    directory = tempfile.mkdtemp(prefix="babelor_route_")
+    start = time.time()
+    for j in range(0, count, 1):
+        route = ROUTE().set_join(branches)
+        route.add("dest", "destination", "file://{0}/".format(directory))
+        for i in [0, 0] + list(range(1, branches, 1)):
+            msg = MSG()
+            msg.case = case
+            msg.origination = source_url
+            msg.activity = "{0}-{1}".format(j, i)
+            msg.route = route
+            mq.push(msg)
+    while len(os.listdir(directory)) < count * branches:
+        time.sleep(0.01)
+    cost = time.time() - start
+    logging.warning("DEMO::ROUTE::JOIN count:{0} branches:{1} files:{2} cost:{3:.3f}s msgs/s:{4:.0f}".format(
+        count, branches, len(os.listdir(directory)), cost, count / cost))
+    shutil.rmtree(directory)
+    mq.release()
+    temple.stop()
+    for thread in threads:
+        thread.join()
+
+
 sender_url = {
     "inner": URL("tcp://*:20001"),
     "outer": URL("tcp://127.0.0.1:20001"),
@@ -162,4 +410,9 @@ destination_url = URL("file:///C:/Users/geyua/PycharmProjects/Babelor/data/dir2/
 
 if __name__ == '__main__':
     main()
+    # demo_pool()
+    # demo_workers()
+    # demo_pipeline()
+    # demo_async()
+    # demo_route()
 
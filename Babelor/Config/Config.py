@@ -25,10 +25,33 @@ class CONFIG:
     Coding = 'utf-8'                                   # 字符串编码
     Default_LANG = "SIMPLIFIED CHINESE_CHINA.UTF8"     # 默认语言
     MSG_TPE = "json"                                   # 消息包封装 ["json", "xml", "msgpack"]
+    MSG_LAZY = False                                   # 消息包惰性解码（按需解码数据并缓存，未修改的消息原样转发）
+    URL_CACHE_SIZE = 1024                              # URL 解析/校验 LRU 缓存容量，改变后下次解析时重建缓存
     XML_ROOT_TAG = "root"                              # XML 根标识
     XML_IS_STR_VALUE = True
+    XML_PARSE_CHUNK = 64 * 1024                        # XML 增量解析每次输入的长度，待处理事件及元素随之增减
     MQ_MAX_DEPTH = 32                                  # MQ 最大深度
     MQ_BLOCK_TIME = 1/1024                             # MQ 消息间阻塞时间
+    MQ_DIRECT = False                                  # MQ 直连模式（套接字在调用者进程内，不经子进程与管道）
+    MQ_LINGER = 1000                                   # MQ 关闭套接字时等待未发送消息的时间（毫秒）
+    MQ_POLL_TIME = 100                                 # MQ 轮询超时（毫秒），用于检查停止信号
+    MQ_ROUTER = False                                  # MQ 请求应答使用 ROUTER/DEALER 并发模式（关联编号、乱序应答）
+    MQ_WORKERS = 4                                     # MQ ROUTER 模式应答线程数
+    MQ_BATCH = None                                    # MQ PUSH 自动批量 {"size": int, "linger": int(毫秒)}，None 为不批量
+    MQ_HWM = {"send": 1000, "recv": 1000}              # MQ 套接字高水位（消息数）
+    MQ_OVERFLOW = {"policy": "block", "depth": 1000}   # MQ 发送溢出策略 ["block", "drop-oldest", "drop-newest", "spill"]，
+                                                       #                 depth 为发送缓冲深度
+    MQ_SPOOL = None                                    # MQ PUSH/PULL 持久化缓冲目录，None 为不持久化
+    MQ_SPOOL_SEGMENT = 4096                            # MQ 持久化缓冲段容量（消息数），全部确认的段被回收
+    MQ_SPOOL_SYNC = {"count": 256, "interval": 50}     # MQ 持久化缓冲 fsync 批量：累计消息数或间隔（毫秒）先到即 fsync；
+                                                       # 间隔在写入、确认、队列进程轮询及阻塞接收前检查，
+                                                       # 直连模式 PUSH 空闲时至下次调用或关闭才 fsync
+    MQ_RELIABLE = None                                 # MQ PUSH/PULL 确认重发 {"timeout": int(毫秒，可见性超时), "retries": int,
+                                                       #                  "batch": int(确认批量)}，None 为不确认
+    MQ_SPOOL_RELIABLE = {"timeout": 30000, "retries": 100,
+                         "batch": 100}                 # MQ 启用持久化缓冲而未配置 MQ_RELIABLE 时的确认重发：
+                                                       # 收到对端写入持久化缓冲后的确认才确认，两端须同时启用
+    MQ_MULTIPART = False                               # MQ 多帧传输（数据流以原始字节帧零拷贝发送）
     FTP_BANNER = "Welcome to Babelor Information Service Exchange Platform."
     FTP_PASV_PORTS = [10000, 10001, 10002, 10003, 10004, 10005, 10006, 10007, 10008, 10009]
     FTP_BUFFER = 1024
@@ -37,7 +60,25 @@ class CONFIG:
     IS_DATA_WRITE_END = True
     IS_DATA_READ_START = True
     IS_SQL_DATA_STRING = True
+    DATAFRAME_TPE = "arrow"                            # DataFrame 封装 ["arrow", "pickle"]，arrow 需 pyarrow
+    DATAFRAME_PICKLE = False                           # 允许以 pickle 封装/解封 DataFrame（解封可执行任意代码，仅限可信节点）
+    DATUM_CHUNK_SIZE = 4 * 1024 * 1024                 # 大文件分块传输的块大小（字节）
+    DATUM_COMPRESS = None                              # 数据压缩策略 {"codec": ["zlib", "zstd", "lz4"], "level": int,
+                                                       #              "threshold": int}，None 为不压缩
     MAIL_SUBJECT = "Message From Babelor Information Service Exchange Platform"
     MAIL_CONTENT = "Welcome to Babelor Information Service Exchange Platform."
+    POOL_IDLE_TIME = 300                               # 端点池空闲回收时间（秒）
+    POOL_CHECK_TIME = 30                               # 端点池健康检查及空闲扫描间隔（秒）
+    POOL_MAX_AGE = 3600                                # 端点池句柄最长存活时间（秒），到期重建，None 为不限
+    POOL_CAPACITY = 64                                 # 端点池最多句柄数，超出回收最久未用的，None 为不限
+    TEMPLE_WORKERS = 1                                 # TEMPLE 信徒数
+    TEMPLE_ORDERED = False                             # TEMPLE 同一 case 的消息由同一信徒按序处理
+    TEMPLE_THREAD = False                              # TEMPLE 信徒以线程运行于同一进程（适合 I/O 等待为主）
+    TEMPLE_PREFETCH = 2                                # TEMPLE 每个信徒最多未完成的消息数
+    TEMPLE_PIPELINE = False                            # TEMPLE 信徒内分段流水线（各段一个线程，段间有界队列）
+    TEMPLE_PIPELINE_DEPTH = 4                          # TEMPLE 流水线段间队列深度
+    TEMPLE_ASYNC_WORKERS = 16                          # 协程 TEMPLE 每个节点同时处理的消息数
+    TEMPLE_ROUTE_WORKERS = 8                           # TEMPLE 路由计划并行分支的线程数
+    TEMPLE_JOIN_TIMEOUT = 600                          # TEMPLE 路由汇合等待同一批次其余消息的时间（秒），超时否认
     TASK_BLOCK_TIME = 60
     TASK_MAX_RUN_TIMES = 365
@@ -15,6 +15,7 @@
 
 # System Required
 import os
+import shutil
 import logging
 # Outer Required
 import pandas as pd
@@ -71,6 +72,28 @@ class FILE:
         logging.info("FILE::{0}::READ successfully.".format(self.conn))
         return msg
 
+    def read_iter(self, msg: MSG):
+        """
+        # 分块读取：大于 CONFIG.DATUM_CHUNK_SIZE 的文件不整体载入，按块逐个产出消息
+        :param msg: MSG
+        :return: generator      # 先产出含其余数据的消息，其后产出分块消息（case/activity 相同，seq 递增）
+        """
+        chunks = []
+        for i in range(msg.args_count - 1, -1, -1):
+            arguments = msg.read_args(i)
+            if self.url_is_dir:
+                path = os.path.join(self.conn.path, arguments["path"])
+            else:
+                path = self.conn.path
+            if is_chunked(path):
+                chunks = [(path, arguments["path"])] + chunks
+                msg.remove_args(i)
+        head = msg.copy_head()
+        yield self.read(msg)
+        for path, name in chunks:
+            for msg_chunk in file_to_chunks(head, path, name):
+                yield msg_chunk
+
     def write(self, msg: MSG):
         # logging.debug("FILE::{0}::WRITE msg:{1}".format(self.conn, msg))
         if self.url_is_dir:
@@ -79,14 +102,18 @@ class FILE:
         # -------------------------------
         rm_idx = []
         for i in range(0, msg.dt_count, 1):
-            dt = msg.read_datum(i)
+            dt = msg.read_chunk(i)
+            if dt is None:
+                dt = msg.read_datum(i)
             if self.url_is_dir:
                 path = os.path.join(self.conn.path, dt["path"])
             else:
                 path = self.conn.path
             suffix = os.path.splitext(path)[-1]
             # -------------------------------
-            if os.path.exists(path):
+            if "seq" in dt.keys():
+                chunk_to_file(dt, path)
+            elif os.path.exists(path):
                 logging.warning("FILE::{0}::WRITE failed.".format(path))
             elif os.path.isfile(os.path.split(path)[0]):
                 logging.warning("FILE::{0}::WRITE failed.".format(path))
@@ -119,6 +146,69 @@ class FILE:
                 msg.remove_datum(i)
 
 
+def is_chunked(path: str) -> bool:
+    if os.path.isfile(path):
+        if os.path.splitext(path)[-1] not in [".xls", ".xlsx", ".npy"]:
+            return os.path.getsize(path) > CONFIG.DATUM_CHUNK_SIZE
+    return False
+
+
+def file_to_chunks(head: MSG, path: str, name: str):
+    """
+    :param head: MSG        # 消息头模板
+    :param path: str        # 文件路径
+    :param name: str        # 数据路径
+    :return: generator      # 每块一个消息，内存占用不超过一块
+    """
+    size = os.path.getsize(path)
+    count = max((size + CONFIG.DATUM_CHUNK_SIZE - 1) // CONFIG.DATUM_CHUNK_SIZE, 1)
+    with open(path, "rb") as file:
+        for seq in range(0, count, 1):
+            offset = file.tell()
+            msg_chunk = head.copy_head()
+            msg_chunk.add_chunk(file.read(CONFIG.DATUM_CHUNK_SIZE), name, seq, count, offset, size)
+            logging.debug("FILE::{0}::READ chunk:{1}/{2}".format(path, seq + 1, count))
+            yield msg_chunk
+    logging.info("FILE::{0}::READ successfully.".format(path))
+
+
+def chunk_to_file(chunk: dict, path: str):
+    """
+    # 分块写入临时文件 <path>.part，块可乱序到达；已收到的块序号记录于 <path>.part.seq 目录，全部到齐后改名为目标文件
+    # chunks may arrive in any order; received seqs are recorded in <path>.part.seq, renamed once all are present
+    :param chunk: dict      # MSG.read_chunk 返回值
+    :param path: str        # 文件路径
+    :return: None           # 写入失败抛出 OSError，消息不被确认
+    """
+    part_path = "{0}.part".format(path)
+    seq_path = "{0}.seq".format(part_path)
+    if os.path.exists(path) and not os.path.exists(part_path):
+        # 目标文件已存在（含已完成传输的重投块）     target exists (or a redelivered chunk of a finished transfer)
+        logging.warning("FILE::{0}::WRITE chunk:{1}/{2} failed.".format(path, chunk["seq"] + 1, chunk["count"]))
+        return
+    if not os.path.isdir(os.path.split(path)[0]):
+        mkdir(os.path.split(path)[0])
+    os.makedirs(seq_path, exist_ok=True)
+    # 任一块均可创建临时文件，不截断其他块已写入的内容     any chunk may create the part file, never truncated
+    with os.fdopen(os.open(part_path, os.O_RDWR | os.O_CREAT), "r+b") as file:
+        file.seek(chunk["offset"])
+        file.write(chunk["stream"])
+    with open(os.path.join(seq_path, str(chunk["seq"])), "wb"):
+        pass
+    logging.debug("FILE::{0}::WRITE chunk:{1}/{2}".format(path, chunk["seq"] + 1, chunk["count"]))
+    if len(os.listdir(seq_path)) < chunk["count"]:
+        return
+    try:
+        os.replace(part_path, path)
+    except FileNotFoundError:
+        # 并发写入的末块已完成改名     the rename was done by a concurrent last chunk
+        if not os.path.exists(path):
+            raise
+        return
+    shutil.rmtree(seq_path, ignore_errors=True)
+    logging.info("FILE::{0}::WRITE successfully.".format(path))
+
+
 def mkdir(file_path: str):
     dir_path = os.path.split(file_path)[0]
     if os.path.exists(file_path):
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 # System Required
+import io
 import os
 import ftplib
 import logging
@@ -90,12 +91,19 @@ class FTP:
         # -------------------------------------------------
         rm_idx = []
         for i in range(0, msg.dt_count, 1):
-            dt = msg.read_datum(i)
+            dt = msg.read_chunk(i)
+            if dt is None:
+                dt = msg.read_datum(i)
             if self.url_is_dir:
                 path = os.path.join(self.conn.path, dt["path"])
             else:
                 path = self.conn.path
             # ----------------------------
+            if "seq" in dt.keys():
+                chunk_to_ftp(ftp, dt, path)
+                rm_idx = [i] + rm_idx
+                continue
+            # ----------------------------
             suffix = os.path.splitext(path)[-1]
             temp_path = "temp/temp" + suffix
             mkdir(temp_path)
@@ -122,7 +130,7 @@ class FTP:
                 stream = dt["stream"]
                 logging_info = ""
             # ----------------------------
-            ftp.storbinary('STOR ' + path, stream, CONFIG.FTP_BUFFER)
+            ftp.storbinary('STOR ' + path, io.BytesIO(stream), CONFIG.FTP_BUFFER)
             rm_idx = [i] + rm_idx
             logging.info("FTP{0}::{1}::WRITE successfully.".format(logging_info, self.conn))
         # -------------------------------------------------
@@ -141,3 +149,60 @@ class FTP:
                 if self.conn.fragment.query["model"] in ["PASV"]:
                     ftp.set_pasv(True)
         return ftp
+
+
+def ftp_names(ftp: ftplib.FTP, path: str) -> list:
+    # 目录下的文件名，目录不存在或为空时（部分服务端返回 550）为 []
+    try:
+        return [os.path.basename(name) for name in (ftp.nlst(path) if path else ftp.nlst())]
+    except ftplib.error_perm:
+        return []
+
+
+def chunk_to_ftp(ftp: ftplib.FTP, chunk: dict, path: str):
+    """
+    # 分块写入临时目录 <path>.part.seq，每块一个文件（同时记录已收到的块序号），块可乱序、重复到达
+    # 全部到齐后改名为 <path>.part.join（仅一个写入者成功），按序拼接为 <path>.part 后改名为目标文件
+    # FTP 的 REST 不能越过文件末尾，块无法直接按偏移写入临时文件
+    # chunks may arrive in any order; each is stored as <path>.part.seq/<seq>, the writer that claims the
+    # directory once all are present appends them in order to <path>.part and renames it to the target
+    :param ftp: ftplib.FTP  # FTP 连接
+    :param chunk: dict      # MSG.read_chunk 返回值
+    :param path: str        # 文件路径
+    :return: None           # 写入失败抛出 ftplib.all_errors，消息不被确认
+    """
+    part_path = "{0}.part".format(path)
+    seq_path = "{0}.seq".format(part_path)
+    join_path = "{0}.join".format(part_path)
+    names = ftp_names(ftp, os.path.split(path)[0])
+    if (os.path.basename(path) in names) or (os.path.basename(join_path) in names):
+        # 目标文件已存在或正在拼接（含已完成传输的重投块）     target exists or is being joined (a redelivered chunk)
+        logging.warning("FTP::{0}::WRITE chunk:{1}/{2} failed.".format(path, chunk["seq"] + 1, chunk["count"]))
+        return
+    if os.path.basename(seq_path) not in names:
+        try:
+            ftp.mkd(seq_path)
+        except ftplib.error_perm:
+            pass                # 并发写入的块已创建     created by a concurrent chunk
+    ftp.storbinary("STOR {0}/{1}".format(seq_path, chunk["seq"]), io.BytesIO(chunk["stream"]), CONFIG.FTP_BUFFER)
+    logging.debug("FTP::{0}::WRITE chunk:{1}/{2}".format(path, chunk["seq"] + 1, chunk["count"]))
+    if len(ftp_names(ftp, seq_path)) < chunk["count"]:
+        return
+    try:
+        ftp.rename(seq_path, join_path)
+    except ftplib.error_perm:
+        return                  # 并发写入的末块已开始拼接     joined by a concurrent last chunk
+    try:
+        for seq in range(0, chunk["count"], 1):
+            stream = io.BytesIO()
+            ftp.retrbinary("RETR {0}/{1}".format(join_path, seq), stream.write, CONFIG.FTP_BUFFER)
+            stream.seek(0)
+            ftp.storbinary("{0} {1}".format("STOR" if seq == 0 else "APPE", part_path), stream, CONFIG.FTP_BUFFER)
+        ftp.rename(part_path, path)
+    except ftplib.all_errors:
+        ftp.rename(join_path, seq_path)     # 交还各块，重投的块再次拼接     hand back, a redelivered chunk retries
+        raise
+    for seq in range(0, chunk["count"], 1):
+        ftp.delete("{0}/{1}".format(join_path, seq))
+    ftp.rmd(join_path)
+    logging.info("FTP::{0}::WRITE successfully.".format(path))
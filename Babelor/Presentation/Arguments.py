@@ -15,12 +15,12 @@
 # limitations under the License.
 
 # System Required
-import base64
 import logging
 # Outer Required
 # Inner Required
 from Babelor.Presentation.UniformResourceIdentifier import URL, url_null_keep
-from Babelor.Tools import dict2json, json2dict, dict2xml, xml2dict
+from Babelor.Presentation.Datum import stream_to_bytes, stream_to_base64
+from Babelor.Tools import dict2json, json2dict, dict2xml, xml2dict, msgpack2dict, dict2msgpack
 # Global Parameters
 from Babelor.Config import CONFIG
 
@@ -28,23 +28,34 @@ from Babelor.Config import CONFIG
 class ARGS:
     def __init__(self, arguments=None):
         self.count = 0      # 参数数量  int
-        self.stream = []    # 数据流    [str, str]
+        self.stream = []    # 数据流    [bytes, str(base64)]
         self.path = []      # 路径      [(str, URL), (str, URL)]
+        self.cache = {}     # 解码缓存  {idx: str} (lazy mode)
+        self.version = 0    # 版本      修改次数 (lazy mode)
         if isinstance(arguments, dict):
             self.from_dict(arguments)
-        elif isinstance(arguments, str):
+        elif isinstance(arguments, (str, bytes)):
             if CONFIG.MSG_TPE in ["json"]:
                 self.from_json(arguments)
             elif CONFIG.MSG_TPE in ["xml"]:
                 self.from_xml(arguments)
-            # elif CONFIG.MSG_TPE in ["msgpack"]:
-            #     self.from_msgpack(datum)
+            elif CONFIG.MSG_TPE in ["msgpack"]:
+                if isinstance(arguments, str):
+                    self.from_json(arguments)     # to_string 以 json 展示    to_string() emits json
+                else:
+                    self.from_msgpack(arguments)
             else:
                 logging.warning("Defined serialization patterns:{0} are not supported.".format(CONFIG.MSG_TPE))
                 raise NotImplementedError("Serialization support xml, json and msgpack only.")
 
+    def __setattr__(self, key, value):
+        # 每次修改升版本，惰性模式下消息据此判断原始封装是否仍可原样转发
+        object.__setattr__(self, key, value)
+        if key not in ["cache", "version"]:
+            object.__setattr__(self, "version", self.__dict__.get("version", 0) + 1)
+
     def add(self, arguments, path: (str, URL) = None):
-        arguments_stream = base64.b64encode(arguments.encode(CONFIG.Coding)).decode("ascii")
+        arguments_stream = arguments.encode(CONFIG.Coding)
         path = url_null_keep(path)
         self.stream += [arguments_stream, ]
         self.path += [path, ]
@@ -55,11 +66,18 @@ class ARGS:
             del self.stream[idx]
             del self.path[idx]
             self.count -= 1
+            self.cache = {}
 
     def read(self, idx: int):
         if (idx < self.count) and (self.count > 0):
+            if idx in self.cache.keys():
+                stream = self.cache[idx]
+            else:
+                stream = bytes(stream_to_bytes(self.stream[idx])).decode(CONFIG.Coding)
+                if CONFIG.MSG_LAZY:
+                    self.cache[idx] = stream
             return {
-                "stream": base64.b64decode(self.stream[idx].encode("ascii")).decode(CONFIG.Coding),
+                "stream": stream,
                 "path": self.path[idx],
             }
         else:
@@ -68,10 +86,29 @@ class ARGS:
                 "path": None,
             }
 
+    def copy(self):
+        # 索引独立，数据流共享
+        arguments = ARGS()
+        arguments.extend(self)
+        return arguments
+
+    def extend(self, arguments):
+        """
+        :param arguments: ARGS  # 追加其全部参数
+        """
+        self.stream += arguments.stream
+        self.path += arguments.path
+        self.count += arguments.count
+        self.cache = {}
+
     def clean(self):
         for k in self.__dict__.keys():
             if k in ["count"]:
                 self.__dict__[k] = 0
+            elif k in ["cache"]:
+                self.__dict__[k] = {}
+            elif k in ["version"]:
+                self.__dict__[k] += 1
             else:
                 self.__dict__[k] = []
 
@@ -80,9 +117,13 @@ class ARGS:
 
     __repr__ = __str__
 
-    def to_serialize(self):
+    def to_serialize(self, binary: bool = False):
+        if binary:
+            stream = [stream_to_bytes(s) for s in self.stream]
+        else:
+            stream = [stream_to_base64(s) for s in self.stream]
         return {
-            "stream": self.stream,
+            "stream": stream,
             "path": self.path,
         }
 
@@ -91,8 +132,8 @@ class ARGS:
             return self.to_json()
         elif CONFIG.MSG_TPE in ["xml"]:
             return self.to_xml()
-        # elif CONFIG.MSG_TPE in ["msgpack"]:
-        #     return self.to_msgpack()
+        elif CONFIG.MSG_TPE in ["msgpack"]:
+            return self.to_json()
         else:
             logging.warning("Defined serialization patterns:{0} are not supported.".format(CONFIG.MSG_TPE))
             raise NotImplementedError("Serialization support xml, json and msgpack only.")
@@ -103,22 +144,29 @@ class ARGS:
     def to_xml(self):
         return dict2xml(self.to_serialize())
 
+    def to_msgpack(self):
+        return dict2msgpack(self.to_serialize(binary=True))
+
     def from_json(self, msg: str):
         self.from_dict(json2dict(msg))
 
     def from_xml(self, msg: str):
         self.from_dict(xml2dict(msg))
 
+    def from_msgpack(self, msg: bytes):
+        self.from_dict(msgpack2dict(msg))
+
     def from_dict(self, dt: dict):
         self.stream = dt["stream"]
         self.path = dt["path"]
         self.count = len(self.path)
+        self.cache = {}
 
 
-def args_null_keep(item: object, item_type: classmethod = str) -> object:
+def args_null_keep(item: object, item_type: classmethod = str, binary: bool = False) -> object:
     if item is None:
         return None
     elif isinstance(item, ARGS):
-        return item.to_serialize()
+        return item.to_serialize(binary=binary)
     else:
         return item_type(item)
@@ -28,12 +28,15 @@ def current_datetime() -> str:
 
 
 class CASE:
+    __slots__ = ("origination", "destination", "timestamp")
+
     def __init__(self, case=None):
         self.origination = None
         self.destination = None
-        self.timestamp = current_datetime()
         if isinstance(case, str):
             self.from_string(case)
+        else:
+            self.timestamp = current_datetime()
 
     def __str__(self):
         return self.to_string()
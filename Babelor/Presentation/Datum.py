@@ -15,14 +15,29 @@
 # limitations under the License.
 
 # System Required
+import time
+import zlib
 import base64
+import pickle
 import logging
 # Outer Required
 import pandas as pd
 import numpy as np
+try:
+    import pyarrow as pa        # 可选依赖：列式数据传输   optional: columnar DataFrame transport
+except ImportError:
+    pa = None
+try:
+    import zstandard as zstd    # 可选依赖：zstd 压缩      optional: zstd compression
+except ImportError:
+    zstd = None
+try:
+    import lz4.frame as lz4     # 可选依赖：lz4 压缩       optional: lz4 compression
+except ImportError:
+    lz4 = None
 # Inner Required
 from Babelor.Presentation.UniformResourceIdentifier import URL, url_null_keep
-from Babelor.Tools import dict2json, json2dict, dict2xml, xml2dict  # , msgpack2dict, dict2msgpack
+from Babelor.Tools import dict2json, json2dict, dict2xml, xml2dict, msgpack2dict, dict2msgpack
 # Global Parameters
 from Babelor.Config import CONFIG
 
@@ -30,32 +45,69 @@ from Babelor.Config import CONFIG
 class DATUM:
     def __init__(self, datum=None):
         self.count = 0
-        self.stream = []      # 数据流       [str, str]
+        self.stream = []      # 数据流       [bytes, str(base64)]
         self.coding = []      # 编码         [<json>, <json>]
         self.path = []        # 路径         [(str, URL), (str, URL)]
         self.type = []        # 类型         [str, str]
+        self.cache = {}       # 解码缓存     {idx: object} (lazy mode)
+        self.version = 0      # 版本         修改次数 (lazy mode)
         if isinstance(datum, dict):
             self.from_dict(datum)
-        elif isinstance(datum, str):
+        elif isinstance(datum, (str, bytes)):
             if CONFIG.MSG_TPE in ["json"]:
                 self.from_json(datum)
             elif CONFIG.MSG_TPE in ["xml"]:
                 self.from_xml(datum)
-            # elif CONFIG.MSG_TPE in ["msgpack"]:
-            #     self.from_msgpack(datum)
+            elif CONFIG.MSG_TPE in ["msgpack"]:
+                if isinstance(datum, str):
+                    self.from_json(datum)     # to_string 以 json 展示    to_string() emits json
+                else:
+                    self.from_msgpack(datum)
             else:
                 logging.warning("Defined serialization patterns:{0} are not supported.".format(CONFIG.MSG_TPE))
                 raise NotImplementedError("Serialization support xml, json and msgpack only.")
 
-    def add(self, datum, path: (str, URL) = None):
+    def __setattr__(self, key, value):
+        # 每次修改升版本，惰性模式下消息据此判断原始封装是否仍可原样转发
+        object.__setattr__(self, key, value)
+        if key not in ["cache", "version"]:
+            object.__setattr__(self, "version", self.__dict__.get("version", 0) + 1)
+
+    def add(self, datum, path: (str, URL) = None, compress: dict = None):
+        """
+        :param datum: object    # 数据
+        :param path: (str, URL) # 路径
+        :param compress: dict   # 压缩策略 {"codec": ["zlib", "zstd", "lz4"], "level": int, "threshold": int}
+                                # 默认 CONFIG.DATUM_COMPRESS
+        """
         dt = datum_to_stream(datum)
+        stream, coding = compress_stream(dt["stream"], dt["coding"], compress)
         path = url_null_keep(path)
-        self.stream += [dt["stream"], ]
-        self.coding += [dt["coding"], ]
+        self.stream += [stream, ]
+        self.coding += [coding, ]
         self.path += [path, ]
         self.type += [dt["type"], ]
         self.count += 1
 
+    def add_chunk(self, chunk: bytes, path: (str, URL), seq: int, count: int, offset: int, size: int,
+                  compress: dict = None):
+        """
+        :param chunk: bytes     # 分块数据
+        :param path: (str, URL) # 路径
+        :param seq: int         # 分块序号  0, 1, ..., count - 1
+        :param count: int       # 分块数量
+        :param offset: int      # 分块偏移
+        :param size: int        # 源数据大小
+        :param compress: dict   # 压缩策略，同 DATUM.add
+        """
+        coding = dict2json({"seq": seq, "count": count, "offset": offset, "size": size})
+        chunk, coding = compress_stream(chunk, coding, compress)
+        self.stream += [chunk, ]
+        self.coding += [coding, ]
+        self.path += [url_null_keep(path), ]
+        self.type += ["chunk", ]
+        self.count += 1
+
     def remove(self, idx: int):
         if (idx < self.count) and (self.count > 0):
             del self.stream[idx]
@@ -63,11 +115,20 @@ class DATUM:
             del self.path[idx]
             del self.type[idx]
             self.count -= 1
-    
+            self.cache = {}
+
     def read(self, idx: int):
+        # numpy.ndarray 数据为只读视图，与数据流共享内存，修改前须 copy()
+        # ndarray datum is a read-only view sharing the stream, copy() it before writing
         if (idx < self.count) and (self.count > 0):
+            if idx in self.cache.keys():
+                stream = self.cache[idx]
+            else:
+                stream = stream_to_datum(self.stream[idx], self.coding[idx], self.type[idx])
+                if CONFIG.MSG_LAZY:
+                    self.cache[idx] = stream
             return {
-                "stream": stream_to_datum(self.stream[idx], self.coding[idx], self.type[idx]),
+                "stream": stream,
                 "path": self.path[idx],
             }
         else:
@@ -76,10 +137,39 @@ class DATUM:
                 "path": None,
             }
 
+    def copy(self):
+        # 索引独立，数据流共享
+        datum = DATUM()
+        datum.extend(self)
+        return datum
+
+    def extend(self, datum):
+        """
+        :param datum: DATUM     # 追加其全部数据（不重新编码）
+        """
+        self.stream += datum.stream
+        self.coding += datum.coding
+        self.path += datum.path
+        self.type += datum.type
+        self.count += datum.count
+        self.cache = {}
+
+    def read_chunk(self, idx: int):
+        if (idx < self.count) and (self.count > 0) and (self.type[idx] in ["chunk"]):
+            rt = json2dict(split_coding(self.coding[idx])[1])
+            rt.update(self.read(idx))
+            return rt
+        else:
+            return None
+
     def clean(self):
         for k in self.__dict__.keys():
             if k in ["count"]:
                 self.__dict__[k] = 0
+            elif k in ["cache"]:
+                self.__dict__[k] = {}
+            elif k in ["version"]:
+                self.__dict__[k] += 1
             else:
                 self.__dict__[k] = []
 
@@ -88,9 +178,27 @@ class DATUM:
 
     __repr__ = __str__
 
-    def to_serialize(self):
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["stream"] = [bytes(s) if isinstance(s, memoryview) else s for s in self.stream]
+        state["cache"] = {}
+        return state
+
+    def to_serialize(self, binary: bool = False, frames: list = None):
+        if isinstance(frames, list):        # 数据流移入帧，保留帧索引    streams move to frames, index kept
+            stream = []
+            for s in self.stream:
+                if s is None:
+                    stream += [None, ]
+                else:
+                    frames += [stream_to_bytes(s), ]
+                    stream += [len(frames), ]
+        elif binary:
+            stream = [stream_to_bytes(s) for s in self.stream]
+        else:
+            stream = [stream_to_base64(s) for s in self.stream]
         return {
-            "stream": self.stream,
+            "stream": stream,
             "coding": self.coding,
             "path": self.path,
             "type": self.type,
@@ -101,8 +209,8 @@ class DATUM:
             return self.to_json()
         elif CONFIG.MSG_TPE in ["xml"]:
             return self.to_xml()
-        # elif CONFIG.MSG_TPE in ["msgpack"]:
-        #     return self.to_msgpack()
+        elif CONFIG.MSG_TPE in ["msgpack"]:
+            return self.to_json()
         else:
             logging.warning("Defined serialization patterns:{0} are not supported.".format(CONFIG.MSG_TPE))
             raise NotImplementedError("Serialization support xml, json and msgpack only.")
@@ -113,8 +221,8 @@ class DATUM:
     def to_xml(self):
         return dict2xml(self.to_serialize())
 
-    # def to_msgpack(self):
-    #     return dict2msgpack(self.to_serialize())
+    def to_msgpack(self):
+        return dict2msgpack(self.to_serialize(binary=True))
 
     def from_json(self, msg: str):
         self.from_dict(json2dict(msg))
@@ -122,8 +230,8 @@ class DATUM:
     def from_xml(self, msg: str):
         self.from_dict(xml2dict(msg))
 
-    # def from_msgpack(self, msg: str):
-    #     self.from_dict(msgpack2dict(msg))
+    def from_msgpack(self, msg: bytes):
+        self.from_dict(msgpack2dict(msg))
 
     def from_dict(self, dt: dict):
         self.stream = dt["stream"]
@@ -131,17 +239,19 @@ class DATUM:
         self.path = dt["path"]
         self.type = dt["type"]
         self.count = len(self.type)
+        self.cache = {}
 
 
-def datum_to_stream(datum: (str, pd.DataFrame, bytes, bytearray, None)) -> dict:
+def datum_to_stream(datum: (str, pd.DataFrame, np.ndarray, bytes, bytearray, None)) -> dict:
     """
-    :param datum: (str, pd.DataFrame, bytes, bytearray, None)
+    :param datum: (str, pd.DataFrame, np.ndarray, bytes, bytearray, None)
     :return: rt:
     {
-        "stream": [None, str],
-        "coding": [None, "ascii"],
-        "type": [None, "str", "base64", "pandas.core.frame.DataFrame"]
+        "stream": [None, bytes],
+        "coding": [None, "ascii", <charset>, <json>],
+        "type": [None, "str", "base64", "numpy.ndarray", "pandas.arrow", "pandas.pickle"]
     }
+    # 分块数据 "chunk" 由 DATUM.add_chunk 添加     "chunk" type is added by DATUM.add_chunk
     """
     if datum is None:
         rt = {
@@ -151,28 +261,36 @@ def datum_to_stream(datum: (str, pd.DataFrame, bytes, bytearray, None)) -> dict:
         }
     elif isinstance(datum, str):
         rt = {
-            "stream": base64.b64encode(datum.encode(CONFIG.Coding)).decode("ascii"),
+            "stream": datum.encode(CONFIG.Coding),
             "coding": CONFIG.Coding,
             "type": "str",
         }
     elif isinstance(datum, pd.DataFrame):
-        rt = {
-            "stream": base64.b64encode(datum.to_msgpack()).decode("ascii"),
-            "coding": None,
-            "type": "pandas.core.frame.DataFrame",
-        }
+        if (CONFIG.DATAFRAME_TPE in ["arrow"]) and (pa is not None):
+            rt = {
+                "stream": dataframe_to_arrow(datum),
+                "coding": None,
+                "type": "pandas.arrow",
+            }
+        else:
+            # 无 pyarrow 时以 pickle 封装（DataFrame.to_msgpack 自 pandas 1.0 起已移除），须 CONFIG.DATAFRAME_PICKLE
+            # without pyarrow fall back to pickle (DataFrame.to_msgpack is removed since pandas 1.0), opt-in only
+            check_pickle()
+            rt = {
+                "stream": pickle.dumps(datum, protocol=pickle.HIGHEST_PROTOCOL),
+                "coding": None,
+                "type": "pandas.pickle",
+            }
     elif isinstance(datum, np.ndarray):
+        stream, header = ndarray_to_stream(datum)
         rt = {
-            "stream": base64.b64encode(datum).decode("ascii"),
-            "coding": dict2json({
-                "dtype": str(datum.dtype),
-                "shape": datum.shape,
-             }),
+            "stream": stream,
+            "coding": dict2json(header),
             "type": "numpy.ndarray",
         }
     elif isinstance(datum, (bytes, bytearray)):
         rt = {
-            "stream": base64.b64encode(datum).decode("ascii"),
+            "stream": bytes(datum),
             "coding": "ascii",
             "type": "base64",
         }
@@ -185,35 +303,242 @@ def datum_to_stream(datum: (str, pd.DataFrame, bytes, bytearray, None)) -> dict:
     return rt
 
 
-def stream_to_datum(stream: str = None, coding: str = None, dtype: str = None):
+def check_pickle():
+    if not CONFIG.DATAFRAME_PICKLE:
+        raise PermissionError("Pickled DataFrame datum is disabled, "
+                              "set CONFIG.DATAFRAME_PICKLE = True between trusted peers only.")
+
+
+def stream_to_datum(stream: (str, bytes) = None, coding: str = None, dtype: str = None):
     """
-    :param stream:[None, str]
+    :param stream:[None, bytes, str]    (raw bytes, base64 string)
     :param coding:[None, str]   ("ascii", None)
-    :param dtype:[None, str]    ("base64", "str", "pandas.core.frame.DataFrame", None)
-    :return: [None, str, bytes, pd.DataFrame]
+    :param dtype:[None, str]    ("base64", "chunk", "str", "numpy.ndarray", "pandas.arrow",
+                                 "pandas.pickle", "pandas.core.frame.DataFrame", None)
+    :return: [None, str, bytes, np.ndarray, pd.DataFrame]
     """
-    if dtype in ["base64"]:
-        return base64.b64decode(stream.encode("ascii"))
+    compress, coding = split_coding(coding)
+    if compress is not None:
+        stream = decompress_stream(stream_to_bytes(stream), compress)
+    if dtype in ["base64", "chunk"]:
+        return bytes(stream_to_bytes(stream))
     elif dtype in ["str"]:
-        return base64.b64decode(stream.encode("ascii")).decode(coding)
+        return bytes(stream_to_bytes(stream)).decode(coding)
+    elif dtype in ["pandas.arrow"]:
+        return arrow_to_dataframe(stream_to_bytes(stream), is_string=CONFIG.IS_SQL_DATA_STRING)
+    elif dtype in ["pandas.pickle"]:
+        check_pickle()          # 解封可执行任意代码     unpickling runs arbitrary code
+        df = pickle.loads(stream_to_bytes(stream))
+        if CONFIG.IS_SQL_DATA_STRING:
+            if isinstance(df, pd.DataFrame):
+                df = df.astype(str)
+        return df
     elif dtype in ["pandas.core.frame.DataFrame"]:
-        df = pd.read_msgpack(base64.b64decode(stream.encode("ascii")))
+        # 旧版 msgpack 封装，仅 pandas < 1.0 可读     legacy msgpack datum, readable with pandas < 1.0 only
+        if not hasattr(pd, "read_msgpack"):
+            raise NotImplementedError("Legacy msgpack DataFrame datum needs pandas < 1.0, resend as arrow or pickle.")
+        df = pd.read_msgpack(bytes(stream_to_bytes(stream)))
         if CONFIG.IS_SQL_DATA_STRING:
             if isinstance(df, pd.DataFrame):
                 df = df.applymap(str)
         return df
     elif dtype in ["numpy.ndarray"]:
-        dt_coding = json2dict(coding)
-        rt = np.frombuffer(base64.decodebytes(stream.encode("ascii")), dtype=np.dtype(dt_coding["dtype"]))
-        return np.reshape(rt, dt_coding["shape"])
+        return stream_to_ndarray(stream_to_bytes(stream), json2dict(coding))
     else:
         return None
 
 
-def datum_null_keep(item: object, item_type: classmethod = str) -> object:
+def compress_stream(stream: (bytes, memoryview, None), coding: str, compress: dict = None) -> tuple:
+    """
+    按压缩策略压缩数据流，压缩算法记录于编码 {"compress": <codec>, "coding": <coding>}
+    :param stream: (bytes, memoryview, None)    # 原始数据流
+    :param coding: str                          # 原始编码
+    :param compress: dict                       # 压缩策略，默认 CONFIG.DATUM_COMPRESS
+    :return: (stream, coding)
+    """
+    if compress is None:
+        compress = CONFIG.DATUM_COMPRESS
+    if (compress is None) or (stream is None):
+        return stream, coding
+    size = memoryview(stream).nbytes
+    if size < compress.get("threshold", 0):
+        return stream, coding
+    # ---------------------------------------------------------------------
+    codec = compress.get("codec", "zlib")
+    level = compress.get("level", None)
+    start = time.time()
+    if codec in ["zlib"]:
+        compressed = zlib.compress(stream, -1 if level is None else level)
+    elif codec in ["zstd"] and (zstd is not None):
+        compressed = zstd.ZstdCompressor(level=3 if level is None else level).compress(stream)
+    elif codec in ["lz4"] and (lz4 is not None):
+        compressed = lz4.compress(stream, compression_level=0 if level is None else level)
+    else:
+        raise ValueError("Compression codec:{0} is not supported or not installed.".format(codec))
+    elapsed = time.time() - start
+    # ---------------------------------------------------------------------
+    report_compress_stats("compress", codec, size, len(compressed), elapsed)
+    if len(compressed) < size:
+        return compressed, dict2json({"compress": codec, "coding": coding})
+    else:
+        return stream, coding
+
+
+def decompress_stream(stream: (bytes, memoryview), codec: str) -> bytes:
+    start = time.time()
+    if codec in ["zlib"]:
+        rt = zlib.decompress(stream)
+    elif codec in ["zstd"] and (zstd is not None):
+        rt = zstd.ZstdDecompressor().decompress(stream)
+    elif codec in ["lz4"] and (lz4 is not None):
+        rt = lz4.decompress(stream)
+    else:
+        raise ValueError("Compression codec:{0} is not supported or not installed.".format(codec))
+    report_compress_stats("decompress", codec, len(rt), memoryview(stream).nbytes, time.time() - start)
+    return rt
+
+
+def split_coding(coding: (str, None)) -> tuple:
+    """
+    :param coding: (str, None)  # 编码
+    :return: (compress, coding) # 压缩算法（未压缩为 None），原始编码
+    """
+    if isinstance(coding, str) and coding.startswith("{"):
+        dt = json2dict(coding)
+        if "compress" in dt.keys():
+            return dt["compress"], dt["coding"]
+    return None, coding
+
+
+compress_hooks = []     # 压缩统计回调 [callable(dict), ]    compression stats hooks
+
+
+def report_compress_stats(action: str, codec: str, size: int, compressed: int, elapsed: float):
+    stats = {
+        "action": action,                                   # "compress", "decompress"
+        "codec": codec,                                     # 压缩算法
+        "size": size,                                       # 原始大小
+        "compressed": compressed,                           # 压缩后大小
+        "ratio": size / compressed if compressed else 0,    # 压缩比
+        "time": elapsed,                                    # 耗时（秒）
+    }
+    logging.debug("DATUM::{0}::{1} size:{2} compressed:{3} ratio:{4:.2f} time:{5:.6f}".format(
+        codec, action.upper(), size, compressed, stats["ratio"], elapsed))
+    for hook in compress_hooks:
+        hook(stats)
+
+
+def dataframe_to_arrow(df: pd.DataFrame) -> memoryview:
+    """
+    DataFrame 以 Arrow IPC 列式流封装
+    :param df: pd.DataFrame
+    :return: memoryview     # Arrow IPC stream
+    """
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return memoryview(sink.getvalue())
+
+
+def arrow_to_dataframe(stream: (bytes, memoryview), is_string: bool = False) -> pd.DataFrame:
+    """
+    Arrow IPC 列式流还原为 DataFrame，数据缓冲区尽量不拷贝
+    :param stream: (bytes, memoryview)      # Arrow IPC stream
+    :param is_string: bool                  # 按列转为字符串
+    :return: pd.DataFrame
+    """
+    if pa is None:
+        raise ImportError("Missing optional dependency pyarrow for pandas.arrow datum.")
+    table = pa.ipc.open_stream(pa.py_buffer(stream)).read_all()
+    if is_string:
+        # 无空值的整数与字符串列在 Arrow 内转换，与 str() 结果一致；其余列由 pandas 按列转换
+        metadata = table.schema.pandas_metadata
+        index_columns = [] if metadata is None else metadata["index_columns"]
+        for i, field in enumerate(table.schema):
+            if (field.name not in index_columns) and (table.column(i).null_count == 0) and \
+                    (pa.types.is_integer(field.type) or pa.types.is_string(field.type)):
+                table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+        return table.to_pandas(split_blocks=True).astype(str)
+    else:
+        return table.to_pandas(split_blocks=True)
+
+
+def ndarray_to_stream(arr: np.ndarray) -> tuple:
+    """
+    ndarray 按内存布局封装，C/Fortran 连续数组不拷贝，非连续数组拷贝一次
+    :param arr: np.ndarray
+    :return: (memoryview, dict)     # 数据流，头信息 {"descr", "fortran_order", "shape"}（同 .npy 头）
+    """
+    if arr.dtype.hasobject:
+        raise ValueError("numpy.ndarray datum with object dtype is not supported.")
+    if arr.flags.c_contiguous:
+        fortran_order = False
+    elif arr.flags.f_contiguous:
+        fortran_order = True
+    else:
+        arr = np.ascontiguousarray(arr)
+        fortran_order = False
+    flat = arr.ravel(order="F" if fortran_order else "C")
+    header = {
+        "descr": np.lib.format.dtype_to_descr(arr.dtype),
+        "fortran_order": fortran_order,
+        "shape": arr.shape,
+    }
+    return memoryview(flat.view(np.uint8)), header
+
+
+def stream_to_ndarray(stream: (bytes, bytearray, memoryview), header: dict) -> np.ndarray:
+    """
+    数据流还原为只读 ndarray 视图，不拷贝；调用者不得修改，须修改时先 copy()
+    :param stream: (bytes, bytearray, memoryview)
+    :param header: dict     # {"descr", "fortran_order", "shape"}，兼容旧格式 {"dtype", "shape"}
+    :return: np.ndarray
+    """
+    if "descr" in header.keys():
+        dtype = np.lib.format.descr_to_dtype(header["descr"])
+    else:
+        dtype = np.dtype(header["dtype"])
+    order = "F" if header.get("fortran_order", False) else "C"
+    if stream is None:
+        stream = b""    # 空数组经 XML 封装后数据流为 None     empty stream is dropped by XML
+    rt = np.frombuffer(stream, dtype=dtype).reshape(header["shape"], order=order)
+    rt.flags.writeable = False
+    return rt
+
+
+def stream_to_bytes(stream: (str, bytes, bytearray, memoryview, None)) -> (bytes, bytearray, memoryview, None):
+    """
+    Raw stream for binary serialization (msgpack), base64 string is decoded.
+    :param stream: [None, bytes, bytearray, memoryview, str(base64)]
+    :return: [None, bytes, bytearray, memoryview]
+    """
+    if stream is None:
+        return None
+    elif isinstance(stream, str):
+        return base64.b64decode(stream.encode("ascii"))
+    else:
+        return stream
+
+
+def stream_to_base64(stream: (str, bytes, bytearray, memoryview, None)) -> (str, None):
+    """
+    Base64 stream for text serialization (json, xml), raw stream is encoded.
+    :param stream: [None, bytes, bytearray, memoryview, str(base64)]
+    :return: [None, str(base64)]
+    """
+    if stream is None:
+        return None
+    elif isinstance(stream, str):
+        return stream
+    else:
+        return base64.b64encode(stream).decode("ascii")
+
+
+def datum_null_keep(item: object, item_type: classmethod = str, binary: bool = False, frames: list = None) -> object:
     if item is None:
         return None
     elif isinstance(item, DATUM):
-        return item.to_serialize()
+        return item.to_serialize(binary=binary, frames=frames)
     else:
         return item_type(item)
@@ -17,38 +17,36 @@
 import logging
 # Outer Required
 # Inner Required
-from Babelor.Tools import dict2json, json2dict, dict2xml, xml2dict  # , dict2msgpack, msgpack2dict
+from Babelor.Tools import dict2json, json2dict, dict2xml, xml2dict, dict2msgpack, msgpack2dict
 from Babelor.Presentation.UniformResourceIdentifier import URL, url_null_keep
 from Babelor.Presentation.Case import CASE, current_datetime, case_null_keep
 from Babelor.Presentation.Datum import DATUM, datum_null_keep
 from Babelor.Presentation.Arguments import ARGS, args_null_keep
+from Babelor.Presentation.Route import ROUTE, route_null_keep
 # Global Parameters
 from Babelor.Config import CONFIG
 
 
 class MSG:
-    def __init__(self, msg: str = None):
-        self.timestamp = current_datetime()     # 时间戳        Time Stamp
+    __slots__ = ("timestamp", "origination", "encryption", "treatment", "destination", "case", "activity",
+                 "route", "dt_count", "data", "args_count", "arguments", "raw")
+
+    def __init__(self, msg: (str, bytes) = None):
+        self.timestamp = None                   # 时间戳        Time Stamp (stamped at send)
         self.origination = None                 # 来源节点      Source Node
         self.encryption = None                  # 加/解密节点   Encrypted Node
         self.treatment = None                   # 计算节点      Computing Node
         self.destination = None                 # 目标节点      Target Node
         self.case = None                        # 实例          Instance
         self.activity = None                    # 步骤          Step in Instance
+        self.route = None                       # 路由计划      Routing plan (DAG)
         self.dt_count = 0                       # 数据数量      Data count
         self.data = None                        # 数据          Data
         self.args_count = 0                     # 参数数量      Arguments count
         self.arguments = None                   # 参数          Arguments
-        if isinstance(msg, str):
-            if CONFIG.MSG_TPE in ["json"]:
-                self.from_json(msg)
-            elif CONFIG.MSG_TPE in ["xml"]:
-                self.from_xml(msg)
-            # elif CONFIG.MSG_TPE in ["msgpack"]:
-            #     self.from_msgpack(msg)
-            else:
-                logging.warning("Defined serialization patterns:{0} are not supported.".format(CONFIG.MSG_TPE))
-                raise NotImplementedError("Serialization support xml, json and msgpack only.")
+        self.raw = None                         # 原始封装      Original wire form (lazy mode)
+        if isinstance(msg, (str, bytes)):
+            self.from_bytes(msg)
 
     def __str__(self):
         return self.to_string()
@@ -56,13 +54,97 @@ class MSG:
     __repr__ = __str__
 
     def __setattr__(self, key, value):
-        self.__dict__[key] = value
-        if key not in ["timestamp"]:
-            if "timestamp" in self.__dict__.keys():
-                self.__dict__["timestamp"] = current_datetime()
+        object.__setattr__(self, key, value)
+        if key not in ["raw"]:
+            object.__setattr__(self, "raw", None)
+
+    def __getstate__(self):
+        state = dict([(key, getattr(self, key)) for key in self.__slots__])
+        if isinstance(state["raw"], tuple) and isinstance(state["raw"][1], list):
+            state["raw"] = (state["raw"][0], [bytes(frame) for frame in state["raw"][1]], state["raw"][2])
+        return state
+
+    def __setstate__(self, state: dict):
+        for key, value in state.items():
+            object.__setattr__(self, key, value)
 
     def update(self):
-        self.__dict__["timestamp"] = current_datetime()
+        self.timestamp = current_datetime()
+
+    def copy_head(self):
+        msg = MSG()
+        msg.origination = self.origination
+        msg.encryption = self.encryption
+        msg.treatment = self.treatment
+        msg.destination = self.destination
+        msg.case = self.case
+        msg.activity = self.activity
+        msg.route = self.route
+        return msg
+
+    def copy(self):
+        """
+        分支复制：消息头与数据索引独立，数据流共享（不复制字节）
+        Branch copy: head and DATUM/ARGS index are independent, streams are shared.
+        :return: MSG
+        """
+        msg = self.copy_head()
+        msg.timestamp = self.timestamp
+        if self.data is not None:
+            msg.data = self.data.copy()
+            msg.dt_count = self.dt_count
+        if self.arguments is not None:
+            msg.arguments = self.arguments.copy()
+            msg.args_count = self.args_count
+        return msg
+
+    def merge(self, msg):
+        """
+        汇合：追加另一消息的数据与参数
+        Join: append DATUM and ARGS of another message.
+        :param msg: MSG
+        """
+        if msg.dt_count > 0:
+            if self.dt_count == 0:
+                self.data = DATUM()
+            self.data.extend(msg.data)
+            self.dt_count += msg.dt_count
+        if msg.args_count > 0:
+            if self.args_count == 0:
+                self.arguments = ARGS()
+            self.arguments.extend(msg.arguments)
+            self.args_count += msg.args_count
+        object.__setattr__(self, "raw", None)
+
+    def _raw(self, is_frames: bool):
+        """
+        惰性模式下未修改的消息包原样转发
+        Untouched message in lazy mode is forwarded with its original wire form.
+        :param is_frames: bool      # 多帧封装
+        :return: [None, bytes, list]
+        """
+        if isinstance(self.raw, tuple):
+            msg_tpe, raw, fingerprint = self.raw
+            if fingerprint != self._fingerprint():     # 嵌套对象已修改    nested object was modified
+                object.__setattr__(self, "raw", None)
+                return None
+            if msg_tpe in [CONFIG.MSG_TPE]:
+                if isinstance(raw, list) == is_frames:
+                    return raw
+                elif is_frames:
+                    return [raw, ]
+        return None
+
+    def _fingerprint(self) -> tuple:
+        """
+        消息头各字段的字符串形式及数据、参数的版本，嵌套对象（URL, CASE, DATUM, ARGS, ROUTE）被修改后随之改变
+        Head fields as strings plus DATUM/ARGS versions; changes whenever a nested object is modified.
+        :return: tuple
+        """
+        return (str(self.origination), str(self.encryption), str(self.treatment), str(self.destination),
+                str(self.case), self.activity, str(self.route),
+                None if self.data is None else self.data.version,
+                None if self.arguments is None else self.arguments.version)
 
     def to_dict(self) -> dict:
         return {
@@ -74,6 +156,7 @@ class MSG:
                 "destination": self.destination,    # 目标节点      Target Node
                 "case": self.case,                  # 实例          Instance
                 "activity": self.activity,          # 步骤          Step in Instance
+                "route": self.route,                # 路由计划      Routing plan
             },
             "body": {
                 "dt_count": self.dt_count,          # 数据数量      Data count
@@ -83,7 +166,9 @@ class MSG:
             },
         }
 
-    def to_serialize(self) -> dict:
+    def to_serialize(self, binary: bool = False, frames: list = None) -> dict:
+        if self.timestamp is None:
+            object.__setattr__(self, "timestamp", current_datetime())
         return {
             "head": {
                 "timestamp": self.timestamp,                        # 时间戳        Time Stamp
@@ -93,12 +178,13 @@ class MSG:
                 "destination": url_null_keep(self.destination),     # 目标节点      Target Node
                 "case": case_null_keep(self.case),                  # 实例          Instance
                 "activity": self.activity,                          # 步骤          Step in Instance
+                "route": route_null_keep(self.route),               # 路由计划      Routing plan
             },
             "body": {
                 "dt_count": self.dt_count,                          # 数据数量      Data count
-                "data": datum_null_keep(self.data),                 # 数据          Data
+                "data": datum_null_keep(self.data, binary=binary, frames=frames),   # 数据  Data
                 "args_count": self.args_count,                      # 参数数量      Arguments count
-                "arguments": args_null_keep(self.arguments),        # 参数          Arguments
+                "arguments": args_null_keep(self.arguments, binary=binary),    # 参数   Arguments
             },
         }
 
@@ -107,50 +193,86 @@ class MSG:
             return self.to_json()
         elif CONFIG.MSG_TPE in ["xml"]:
             return self.to_xml()
-        # elif CONFIG.MSG_TPE in ["msgpack"]:
-        #     return self.to_msgpack()
+        elif CONFIG.MSG_TPE in ["msgpack"]:
+            return self.to_json()           # 二进制封装以 json 展示    msgpack is shown as json
         else:
             raise NotImplementedError("Serialization support xml, json and msgpack only.")
 
+    def to_bytes(self) -> bytes:
+        raw = self._raw(is_frames=False)
+        if raw is not None:
+            return raw
+        self.update()
+        if CONFIG.MSG_TPE in ["msgpack"]:
+            return self.to_msgpack()
+        else:
+            return self.to_string().encode(CONFIG.Coding)
+
+    def to_frames(self) -> list:
+        """
+        多帧封装：帧 0 为消息头及数据索引，其后每帧为一个数据流（原始字节）
+        Multipart: frame 0 holds head and DATUM index, each DATUM stream follows as a raw frame.
+        :return: [bytes, bytes, memoryview, ...]
+        """
+        raw = self._raw(is_frames=True)
+        if raw is not None:
+            return raw
+        self.update()
+        frames = []
+        if CONFIG.MSG_TPE in ["json"]:
+            head = dict2json(self.to_serialize(frames=frames)).encode(CONFIG.Coding)
+        elif CONFIG.MSG_TPE in ["xml"]:
+            head = dict2xml(self.to_serialize(frames=frames)).encode(CONFIG.Coding)
+        elif CONFIG.MSG_TPE in ["msgpack"]:
+            head = dict2msgpack(self.to_serialize(binary=True, frames=frames))
+        else:
+            raise NotImplementedError("Serialization support xml, json and msgpack only.")
+        return [head] + frames
+
     def to_json(self) -> str:
         return dict2json(self.to_serialize())
 
     def to_xml(self) -> str:
         return dict2xml(self.to_serialize())
 
-    # def to_msgpack(self) -> str:
-    #     return dict2msgpack(self.to_serialize())
+    def to_msgpack(self) -> bytes:
+        return dict2msgpack(self.to_serialize(binary=True))
 
     def _from_dict_key(self, key: str, dt: dict, cls: classmethod, default: object = None):
         if key in dt.keys():
-            if dt[key] is None:
-                self.__dict__[key] = default
+            value = xml_unwrap(dt[key])
+            if value is None:
+                object.__setattr__(self, key, default)
             else:
-                if isinstance(dt[key], cls):
-                    self.__dict__[key] = dt[key]
+                if isinstance(value, cls):
+                    object.__setattr__(self, key, value)
                 else:
-                    self.__dict__[key] = cls(dt[key])
+                    object.__setattr__(self, key, cls(value))
         else:
-            self.__dict__[key] = default
+            object.__setattr__(self, key, default)
 
     def from_dict(self, dt: dict):
+        object.__setattr__(self, "raw", None)
+        dt = dict([(k, xml_unwrap(v)) for k, v in dt.items()])
         # set value from msg head --------------------------------------------
         if "head" in dt.keys():
-            self._from_dict_key("timestamp", dt["head"], str, current_datetime())
+            self._from_dict_key("timestamp", dt["head"], str, None)
             self._from_dict_key("origination", dt["head"], URL, None)
             self._from_dict_key("encryption", dt["head"], URL, None)
             self._from_dict_key("treatment", dt["head"], URL, None)
             self._from_dict_key("destination", dt["head"], URL, None)
             self._from_dict_key("case", dt["head"], CASE, None)
             self._from_dict_key("activity", dt["head"], str)
+            self._from_dict_key("route", dt["head"], ROUTE, None)
         else:
-            self.__dict__["timestamp"] = current_datetime()
-            self.__dict__["origination"] = None
-            self.__dict__["encryption"] = None
-            self.__dict__["treatment"] = None
-            self.__dict__["destination"] = None
-            self.__dict__["case"] = None
-            self.__dict__["activity"] = None
+            object.__setattr__(self, "timestamp", None)
+            object.__setattr__(self, "origination", None)
+            object.__setattr__(self, "encryption", None)
+            object.__setattr__(self, "treatment", None)
+            object.__setattr__(self, "destination", None)
+            object.__setattr__(self, "case", None)
+            object.__setattr__(self, "activity", None)
+            object.__setattr__(self, "route", None)
         # set value from msg body --------------------------------------------
         if "body" in dt.keys():
             self._from_dict_key("dt_count", dt["body"], int, 0)
@@ -158,10 +280,10 @@ class MSG:
             self._from_dict_key("args_count", dt["body"], int, 0)
             self._from_dict_key("arguments", dt["body"], ARGS, None)
         else:
-            self.__dict__["dt_count"] = 0
-            self.__dict__["data"] = None
-            self.__dict__["args_count"] = 0
-            self.__dict__["arguments"] = None
+            object.__setattr__(self, "dt_count", 0)
+            object.__setattr__(self, "data", None)
+            object.__setattr__(self, "args_count", 0)
+            object.__setattr__(self, "arguments", None)
 
     def from_json(self, msg: str):
         self.from_dict(json2dict(msg))
@@ -169,13 +291,39 @@ class MSG:
     def from_xml(self, msg: str):
         self.from_dict(xml2dict(msg))
 
-    # def from_msgpack(self, msg: str):
-    #     self.from_dict(msgpack2dict(msg))
+    def from_msgpack(self, msg: bytes):
+        self.from_dict(msgpack2dict(msg))
+
+    def from_bytes(self, msg: (str, bytes)):
+        if CONFIG.MSG_TPE in ["json"]:
+            self.from_json(msg)
+        elif CONFIG.MSG_TPE in ["xml"]:
+            self.from_xml(msg)
+        elif CONFIG.MSG_TPE in ["msgpack"]:
+            if isinstance(msg, str):
+                self.from_json(msg)     # to_string 以 json 展示    to_string() emits json
+            else:
+                self.from_msgpack(msg)
+        else:
+            logging.warning("Defined serialization patterns:{0} are not supported.".format(CONFIG.MSG_TPE))
+            raise NotImplementedError("Serialization support xml, json and msgpack only.")
+        if CONFIG.MSG_LAZY and isinstance(msg, bytes):
+            object.__setattr__(self, "raw", (CONFIG.MSG_TPE, msg, self._fingerprint()))
 
-    def add_datum(self, datum: object, path=None):
+    def from_frames(self, frames: list):
+        """
+        :param frames: [bytes, (bytes, memoryview), ...]   # 帧 0 为消息头，其后为数据流
+        """
+        self.from_bytes(frames[0])
+        if (len(frames) > 1) and (self.data is not None):
+            self.data.stream = [None if idx is None else frames[int(idx)] for idx in self.data.stream]
+        if CONFIG.MSG_LAZY:
+            object.__setattr__(self, "raw", (CONFIG.MSG_TPE, frames, self._fingerprint()))
+
+    def add_datum(self, datum: object, path=None, compress: dict = None):
         if self.dt_count == 0:
             self.data = DATUM()
-        self.data.add(datum=datum, path=path)
+        self.data.add(datum=datum, path=path, compress=compress)
         self.dt_count += 1
 
     def read_datum(self, idx: int):
@@ -184,6 +332,19 @@ class MSG:
         else:
             return None
 
+    def add_chunk(self, chunk: bytes, path, seq: int, count: int, offset: int, size: int, compress: dict = None):
+        if self.dt_count == 0:
+            self.data = DATUM()
+        self.data.add_chunk(chunk=chunk, path=path, seq=seq, count=count, offset=offset, size=size,
+                            compress=compress)
+        self.dt_count += 1
+
+    def read_chunk(self, idx: int):
+        if (self.dt_count > 0) and (idx < self.dt_count):
+            return self.data.read_chunk(idx=idx)
+        else:
+            return None
+
     def remove_datum(self, idx: int):
         if (idx < self.dt_count) and (self.dt_count > 0):
             self.data.remove(idx=idx)
@@ -204,7 +365,7 @@ class MSG:
         self.args_count += 1
 
     def read_args(self, idx: int):
-        if (self.dt_count > 0) and (idx < self.dt_count):
+        if (self.args_count > 0) and (idx < self.args_count):
             return self.arguments.read(idx)
         else:
             return None
@@ -221,3 +382,16 @@ class MSG:
             self.arguments.clean()
             self.args_count = 0
             self.arguments = None
+
+
+def xml_unwrap(item: object) -> object:
+    """
+    XML 解析结果中单值以列表保存，还原为单值
+    Single values parsed from xml are wrapped in list, unwrap them.
+    :param item: object
+    :return: object
+    """
+    if isinstance(item, list) and len(item) == 1:
+        return item[0]
+    else:
+        return item
@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+# coding=utf-8
+# Copyright 2019 StrTrek Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# System Required
+import logging
+from uuid import uuid4
+from collections import OrderedDict
+from urllib.parse import unquote, quote
+# Outer Required
+# Inner Required
+from Babelor.Presentation.UniformResourceIdentifier import URL, url_null_keep
+from Babelor.Tools import dict2json, json2dict, dict2xml, xml2dict, msgpack2dict, dict2msgpack
+# Global Parameters
+from Babelor.Config import CONFIG
+
+
+ROUTE_STAGES = ["encryption", "treatment", "destination"]      # 路由步骤可用的段
+
+
+class ROUTE:
+    def __init__(self, route=None):
+        """
+        # 路由计划：由步骤组成的有向无环图，随消息头传递
+        # 无前驱的步骤以来源消息为输入，同时开始（扇出）；多个前驱的步骤以各前驱输出合并为输入（汇合）
+        # 步骤只能以已添加的步骤为前驱，因此不会成环
+        :param route: (dict, str, bytes)    # 序列化的路由计划
+        """
+        self.steps = OrderedDict()      # 步骤 {名称: {"stage": str, "url": URL, "after": [名称, ]}}
+        self.join = None                # 同一 case、同一批次汇合的消息数，None 为不汇合
+        self.batch = None               # 汇合批次标识，同一 case 的各批次互不合并
+        if isinstance(route, dict):
+            self.from_dict(route)
+        elif isinstance(route, (str, bytes)):
+            if CONFIG.MSG_TPE in ["json"]:
+                self.from_json(route)
+            elif CONFIG.MSG_TPE in ["xml"]:
+                self.from_xml(route)
+            elif CONFIG.MSG_TPE in ["msgpack"]:
+                if isinstance(route, str):
+                    self.from_json(route)     # to_string 以 json 展示    to_string() emits json
+                else:
+                    self.from_msgpack(route)
+            else:
+                logging.warning("Defined serialization patterns:{0} are not supported.".format(CONFIG.MSG_TPE))
+                raise NotImplementedError("Serialization support xml, json and msgpack only.")
+
+    def add(self, name: str, stage: str, url: (str, URL), after: list = None):
+        """
+        :param name: str            # 步骤名称，唯一
+        :param stage: str           # 段 ["encryption", "treatment", "destination"]
+        :param url: (str, URL)      # 端点
+        :param after: list          # 前驱步骤名称 [str, ]，None 为以来源消息为输入
+        :return: ROUTE              # 可链式调用
+        """
+        if after is None:
+            after = []
+        if name in self.steps.keys():
+            raise ValueError("Duplicated route step:{0}.".format(name))
+        if stage not in ROUTE_STAGES:
+            raise ValueError("Invalid route stage:{0}.".format(stage))
+        for parent in after:
+            if parent not in self.steps.keys():
+                raise ValueError("Route step:{0} after unknown step:{1}.".format(name, parent))
+        if isinstance(url, str):
+            url = URL(url)
+        self.steps[name] = {"stage": stage, "url": url, "after": list(after)}
+        return self
+
+    def set_join(self, count: int, batch: str = None):
+        """
+        # 汇合：同一 case、同一批次的 count 条消息到齐后合并，再按路由计划执行
+        # 各条消息须互不相同（如 activity 不同），重复投递的同一条消息只计一次
+        :param count: int           # 汇合的消息数
+        :param batch: str           # 批次标识，None 为新建
+        :return: ROUTE              # 可链式调用
+        """
+        self.join = count
+        self.batch = uuid4().hex if batch is None else batch
+        return self
+
+    def roots(self) -> list:
+        return [name for name, step in self.steps.items() if len(step["after"]) == 0]
+
+    def children(self, name: str) -> list:
+        return [child for child, step in self.steps.items() if name in step["after"]]
+
+    def __str__(self):
+        return self.to_string()
+
+    __repr__ = __str__
+
+    def to_serialize(self):
+        # 步骤以 "名称#段#端点#前驱,前驱" 字符串保存，各格式（含 xml）均可还原
+        steps = []
+        for name, step in self.steps.items():
+            after = ",".join([quote(parent) for parent in step["after"]])
+            steps.append("{0}#{1}#{2}#{3}".format(quote(name), step["stage"], quote(url_null_keep(step["url"])), after))
+        return {
+            "steps": steps,
+            "join": self.join,
+            "batch": self.batch,
+        }
+
+    def to_string(self):
+        if CONFIG.MSG_TPE in ["json"]:
+            return self.to_json()
+        elif CONFIG.MSG_TPE in ["xml"]:
+            return self.to_xml()
+        elif CONFIG.MSG_TPE in ["msgpack"]:
+            return self.to_json()
+        else:
+            logging.warning("Defined serialization patterns:{0} are not supported.".format(CONFIG.MSG_TPE))
+            raise NotImplementedError("Serialization support xml, json and msgpack only.")
+
+    def to_json(self):
+        return dict2json(self.to_serialize())
+
+    def to_xml(self):
+        return dict2xml(self.to_serialize())
+
+    def to_msgpack(self):
+        return dict2msgpack(self.to_serialize())
+
+    def from_json(self, msg: str):
+        self.from_dict(json2dict(msg))
+
+    def from_xml(self, msg: str):
+        self.from_dict(xml2dict(msg))
+
+    def from_msgpack(self, msg: bytes):
+        self.from_dict(msgpack2dict(msg))
+
+    def from_dict(self, dt: dict):
+        self.steps = OrderedDict()
+        steps = dt.get("steps", [])
+        if isinstance(steps, str):
+            steps = [steps, ]
+        for step in steps:
+            name, stage, url, after = step.split("#")
+            after = [] if after in [""] else [unquote(parent) for parent in after.split(",")]
+            self.add(unquote(name), stage, unquote(url), after)
+        join = dt.get("join", None)
+        if isinstance(join, list):      # xml 解析结果中单值以列表保存
+            join = join[0] if len(join) > 0 else None
+        self.join = None if join is None else int(join)
+        batch = dt.get("batch", None)
+        if isinstance(batch, list):
+            batch = batch[0] if len(batch) > 0 else None
+        self.batch = None if batch is None else str(batch)
+
+
+def route_null_keep(item: object, item_type: classmethod = str) -> object:
+    if item is None:
+        return None
+    elif isinstance(item, ROUTE):
+        return item.to_serialize()
+    else:
+        return item_type(item)
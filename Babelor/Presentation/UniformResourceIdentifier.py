@@ -15,6 +15,7 @@
 
 # System Required
 from urllib.parse import urlparse, unquote, urlunparse, quote, parse_qs, urlencode
+from functools import lru_cache
 import re
 # Outer Required
 # Inner Required
@@ -23,6 +24,8 @@ from Babelor.Config import CONFIG
 
 
 class URL:
+    __slots__ = ("scheme", "username", "password", "hostname", "port", "path", "params", "query", "fragment")
+
     def __init__(self, url=None):
         """
         Parse a string into a URL components:
@@ -31,9 +34,8 @@ class URL:
         self.scheme = ""
         self.username = None
         self.password = None
-        self.hostname = None
+        self.hostname = ""
         self.port = None
-        self.netloc = ""
         self.path = ""
         self.params = ""
         self.query = ""
@@ -52,62 +54,53 @@ class URL:
         else:
             raise ValueError
 
-    def __setattr__(self, key, value):
-        self.__dict__[key] = value      # source update
-        keys = ["port", "hostname", "username", "password"]     # relative update
-        is_keys_init = len([False for k in keys if k not in list(self.__dict__.keys())]) == 0
-        if (key in keys) and is_keys_init:
-            self._compose_netloc()
-        if key in ["netloc"]:
-            self._decompose_netloc()
-
-    def _decompose_netloc(self):
-        if not isinstance(self.__dict__["netloc"], str):
-            raise ValueError("netloc must be string")
-        # ----------------------------------------------------------------------
-        if "@" in self.__dict__["netloc"]:
-            auth, location = self.__dict__["netloc"].split("@")
+    @property
+    def netloc(self):
+        # netloc 由 username, password, hostname, port 组成，读取时合成
+        if self.password is None:
+            if self.username is None:
+                auth = None
+            else:
+                auth = self.username
         else:
-            auth = None
-            location = self.__dict__["netloc"]
+            auth = "{0}:{1}".format(self.username, self.password)
         # ----------------------------------------------------------------------
-        if auth is None:
-            self.__dict__["username"] = None
-            self.__dict__["password"] = None
+        if self.port is None:
+            location = self.hostname
         else:
-            if ":" in auth:
-                self.__dict__["username"], self.__dict__["password"] = auth.split(":")
-            else:
-                self.__dict__["username"] = auth
-                self.__dict__["password"] = None
+            location = "{0}:{1}".format(self.hostname, self.port)
         # ----------------------------------------------------------------------
-        if ":" in location:
-            self.__dict__["hostname"], self.__dict__["port"] = location.split(":")
+        if auth is None:
+            return location
         else:
-            self.__dict__["hostname"] = location
-        # ----------------------------------------------------------------------
-        del location, auth
+            return "{0}@{1}".format(auth, location)
 
-    def _compose_netloc(self):
-        if self.__dict__["password"] is None:
-            if self.__dict__["username"] is None:
-                auth = None
-            else:
-                auth = self.__dict__["username"]
-        else:
-            auth = "{0}:{1}".format(self.__dict__["username"], self.__dict__["password"])
+    @netloc.setter
+    def netloc(self, netloc: str):
+        if not isinstance(netloc, str):
+            raise ValueError("netloc must be string")
         # ----------------------------------------------------------------------
-        if self.__dict__["port"] is None:
-            location = self.__dict__["hostname"]
+        if "@" in netloc:
+            auth, location = netloc.split("@")
         else:
-            location = "{0}:{1}".format(self.__dict__["hostname"], self.__dict__["port"])
+            auth = None
+            location = netloc
         # ----------------------------------------------------------------------
         if auth is None:
-            self.__dict__["netloc"] = location
+            self.username = None
+            self.password = None
         else:
-            self.__dict__["netloc"] = "{0}@{1}".format(auth, location)
+            if ":" in auth:
+                self.username, self.password = auth.split(":")
+            else:
+                self.username = auth
+                self.password = None
         # ----------------------------------------------------------------------
-        del auth, location
+        if ":" in location:
+            self.hostname, self.port = location.split(":")
+        else:
+            self.hostname = location
+            self.port = None
 
     def to_string(self, allow_path=True, allow_params=True, allow_query=True, allow_fragment=True) -> str:
         path, params, query, fragment = "", "", "", ""
@@ -133,103 +126,47 @@ class URL:
         return urlunparse((self.scheme, self.netloc, path, params, query, fragment))
 
     def from_string(self, string: str):
-        if re.search(r":port#", string) is not None:
-            url_string = re.sub(r":port#", "#", string)
-            default_port = "port"
-        elif re.search(r":port/", string) is not None:
-            url_string = re.sub(r":port/", "/", string)
-            default_port = "port"
-        elif re.search(r":port$", string) is not None:
-            url_string = re.sub(r":port$", "", string)
-            default_port = "port"
-        else:
-            url_string = string
-            default_port = None
-        # ----------------------------------------------------------------------
-        url = urlparse(url_string)
-        del url_string
-        # ----------------------------------------------------------------------
-        self.scheme = url.scheme
-        # ----------------------------------------------------------------------
-        self.username = url.username
-        # ----------------------------------------------------------------------
-        self.password = url.password
-        # ----------------------------------------------------------------------
-        self.hostname = url.hostname
+        # 解析结果按原始字符串缓存（LRU），缓存内为不可变元组，每个 URL 得到独立字段
+        self.from_fields(parse_url(string))
+
+    def from_fields(self, fields: tuple):
+        scheme, username, password, hostname, port, path, params, query, fragment = fields
+        self.scheme = scheme
+        self.username = username
+        self.password = password
+        self.hostname = hostname
+        self.port = port
+        self.path = path
+        self.params = params
         # ----------------------------------------------------------------------
-        if default_port is None:
-            self.port = url.port
+        if query in [""]:
+            self.query = ""
         else:
-            self.port = default_port
-        del default_port
-        # ----------------------------------------------------------------------
-        self.path = re.sub(r'^/', "", re.sub(r'/$', "", url.path))
-        # ----------------------------------------------------------------------
-        self.params = url.params
+            self.query = dict(query)
         # ----------------------------------------------------------------------
-        if url.query in [""]:
-            self.query = ""
+        if isinstance(fragment, tuple):
+            self.fragment = URL().from_fields(fragment)
+        else:
+            self.fragment = fragment
+        return self
+
+    def to_fields(self) -> tuple:
+        if self.query in [""]:
+            query = ""
         else:
-            self.query = dict([(k, v[0]) for k, v in parse_qs(url.query).items()])
+            query = tuple(self.query.items())
         # ----------------------------------------------------------------------
-        if url.fragment in [""]:
-            self.fragment = ""
+        if isinstance(self.fragment, URL):
+            fragment = self.fragment.to_fields()
         else:
-            try:
-                self.fragment = URL(unquote(url.fragment))
-            except RecursionError:
-                self.fragment = url.fragment
+            fragment = self.fragment
+        return (self.scheme, self.username, self.password, self.hostname, self.port, self.path, self.params,
+                query, fragment)
 
     @property
     def check(self):
-        default_port = None
-        check_url = URL(self.to_string())
-        if self.scheme in ["mysql"]:
-            # "mysql://<username>:<password>@<hostname>:<port>/<path>"
-            # "mysql+pymysql://<username>:<password>@<hostname>:3306/<path>"
-            check_url.scheme = "mysql+pymysql"
-            default_port = 3306
-        if self.scheme in ["oracle"]:
-            # "oracle://<username>:<password>@<hostname>:<port>/<path>"
-            # "oracle+cx_oracle://<username>:<password>@<hostname>:1521/<path>"
-            check_url.scheme = "oracle+cx_oracle"
-            default_port = 1521
-        if self.scheme in ["ftp", "ftpd"]:
-            # "ftp://<username>:<password>@<hostname>:<port>#?model=PASV
-            # "ftp://<username>:<password>@<hostname>:21#?model=PASV
-            # "ftp://<username>:<password>@<hostname>:<port>"
-            # "ftp://<username>:<password>@<hostname>:21#?model=PORT
-            # "ftpd://<username>:<password>@<hostname>:<port>#?model=PASV&ports=[<port>,<port>,]"
-            default_port = 21
-        if self.scheme in ["smtp"]:
-            # "smtp://<username>:<password>@<hostname>:<port>"
-            # "smtp://<username>:<password>@<hostname>:25"
-            default_port = 25
-        if self.scheme in ["pop3"]:
-            # "pop://<username>:<password>@<hostname>:<port>"
-            # "pop://<username>:<password>@<hostname>:110"
-            default_port = 110
-        if self.scheme in ["http"]:
-            # "http://<username>:<password>@<hostname>:<port>"
-            # "http://<username>:<password>@<hostname>:80"
-            default_port = 80
-        if self.scheme in ["file"]:
-            # "file://<username>:<password>@/<path>"
-            # "file:///<path>"
-            default_port = None
-        if self.scheme in ["tcp"]:
-            # "tcp://<hostname>:<port>"
-            default_port = 10001
-        # ----------------------------------------------------------------------
-        if re.match(CONFIG.Port_FMT, str(self.port)) is None:
-            if default_port is not None:
-                check_url.port = default_port
-            else:
-                check_url.port = None
-        # ----------------------------------------------------------------------
-        if isinstance(check_url.fragment, URL):
-            check_url.fragment = check_url.fragment.check
-        return check_url
+        # 校验结果按 URL 字符串缓存（LRU）
+        return URL().from_fields(check_url(self.to_string()))
 
     def init(self, scheme=None):
         if scheme in ["ftp"]:
@@ -256,6 +193,157 @@ class URL:
         return self
 
 
+url_caches = {}         # 按 CONFIG.URL_CACHE_SIZE 建立的缓存 {"current": (容量, 解析, 校验)}
+
+
+def url_cached(name: str) -> callable:
+    """
+    # 缓存在首次使用时按当前 CONFIG.URL_CACHE_SIZE 建立，容量改变后下次使用时重建（原有条目丢弃）
+    :param name: str    # ["parse", "check"]
+    :return: callable   # lru_cache 包装的解析/校验函数
+    """
+    current = url_caches.get("current", None)
+    if (current is None) or (current[0] != CONFIG.URL_CACHE_SIZE):
+        current = (CONFIG.URL_CACHE_SIZE, lru_cache(maxsize=CONFIG.URL_CACHE_SIZE)(read_url),
+                   lru_cache(maxsize=CONFIG.URL_CACHE_SIZE)(read_checked_url))
+        url_caches["current"] = current
+    return current[1] if name in ["parse"] else current[2]
+
+
+def parse_url(string: str) -> tuple:
+    """
+    解析 URL 字符串为不可变字段元组（LRU 缓存）
+    :param string: str  # URL 字符串
+    :return: tuple      # (scheme, username, password, hostname, port, path, params, query, fragment)
+    """
+    return url_cached("parse")(string)
+
+
+def check_url(string: str) -> tuple:
+    """
+    校验 URL 并补全默认端口（LRU 缓存）
+    :param string: str  # URL 字符串
+    :return: tuple      # 校验后 URL 的字段元组
+    """
+    return url_cached("check")(string)
+
+
+def read_url(string: str) -> tuple:
+    # 解析，不经缓存
+    if re.search(r":port#", string) is not None:
+        url_string = re.sub(r":port#", "#", string)
+        default_port = "port"
+    elif re.search(r":port/", string) is not None:
+        url_string = re.sub(r":port/", "/", string)
+        default_port = "port"
+    elif re.search(r":port$", string) is not None:
+        url_string = re.sub(r":port$", "", string)
+        default_port = "port"
+    else:
+        url_string = string
+        default_port = None
+    # ----------------------------------------------------------------------
+    url = urlparse(url_string)
+    del url_string
+    # ----------------------------------------------------------------------
+    if default_port is None:
+        port = url.port
+    else:
+        port = default_port
+    del default_port
+    # ----------------------------------------------------------------------
+    path = re.sub(r'^/', "", re.sub(r'/$', "", url.path))
+    # ----------------------------------------------------------------------
+    if url.query in [""]:
+        query = ""
+    else:
+        query = tuple([(k, v[0]) for k, v in parse_qs(url.query).items()])
+    # ----------------------------------------------------------------------
+    if url.fragment in [""]:
+        fragment = ""
+    else:
+        try:
+            fragment = parse_url(unquote(url.fragment))
+        except RecursionError:
+            fragment = url.fragment
+    return url.scheme, url.username, url.password, url.hostname, port, path, url.params, query, fragment
+
+
+def read_checked_url(string: str) -> tuple:
+    # 校验，不经缓存
+    default_port = None
+    url = URL(string)
+    checked = URL(string)
+    if url.scheme in ["mysql"]:
+        # "mysql://<username>:<password>@<hostname>:<port>/<path>"
+        # "mysql+pymysql://<username>:<password>@<hostname>:3306/<path>"
+        checked.scheme = "mysql+pymysql"
+        default_port = 3306
+    if url.scheme in ["oracle"]:
+        # "oracle://<username>:<password>@<hostname>:<port>/<path>"
+        # "oracle+cx_oracle://<username>:<password>@<hostname>:1521/<path>"
+        checked.scheme = "oracle+cx_oracle"
+        default_port = 1521
+    if url.scheme in ["ftp", "ftpd"]:
+        # "ftp://<username>:<password>@<hostname>:<port>#?model=PASV
+        # "ftp://<username>:<password>@<hostname>:21#?model=PASV
+        # "ftp://<username>:<password>@<hostname>:<port>"
+        # "ftp://<username>:<password>@<hostname>:21#?model=PORT
+        # "ftpd://<username>:<password>@<hostname>:<port>#?model=PASV&ports=[<port>,<port>,]"
+        default_port = 21
+    if url.scheme in ["smtp"]:
+        # "smtp://<username>:<password>@<hostname>:<port>"
+        # "smtp://<username>:<password>@<hostname>:25"
+        default_port = 25
+    if url.scheme in ["pop3"]:
+        # "pop://<username>:<password>@<hostname>:<port>"
+        # "pop://<username>:<password>@<hostname>:110"
+        default_port = 110
+    if url.scheme in ["http"]:
+        # "http://<username>:<password>@<hostname>:<port>"
+        # "http://<username>:<password>@<hostname>:80"
+        default_port = 80
+    if url.scheme in ["file"]:
+        # "file://<username>:<password>@/<path>"
+        # "file:///<path>"
+        default_port = None
+    if url.scheme in ["tcp"]:
+        # "tcp://<hostname>:<port>"
+        default_port = 10001
+    # ----------------------------------------------------------------------
+    if re.match(CONFIG.Port_FMT, str(url.port)) is None:
+        if default_port is not None:
+            checked.port = default_port
+        else:
+            checked.port = None
+    # ----------------------------------------------------------------------
+    if isinstance(checked.fragment, URL):
+        checked.fragment = checked.fragment.check
+    return checked.to_fields()
+
+
+def url_cache_info() -> dict:
+    """
+    URL 解析与校验缓存的命中统计
+    :return: dict  # {"parse": {"hits", "misses", "size"}, "check": {...}}
+    """
+    info = {}
+    for name in ["parse", "check"]:
+        cache_info = url_cached(name).cache_info()
+        info[name] = {
+            "hits": cache_info.hits,
+            "misses": cache_info.misses,
+            "size": cache_info.currsize,
+            "max_size": cache_info.maxsize,
+        }
+    return info
+
+
+def url_cache_clear():
+    url_cached("parse").cache_clear()
+    url_cached("check").cache_clear()
+
+
 def url_null_keep(item: object, item_type: classmethod = str) -> object:
     if item is None:
         return None
@@ -19,3 +19,4 @@ from Babelor.Presentation.Case import CASE
 from Babelor.Presentation.UniformResourceIdentifier import URL
 from Babelor.Presentation.Datum import DATUM
 from Babelor.Presentation.Arguments import ARGS
+from Babelor.Presentation.Route import ROUTE
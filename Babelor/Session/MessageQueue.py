@@ -14,141 +14,817 @@
 # limitations under the License.
 
 # System Required
+import os
 import time
+import struct
+import asyncio
 import logging
-from multiprocessing import Queue, Process, Pipe
+import tempfile
+import threading
+from itertools import count as counter
+from collections import deque, OrderedDict
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait as connection_wait
+from multiprocessing.sharedctypes import RawArray
 # Outer Required
 import zmq
+import zmq.asyncio
 # Inner Required
 from Babelor.Presentation import MSG, URL
+from Babelor.Session.Spool import SPOOL
 # Global Parameters
 from Babelor.Config import CONFIG
 
 
-def first_out_last_in(conn: str, me: str, queue_ctrl: Queue, pipe_in: Pipe, pipe_out: Pipe):
+def msg_to_frames(msg: MSG) -> list:
     """
-    # 先出后进 / 只出
-    # 控制信号 --> 输出队列 --> 输出队列 --> 反馈信号 --> 输入队列
+    # 单帧：整个消息包；多帧：消息头及数据索引 + 原始数据流（零拷贝）
+    :param msg: MSG             # 消息包
+    :return: list               # 帧
+    """
+    if CONFIG.MQ_MULTIPART:
+        return msg.to_frames()
+    else:
+        return [msg.to_bytes()]
+
+
+def frames_to_msg(frames: list) -> MSG:
+    """
+    # 兼容单帧与多帧，多帧数据流以 memoryview 引用，不做 base64 解码
+    :param frames: list         # zmq.Frame，或持久化缓冲回放的 bytes
+    :return: MSG
+    """
+    msg = MSG()
+    if isinstance(frames[0], bytes):
+        msg.from_frames(frames)
+    else:
+        msg.from_frames([frames[0].bytes] + [frame.buffer for frame in frames[1:]])
+    return msg
+
+
+BATCH_MARK = b"\x00babelor.batch:"     # 批量帧头标识，后接各消息帧数 "<n>,<n>,..."
+
+
+def msgs_to_frames(msgs: list) -> list:
+    """
+    # 批量：帧 0 为批量标识及各消息帧数，其后依次为各消息的帧，作为一个多帧消息发送
+    :param msgs: list           # [MSG, ]
+    :return: list               # 帧
+    """
+    return join_frames([msg_to_frames(msg) for msg in msgs])
+
+
+def join_frames(frames_list: list) -> list:
+    """
+    :param frames_list: list    # [各消息的帧, ]
+    :return: list               # 批量帧
+    """
+    frames = []
+    counts = []
+    for msg_frames in frames_list:
+        counts.append(str(len(msg_frames)))
+        frames.extend(msg_frames)
+    return [BATCH_MARK + ",".join(counts).encode("ascii")] + frames
+
+
+def split_frames(frames: list) -> list:
+    """
+    # 兼容单条与批量，批量拆分为各消息的帧
+    :param frames: list         # zmq.Frame
+    :return: list               # [各消息的帧, ]
+    """
+    head = frames[0].bytes
+    if not head.startswith(BATCH_MARK):
+        return [frames]
+    frames_list = []
+    start = 1
+    for count in head[len(BATCH_MARK):].decode("ascii").split(","):
+        frames_list.append(frames[start:start + int(count)])
+        start += int(count)
+    return frames_list
+
+
+def frames_to_msgs(frames: list) -> list:
+    """
+    # 兼容单条与批量，批量透明拆分
+    :param frames: list         # zmq.Frame
+    :return: list               # [MSG, ]
+    """
+    return [frames_to_msg(msg_frames) for msg_frames in split_frames(frames)]
+
+
+ERROR_MARK = b"\x00babelor.error"       # 应答错误帧头，后接帧 "<异常类型>: <异常描述>"
+
+
+def error_to_frames(error: Exception) -> list:
+    """
+    # 应答函数出错时回传错误帧，请求方据此抛出异常，而非把请求原样当作应答
+    :param error: Exception     # 应答函数抛出的异常
+    :return: list               # 帧
+    """
+    return [ERROR_MARK, "{0}: {1}".format(type(error).__name__, error).encode(CONFIG.Coding)]
+
+
+def reply_to_msg(frames: list, conn: URL) -> MSG:
+    """
+    :param frames: list         # zmq.Frame，应答帧或错误帧
+    :param conn: URL            # 应答端点，用于异常描述
+    :return: MSG                # 错误帧抛出 RuntimeError
+    """
+    if frames[0].bytes == ERROR_MARK:
+        raise RuntimeError("ZMQ::ROUTER::{0} reply error:{1}".format(conn, frames[1].bytes.decode(CONFIG.Coding)))
+    return frames_to_msg(frames)
+
+
+def send_msgs(socket: zmq.Socket, msgs: list):
+    """
+    :param socket: zmq.Socket   # 套接字
+    :param msgs: list           # [MSG, ]
+    :return: int                # 帧数量
+    """
+    frames = msgs_to_frames(msgs)
+    socket.send_multipart(frames, copy=False)
+    return len(frames)
+
+
+def recv_msgs(socket: zmq.Socket) -> list:
+    """
+    :param socket: zmq.Socket   # 套接字
+    :return: list               # [MSG, ]
+    """
+    return frames_to_msgs(socket.recv_multipart(copy=False))
+
+
+def send_msg(socket: zmq.Socket, msg: MSG):
+    """
+    :param socket: zmq.Socket   # 套接字
+    :param msg: MSG             # 消息包
+    :return: int                # 帧数量
+    """
+    frames = msg_to_frames(msg)
+    socket.send_multipart(frames, copy=False)
+    return len(frames)
+
+
+def recv_msg(socket: zmq.Socket):
+    """
+    :param socket: zmq.Socket   # 套接字
+    :return: MSG
+    """
+    return frames_to_msg(socket.recv_multipart(copy=False))
+
+
+def hwm_socket(context: zmq.Context, socket_type: int, hwm: dict = None) -> zmq.Socket:
+    """
+    # 创建套接字并设置高水位（须在 connect/bind 之前设置）
+    :param context: zmq.Context # 上下文
+    :param socket_type: int     # zmq.PUSH, zmq.PULL, ...
+    :param hwm: dict            # {"send": int, "recv": int}，默认 CONFIG.MQ_HWM
+    :return: zmq.Socket
+    """
+    if hwm is None:
+        hwm = CONFIG.MQ_HWM
+    socket = context.socket(socket_type)
+    socket.setsockopt(zmq.SNDHWM, hwm["send"])
+    socket.setsockopt(zmq.RCVHWM, hwm["recv"])
+    if socket_type == zmq.PUB:
+        # 达到高水位时不静默丢弃，由发送缓冲按溢出策略处理并计数
+        socket.setsockopt(zmq.XPUB_NODROP, 1)
+    return socket
+
+
+STATS = ("depth", "dropped", "spilled", "sent", "inflight", "redelivered", "dead")     # 发送缓冲及在途计数项
+
+
+class Outbox:
+    def __init__(self, socket: zmq.Socket, overflow: dict = None, stats: RawArray = None):
+        """
+        # 发送缓冲：套接字达到高水位时按溢出策略处理
+        # "block" 阻塞等待；"drop-oldest" 丢弃最早消息；"drop-newest" 丢弃新消息；"spill" 溢出到磁盘，可写时按序回放
+        :param socket: zmq.Socket   # 套接字
+        :param overflow: dict       # {"policy": str, "depth": int}，默认 CONFIG.MQ_OVERFLOW
+        :param stats: RawArray      # 计数 STATS，可跨进程读取
+        """
+        if overflow is None:
+            overflow = CONFIG.MQ_OVERFLOW
+        self.socket = socket
+        self.policy = overflow["policy"]
+        self.depth = overflow["depth"]
+        if stats is None:
+            self.stats = RawArray("q", len(STATS))
+        else:
+            self.stats = stats
+        self.queue = deque()            # 待发送 [frames, ]
+        self.spill = None               # 溢出文件
+        self.spill_count = 0            # 溢出文件中未回放的消息数
+
+    def offer(self, frames: list):
+        if self.policy in ["block"]:
+            self.socket.send_multipart(frames, copy=False)
+            self.stats[3] += 1
+            return
+        if self.drain():
+            try:
+                self.socket.send_multipart(frames, flags=zmq.NOBLOCK, copy=False)
+                self.stats[3] += 1
+                return
+            except zmq.Again:
+                pass
+        # ----------------------------------------------------------------------
+        if (self.policy in ["spill"]) and ((self.spill_count > 0) or (len(self.queue) >= self.depth)):
+            self._spill(frames)
+        elif len(self.queue) >= self.depth:
+            self.stats[1] += 1
+            if self.policy in ["drop-newest"]:
+                logging.debug("ZMQ::OUTBOX drop newest, dropped:{0}".format(self.stats[1]))
+            else:
+                self.queue.popleft()
+                self.queue.append(frames)
+                logging.debug("ZMQ::OUTBOX drop oldest, dropped:{0}".format(self.stats[1]))
+        else:
+            self.queue.append(frames)
+        self.stats[0] = len(self.queue) + self.spill_count
+
+    def drain(self, timeout: int = 0) -> bool:
+        """
+        # 按序发送缓冲及溢出文件中的消息，直到套接字不可写
+        :param timeout: int         # 不可写时等待的时间（毫秒）
+        :return: bool               # 缓冲是否已清空
+        """
+        deadline = time.time() + timeout / 1000
+        while True:
+            if (len(self.queue) == 0) and (self.spill_count > 0):
+                self._unspill()
+            if len(self.queue) == 0:
+                self.stats[0] = 0
+                return True
+            try:
+                self.socket.send_multipart(self.queue[0], flags=zmq.NOBLOCK, copy=False)
+                self.queue.popleft()
+                self.stats[3] += 1
+            except zmq.Again:
+                wait = int((deadline - time.time()) * 1000)
+                if (wait > 0) and self.socket.poll(wait, zmq.POLLOUT):
+                    continue
+                self.stats[0] = len(self.queue) + self.spill_count
+                return False
+
+    def close(self, timeout: int = None):
+        if timeout is None:
+            timeout = CONFIG.MQ_LINGER
+        if not self.drain(timeout):
+            lost = len(self.queue) + self.spill_count
+            self.stats[1] += lost
+            logging.warning("ZMQ::OUTBOX close with unsent messages dropped:{0}".format(lost))
+            self.queue.clear()
+            self.spill_count = 0
+        if self.spill is not None:
+            self.spill.close()
+            os.remove(self.spill.name)
+            self.spill = None
+
+    def _spill(self, frames: list):
+        # 溢出文件格式：帧数(4) + [帧长(8) + 帧] * 帧数
+        if self.spill is None:
+            self.spill = tempfile.NamedTemporaryFile(prefix="babelor.spill.", delete=False)
+            self.spill_read = 0
+        self.spill.seek(0, os.SEEK_END)
+        self.spill.write(struct.pack("<I", len(frames)))
+        for frame in frames:
+            frame = memoryview(frame)
+            self.spill.write(struct.pack("<Q", frame.nbytes))
+            self.spill.write(frame)
+        self.spill_count += 1
+        self.stats[2] += 1
+
+    def _unspill(self):
+        # 按序读回至多 depth 条消息，读完后清空文件
+        self.spill.flush()
+        self.spill.seek(self.spill_read)
+        while (self.spill_count > 0) and (len(self.queue) < self.depth):
+            count, = struct.unpack("<I", self.spill.read(4))
+            frames = []
+            for i in range(0, count, 1):
+                size, = struct.unpack("<Q", self.spill.read(8))
+                frames.append(self.spill.read(size))
+            self.queue.append(frames)
+            self.spill_count -= 1
+        self.spill_read = self.spill.tell()
+        if self.spill_count == 0:
+            self.spill.seek(0)
+            self.spill.truncate()
+            self.spill_read = 0
+
+
+def idle_wait(spool: SPOOL, timeout: (int, None)) -> (int, None):
+    """
+    # 队列进程轮询超时不超过持久化缓冲下次 fsync 的时间，空闲时也按 MQ_SPOOL_SYNC 间隔 fsync
+    :param spool: SPOOL         # 持久化缓冲，None 为无
+    :param timeout: int         # 轮询超时（毫秒），None 为一直等待
+    :return: (int, None)        # 轮询超时（毫秒）
+    """
+    wait = None if spool is None else spool.idle()
+    if wait is None:
+        return timeout
+    return wait if timeout is None else min(wait, timeout)
+
+
+ACK_MARK = b"\x00babelor.ack"           # 确认帧头，后接帧 "<编号>,<编号>,..."
+NACK_MARK = b"\x00babelor.nack"         # 否认帧头，发送端立即重发
+
+
+def send_acks(socket: zmq.Socket, acks: dict, mark: bytes = ACK_MARK):
+    """
+    # 按发送端身份批量确认/否认，每个发送端一帧
+    :param socket: zmq.Socket   # ROUTER
+    :param acks: dict           # {身份: [编号, ]}
+    :param mark: bytes          # ACK_MARK, NACK_MARK
+    """
+    for identity, ids in acks.items():
+        socket.send_multipart([identity, mark, b",".join(ids)])
+
+
+def recv_tokens(socket: zmq.Socket, spool: SPOOL = None) -> tuple:
+    """
+    # 可靠模式接收：ROUTER 收到 [身份, "<编号>,<编号>,...", 消息帧 或 批量帧]
+    # 有持久化缓冲时写入后立即向发送端确认，确认标识为序号；否则为 (身份, 编号)，由调用者确认
+    :param socket: zmq.Socket   # ROUTER
+    :param spool: SPOOL         # 持久化缓冲
+    :return: (list, list)       # ([确认标识, ], [MSG, ])
+    """
+    frames = socket.recv_multipart(copy=False)
+    identity, ids, frames_list = frames[0].bytes, frames[1].bytes.split(b","), split_frames(frames[2:])
+    if spool is None:
+        tokens = [(identity, msg_id) for msg_id in ids]
+    else:
+        tokens = [spool.append(msg_frames) for msg_frames in frames_list]
+        send_acks(socket, {identity: ids})
+    return tokens, [frames_to_msg(msg_frames) for msg_frames in frames_list]
+
+
+class Inflight:
+    def __init__(self, socket: zmq.Socket, outbox: Outbox, reliable: dict, spool: SPOOL = None,
+                 stats: RawArray = None):
+        """
+        # 可靠发送：在途表按消息编号记录，收到确认后移除；可见性超时或收到否认后重发，超过重试次数放弃
+        :param socket: zmq.Socket   # DEALER
+        :param outbox: Outbox       # 发送缓冲
+        :param reliable: dict       # {"timeout": int(毫秒), "retries": int, "batch": int}
+        :param spool: SPOOL         # 持久化缓冲，编号即序号，确认或放弃后在持久化缓冲中确认
+        :param stats: RawArray      # 计数 STATS
+        """
+        self.socket = socket
+        self.outbox = outbox
+        self.timeout = reliable["timeout"] / 1000
+        self.retries = reliable["retries"]
+        self.spool = spool
+        if stats is None:
+            self.stats = RawArray("q", len(STATS))
+        else:
+            self.stats = stats
+        self.table = OrderedDict()      # 在途 {编号: [帧, 超时时刻, 重发次数]}，按超时时刻先后排列
+        self.sequence = counter(1)      # 无持久化缓冲时的消息编号
+
+    def send(self, frames_list: list, batch: bool, seqs: list = None):
+        """
+        :param frames_list: list    # [各消息的帧, ]
+        :param batch: bool          # 是否作为一个批量发出
+        :param seqs: list           # 持久化缓冲序号，作为消息编号；None 为自动编号
+        """
+        if seqs is None:
+            ids = [str(next(self.sequence)).encode("ascii") for i in range(0, len(frames_list), 1)]
+        else:
+            ids = [str(seq).encode("ascii") for seq in seqs]
+        self.outbox.offer([b",".join(ids)] + (join_frames(frames_list) if batch else frames_list[0]))
+        deadline = time.time() + self.timeout
+        for msg_id, msg_frames in zip(ids, frames_list):
+            self.table[msg_id] = [msg_frames, deadline, 0]
+        self.service()
+
+    def service(self, timeout: int = 0):
+        """
+        # 处理到达的确认/否认，重发超时消息
+        :param timeout: int         # 等待确认的时间（毫秒）
+        """
+        self.outbox.drain()
+        while self.socket.poll(timeout, zmq.POLLIN):
+            timeout = 0
+            mark, ids = self.socket.recv_multipart()
+            ids = ids.split(b",")
+            if mark == ACK_MARK:
+                acked = [msg_id for msg_id in ids if self.table.pop(msg_id, None) is not None]
+                if (self.spool is not None) and (len(acked) > 0):
+                    self.spool.ack([int(msg_id) for msg_id in acked])
+            else:
+                now = time.time()
+                for msg_id in ids:
+                    if msg_id in self.table.keys():
+                        self._redeliver(msg_id, now)
+        now = time.time()
+        while len(self.table) > 0:
+            msg_id, entry = next(iter(self.table.items()))
+            if entry[1] > now:
+                break
+            self._redeliver(msg_id, now)
+        self.stats[4] = len(self.table)
+
+    def _redeliver(self, msg_id: bytes, now: float):
+        msg_frames, deadline, retries = self.table.pop(msg_id)
+        if retries >= self.retries:
+            self.stats[6] += 1
+            logging.warning("ZMQ::INFLIGHT give up:{0} retries:{1} dead:{2}".format(msg_id, retries, self.stats[6]))
+            if self.spool is not None:
+                self.spool.ack([int(msg_id)])
+            return
+        self.outbox.offer([msg_id] + msg_frames)
+        self.table[msg_id] = [msg_frames, now + self.timeout, retries + 1]
+        self.stats[5] += 1
+        logging.debug("ZMQ::INFLIGHT redeliver:{0} retries:{1}".format(msg_id, retries + 1))
+
+    def close(self, timeout: int = None):
+        """
+        # 等待在途消息确认，超时后未确认的消息留在持久化缓冲中（如有），下次启动时重发
+        """
+        if timeout is None:
+            timeout = CONFIG.MQ_LINGER
+        deadline = time.time() + timeout / 1000
+        while len(self.table) > 0:
+            wait = int((deadline - time.time()) * 1000)
+            if wait <= 0:
+                logging.warning("ZMQ::INFLIGHT close with unacked:{0}".format(len(self.table)))
+                break
+            self.service(min(wait, CONFIG.MQ_POLL_TIME))
+        self.table.clear()
+        self.stats[4] = 0
+
+
+def bind_socket(socket: zmq.Socket, conn: str, timeout: int = None):
+    """
+    # 绑定端点；刚关闭的套接字由 I/O 线程异步释放端点，切换模式后立即重新绑定时短暂重试
+    :param socket: zmq.Socket   # 套接字
+    :param conn: str            # 端点
+    :param timeout: int         # 重试期限（毫秒），默认 CONFIG.MQ_POLL_TIME
+    """
+    if timeout is None:
+        timeout = CONFIG.MQ_POLL_TIME
+    deadline = time.time() + timeout / 1000
+    while True:
+        try:
+            socket.bind(conn)
+            return
+        except zmq.ZMQError as e:
+            if (e.errno != zmq.EADDRINUSE) or (time.time() >= deadline):
+                raise
+            time.sleep(CONFIG.MQ_BLOCK_TIME)
+
+
+def direct_socket(context: zmq.Context, conn: str, me: str, hwm: dict = None, reliable: bool = False) -> zmq.Socket:
+    """
+    # 直连模式套接字，在调用者进程/线程内收发
+    :param context: zmq.Context # 上下文
     :param conn: str            # 套接字    "tcp://<hostname>:<port>"
-    :param me: str              # 传输方式  ["REQUEST", "SUBSCRIBE", "PUSH"]
-    :param queue_ctrl: Queue    # 控制队列  ("is_active",):(bool,)
-    :param pipe_in: Pipe        # 输入队列  ("msg_in",):(MSG,)
-    :param pipe_out: Pipe       # 输出队列  ("msg_out",):(MSG,)
-    :return: None
+    :param me: str              # 传输方式  ["REQUEST", "SUBSCRIBE", "PUSH", "REPLY", "PUBLISH", "PULL"]
+    :param hwm: dict            # 高水位 {"send": int, "recv": int}
+    :param reliable: bool       # 可靠模式，PUSH/PULL 使用 DEALER/ROUTER 以回传确认
+    :return: zmq.Socket
     """
-    context = zmq.Context()
-    # ------- REQUEST ----------------------------
+    # ------- FOLI: connect ----------------------
     if me in ["REQUEST"]:
-        socket = context.socket(zmq.REQ)
+        socket = hwm_socket(context, zmq.REQ, hwm)
         socket.connect(conn)
-        handshake, has_response = 0, True
-    # ------- SUBSCRIBE --------------------------
     elif me in ["SUBSCRIBE"]:
-        socket = context.socket(zmq.SUB)
+        socket = hwm_socket(context, zmq.SUB, hwm)
+        socket.setsockopt(zmq.SUBSCRIBE, b"")
         socket.connect(conn)
-        handshake, has_response = 1, True
-    # ------- PUSH ------------------------------
     elif me in ["PUSH"]:
-        socket = context.socket(zmq.PUSH)
+        socket = hwm_socket(context, zmq.DEALER if reliable else zmq.PUSH, hwm)
         socket.connect(conn)
-        handshake, has_response = 0, False
-    # ------- DEFAULT: PUSH ---------------------
+    # ------- FILO: bind -------------------------
+    elif me in ["REPLY"]:
+        socket = hwm_socket(context, zmq.REP, hwm)
+        bind_socket(socket, conn)
+    elif me in ["PUBLISH"]:
+        socket = hwm_socket(context, zmq.PUB, hwm)
+        bind_socket(socket, conn)
+    # ------- DEFAULT: PULL ----------------------
     else:
-        socket = context.socket(zmq.PUSH)
-        socket.connect(conn)
-        handshake, has_response = 0, False
-    logging.debug("ZMQ::FOLI::{0} connect:{1}".format(me, conn))
-    # ------------------------------------- QUEUE
-    is_active = queue_ctrl.get()
-    while is_active:
-        if queue_ctrl.empty():
-            # SEND --------------------------------
-            if handshake == 1:
-                socket.setsockopt(zmq.SUBSCRIBE, '')
-                logging.debug("ZMQ::FOLI::{0}::{1} send:{2}".format(me, conn, "zmq.SUBSCRIBE"))
-            else:
-                try:
-                    msg_out = pipe_out.recv()
-                    logging.debug("ZMQ::FOLI::{0}::{1}::PIPE OUT recv:{2}".format(me, conn, msg_out))
-                    message_out = str(msg_out).encode(CONFIG.Coding)
-                    socket.send(message_out)
-                    logging.debug("ZMQ::FOLI::{0}::{1} send:{2}".format(me, conn, message_out))
-                except EOFError:
-                    is_active = False
-            # RECV --------------------------------
-            if has_response:
-                message_in = socket.recv()
-                logging.debug("ZMQ::FOLI::{0}::{1} recv:{2}".format(me, conn, message_in))
-                msg_in = MSG(message_in.decode(CONFIG.Coding))
-                pipe_in.send(msg_in)
-                logging.debug("ZMQ::FOLI::{0}::{1}::PIPE IN send:{2}".format(me, conn, msg_in))
-        else:
-            is_active = queue_ctrl.get()
+        socket = hwm_socket(context, zmq.ROUTER if reliable else zmq.PULL, hwm)
+        bind_socket(socket, conn)
+    logging.debug("ZMQ::DIRECT::{0} open:{1}".format(me, conn))
+    return socket
+
+
+def split_envelope(frames: list) -> tuple:
+    """
+    # ROUTER/DEALER 信封：空帧之前为路由信封（身份、关联编号），之后为消息帧
+    :param frames: list         # zmq.Frame
+    :return: (list, list)       # (信封 bytes, 消息帧)
+    """
+    for i, frame in enumerate(frames):
+        if len(frame.buffer) == 0:
+            return [frame.bytes for frame in frames[:i]], frames[i + 1:]
+    return [], frames
+
+
+router_sequence = counter()     # 代理后端 inproc 端点编号
+process_lock = threading.Lock()     # 多线程同时新建队列进程时，子进程会继承彼此的进程哨兵管道，须逐个新建
+
+
+def router_broker(frontend: zmq.Socket, backend: zmq.Socket, control: zmq.Socket):
+    """
+    # 代理：ROUTER 前端（请求方）<--> DEALER 后端（应答线程），收到 TERMINATE 后退出
+    :param frontend: zmq.Socket # ROUTER
+    :param backend: zmq.Socket  # DEALER
+    :param control: zmq.Socket  # PAIR
+    :return: None
+    """
+    try:
+        zmq.proxy_steerable(frontend, backend, None, control)
+    except zmq.ZMQError as e:
+        logging.warning("ZMQ::ROUTER::BROKER stop:{0}".format(e))
+    finally:
+        frontend.close(linger=0)
+        backend.close(linger=0)
+        control.close(linger=0)
+
+
+def router_worker(mq, backend: str):
+    """
+    # 应答线程：REP 连接代理后端，信封由 REP 自动保留，应答可乱序返回
+    :param mq: ZMQ              # 所属 ZMQ，读取 reply_func / stop / served
+    :param backend: str         # 代理后端 inproc 端点
+    :return: None
+    """
+    socket = zmq.Context.instance().socket(zmq.REP)
+    socket.connect(backend)
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+    while not mq.stop.is_set():
+        if poller.poll(CONFIG.MQ_POLL_TIME):
+            msg_in = recv_msg(socket)
+            try:
+                frames_out = msg_to_frames(mq.reply_func(msg_in))
+            except Exception as e:
+                logging.exception("ZMQ::ROUTER::{0} reply func error:{1}".format(mq.conn, e))
+                frames_out = error_to_frames(e)
+            socket.send_multipart(frames_out, copy=False)
+            logging.debug("ZMQ::ROUTER::{0} send frames:{1}".format(mq.conn, len(frames_out)))
+            mq.served.release()
+    socket.close(linger=0)
+
+
+def stop_process(process: Process, pipe_ctrl: Pipe, timeout: int = None, pipe_in: Pipe = None) -> bool:
+    """
+    # 通知子进程在期限内排空并退出；等待期间丢弃其仍在送出的消息，以免子进程阻塞在管道上；超过期限才终止
+    :param process: Process     # 子进程
+    :param pipe_ctrl: Pipe      # 控制管道（父进程端），发送关闭期限；None 为调用者已发出（同时关闭多个子进程）
+    :param timeout: int         # 关闭期限（毫秒），默认 CONFIG.MQ_LINGER
+    :param pipe_in: Pipe        # 子进程送出消息的管道（父进程端），None 为不丢弃
+    :return: bool               # 是否在期限内正常退出
+    """
+    if timeout is None:
+        timeout = CONFIG.MQ_LINGER
+    if pipe_ctrl is not None:
+        pipe_ctrl.send(timeout)
+    # 子进程最长在一个轮询周期后察觉关闭信号
+    deadline = time.time() + (timeout + CONFIG.MQ_POLL_TIME) / 1000
+    waits = [process.sentinel] if pipe_in is None else [process.sentinel, pipe_in]
+    is_stopped = False
+    while not is_stopped:
+        wait = deadline - time.time()
+        if wait <= 0:
+            break
+        ready = connection_wait(waits, wait)
+        if process.sentinel in ready:
+            is_stopped = True
+        elif pipe_in in ready:
+            pipe_in.recv()
+    if not is_stopped:
+        logging.warning("PROCESS::{0} terminate after:{1}ms".format(process.name, timeout))
+        process.terminate()
+    process.join()
+    while (pipe_in is not None) and pipe_in.poll(0):
+        pipe_in.recv()
+    return is_stopped
+
+
+def first_out_last_in(conn: str, me: str, pipe_ctrl: Pipe, pipe_in: Pipe, pipe_out: Pipe,
+                      hwm: dict = None, overflow: dict = None, stats: RawArray = None, spool: str = None,
+                      reliable: dict = None):
+    """
+    # 先出后进 / 只出
+    # 轮询 控制管道 + 输出队列 + 套接字：输出队列 --> 套接字 --> 输入队列；收到关闭期限后排空在途消息并退出
+    :param conn: str            # 套接字    "tcp://<hostname>:<port>"
+    :param me: str              # 传输方式  ["REQUEST", "SUBSCRIBE", "PUSH"]
+    :param pipe_ctrl: Pipe      # 控制管道  (关闭期限[毫秒],)
+    :param pipe_in: Pipe        # 输入队列  ("msg_in",):(MSG,)
+    :param pipe_out: Pipe       # 输出队列  ("msg_out",):(MSG,)
+    :param hwm: dict            # 高水位    {"send": int, "recv": int}
+    :param overflow: dict       # 溢出策略  {"policy": str, "depth": int}
+    :param stats: RawArray      # 发送缓冲计数 STATS
+    :param spool: str           # 持久化缓冲目录，PUSH 输出队列为 (序号列表, MSG 或 [MSG, ])，收到对端确认后确认
+    :param reliable: dict       # 确认重发 {"timeout": int, "retries": int, "batch": int}，PUSH 使用 DEALER
+    :return: None
+    """
+    if me not in ["REQUEST", "SUBSCRIBE"]:
+        me = "PUSH"
+    context = zmq.Context()
+    socket = direct_socket(context, conn, me, hwm, (reliable is not None) and (me in ["PUSH"]))
+    has_response = me in ["REQUEST", "SUBSCRIBE"]
+    if has_response:
+        outbox = None
+    else:
+        outbox = Outbox(socket, overflow, stats)
+    if spool is not None:
+        spool = SPOOL(spool)
+    if (reliable is None) or (me not in ["PUSH"]):
+        inflight = None
     else:
-        queue_ctrl.close()
+        # 可靠模式：收到对端确认后才在持久化缓冲中确认
+        inflight = Inflight(socket, outbox, reliable, spool, stats)
+
+    def send_out(msg_out):
+        seqs = None
+        if spool is not None:
+            seqs, msg_out = msg_out
+        if inflight is not None:
+            msgs_out = msg_out if isinstance(msg_out, list) else [msg_out]
+            inflight.send([msg_to_frames(msg) for msg in msgs_out], isinstance(msg_out, list), seqs)
+            logging.debug("ZMQ::FOLI::{0}::{1} send inflight:{2}".format(me, conn, len(msgs_out)))
+            return
+        if isinstance(msg_out, list):
+            logging.debug("ZMQ::FOLI::{0}::{1}::PIPE OUT recv batch:{2}".format(me, conn, len(msg_out)))
+            frames_out = msgs_to_frames(msg_out)
+        else:
+            logging.debug("ZMQ::FOLI::{0}::{1}::PIPE OUT recv:{2}".format(me, conn, msg_out))
+            frames_out = msg_to_frames(msg_out)
+        if outbox is None:
+            socket.send_multipart(frames_out, copy=False)
+        else:
+            outbox.offer(frames_out)
+        logging.debug("ZMQ::FOLI::{0}::{1} send frames:{2}".format(me, conn, len(frames_out)))
+
+    poller = zmq.Poller()
+    poller.register(pipe_ctrl.fileno(), zmq.POLLIN)
+    if me not in ["SUBSCRIBE"]:
+        poller.register(pipe_out.fileno(), zmq.POLLIN)
+    if has_response or (inflight is not None):
+        poller.register(socket, zmq.POLLIN)
+    logging.debug("ZMQ::FOLI::{0} connect:{1}".format(me, conn))
+    # ------------------------------------- POLL
+    timeout = None
+    while timeout is None:
+        # 发送缓冲未清空或有在途消息时定时唤醒，继续发送及超时重发
+        is_busy = ((outbox is not None) and (not outbox.drain())) or ((inflight is not None) and
+                                                                    (len(inflight.table) > 0))
+        events = dict(poller.poll(idle_wait(spool, CONFIG.MQ_POLL_TIME if is_busy else None)))
+        if pipe_ctrl.fileno() in events.keys():
+            timeout = pipe_ctrl.recv()
+            logging.debug("ZMQ::FOLI::{0}::{1} stop within:{2}ms".format(me, conn, timeout))
+            continue
+        if inflight is not None:
+            inflight.service()
+        # SEND --------------------------------
+        if pipe_out.fileno() in events.keys():
+            send_out(pipe_out.recv())
+        # RECV --------------------------------
+        if has_response and (socket in events.keys()):
+            msg_in = recv_msg(socket)
+            logging.debug("ZMQ::FOLI::{0}::{1} recv:{2}".format(me, conn, msg_in))
+            pipe_in.send(msg_in)
+            logging.debug("ZMQ::FOLI::{0}::{1}::PIPE IN send:{2}".format(me, conn, msg_in))
+    # ------------------------------------- DRAIN
+    # 关闭信号之前已交给队列进程的消息照常发出，在途消息在期限内等待发送/确认
+    deadline = time.time() + timeout / 1000
+    while (me in ["PUSH"]) and pipe_out.poll(0):
+        send_out(pipe_out.recv())
+    if inflight is not None:
+        inflight.close(max(0, int((deadline - time.time()) * 1000)))
+    if spool is not None:
+        spool.close()
+    if outbox is not None:
+        outbox.close(max(0, int((deadline - time.time()) * 1000)))
+    socket.close(linger=max(0, int((deadline - time.time()) * 1000)))
+    context.term()
+    logging.debug("ZMQ::FOLI::{0}::{1} stopped".format(me, conn))
 
 
-def first_in_last_out(conn: str, me: str, queue_ctrl: Queue, pipe_in: Pipe, pipe_out: Pipe):
+def first_in_last_out(conn: str, me: str, pipe_ctrl: Pipe, pipe_in: Pipe, pipe_out: Pipe,
+                      hwm: dict = None, overflow: dict = None, stats: RawArray = None, spool: str = None,
+                      reliable: dict = None):
     """
     # 先进后出 / 只进
-    # 控制信号（启动）--> 输入队列（推入）--> 控制信号（需反馈）--> 输出队列（推出）
+    # 轮询 控制管道 + 套接字 + 输出队列：套接字 --> 输入队列；输出队列（应答/发布/确认）--> 套接字；
+    # 收到关闭期限后排空在途消息并退出
     :param conn: str            # 套接字
-    :param me: str              # 传输方式 ( "REPLY", "SUBSCRIBE", "PULL")
-    :param queue_ctrl: Queue    # 控制队列 ("is_active", "is_response"):(bool, bool)
+    :param me: str              # 传输方式 ( "REPLY", "PUBLISH", "PULL")
+    :param pipe_ctrl: Pipe      # 控制管道 (关闭期限[毫秒],)
     :param pipe_in: Pipe        # 输入队列 (MSG,)
     :param pipe_out: pipe       # 输出队列 (MSG,)
+    :param hwm: dict            # 高水位   {"send": int, "recv": int}
+    :param overflow: dict       # 溢出策略 {"policy": str, "depth": int}
+    :param stats: RawArray      # 发送缓冲计数 STATS
+    :param spool: str           # 持久化缓冲目录，PULL 收到即写入并向发送端确认，输入队列为 (序号列表, MSG 或 [MSG, ])
+    :param reliable: dict       # 确认重发，PULL 使用 ROUTER，输入队列为 (确认标识列表, MSG 或 [MSG, ])，
+                                # 输出队列为 (ACK_MARK 或 NACK_MARK, {身份: [编号, ]})
     :return: None
     """
+    if me not in ["REPLY", "PUBLISH"]:
+        me = "PULL"
+    if me not in ["PULL"]:
+        reliable = None
     context = zmq.Context()
-    # ------- REPLY ----------------------------
-    if me in ["REPLY"]:
-        socket = context.socket(zmq.REP)
-        socket.bind(conn)
-        has_response = True
-    # ------- REPLY ----------------------------
-    elif me in ["PUBLISH"]:
-        socket = context.socket(zmq.PUB)
-        socket.bind(conn)
-        has_response = False
-    # ------- PULL -----------------------------
-    elif me in ["PULL"]:
-        socket = context.socket(zmq.PULL)
-        socket.bind(conn)
-        has_response = False
-    # ------- DEFAULT: PULL -----------------------------
+    socket = direct_socket(context, conn, me, hwm, reliable is not None)
+    if me in ["PUBLISH"]:
+        outbox = Outbox(socket, overflow, stats)
     else:
-        socket = context.socket(zmq.PULL)
-        socket.bind(conn)
-        has_response = False
+        outbox = None
+    if spool is not None:
+        spool = SPOOL(spool)
+
+    def send_out(msg_out):
+        if reliable is not None:
+            mark, acks = msg_out
+            send_acks(socket, acks, mark)
+        elif outbox is not None:
+            frames_out = msgs_to_frames(msg_out) if isinstance(msg_out, list) else msg_to_frames(msg_out)
+            outbox.offer(frames_out)
+            logging.debug("ZMQ::FILO::{0}::{1} send frames:{2}".format(me, conn, len(frames_out)))
+        else:
+            logging.debug("ZMQ::FILO::{0}::{1}::PIPE OUT recv:{2}".format(me, conn, msg_out))
+            frames_out = send_msg(socket, msg_out)
+            logging.debug("ZMQ::FILO::{0}::{1} send frames:{2}".format(me, conn, frames_out))
+
+    has_out = (me in ["REPLY", "PUBLISH"]) or (reliable is not None)     # 输出队列：应答、发布消息或调用者的确认
+    poller = zmq.Poller()
+    poller.register(pipe_ctrl.fileno(), zmq.POLLIN)
+    if has_out:
+        poller.register(pipe_out.fileno(), zmq.POLLIN)
+    if me not in ["PUBLISH"]:
+        poller.register(socket, zmq.POLLIN)
     logging.debug("ZMQ::FILO::{0} bind:{1}".format(me, conn))
-    # ------------------------------------- QUEUE
-    is_active = queue_ctrl.get()
-    while is_active:
-        if queue_ctrl.empty():
-            # RECV --------------------------------
-            message_in = socket.recv()
-            logging.debug("ZMQ::FILO::{0}::{1} recv:{2}".format(me, conn, message_in))
-            msg_in = MSG(message_in.decode(CONFIG.Coding))
-            pipe_in.send(msg_in)
-            logging.debug("ZMQ::FILO::{0}::{1}::PIPE IN send:{2}".format(me, conn, msg_in))
-            # SEND --------------------------------
-            if has_response:
-                try:
-                    msg_out = pipe_out.recv()
-                    logging.debug("ZMQ::FILO::{0}::{1}::PIPE OUT recv:{2}".format(me, conn, msg_out))
-                    message_out = str(msg_out).encode(CONFIG.Coding)
-                    socket.send(message_out)
-                    logging.debug("ZMQ::FILO::{0}::{1} send:{2}".format(me, conn, message_out))
-                except EOFError:
-                    is_active = False
-        else:
-            is_active = queue_ctrl.get()
-    else:
-        queue_ctrl.close()
+    # ------------------------------------- POLL
+    timeout = None
+    while timeout is None:
+        is_busy = (outbox is not None) and (not outbox.drain())
+        events = dict(poller.poll(idle_wait(spool, CONFIG.MQ_POLL_TIME if is_busy else None)))
+        if pipe_ctrl.fileno() in events.keys():
+            timeout = pipe_ctrl.recv()
+            logging.debug("ZMQ::FILO::{0}::{1} stop within:{2}ms".format(me, conn, timeout))
+            continue
+        # SEND --------------------------------
+        if pipe_out.fileno() in events.keys():
+            send_out(pipe_out.recv())
+        # RECV --------------------------------
+        if socket not in events.keys():
+            continue
+        if reliable is not None:
+            tokens, msgs_in = recv_tokens(socket, spool)
+            logging.debug("ZMQ::FILO::{0}::{1} recv reliable:{2}".format(me, conn, len(tokens)))
+            pipe_in.send((tokens, msgs_in if len(msgs_in) > 1 else msgs_in[0]))
+        else:
+            msgs_in = recv_msgs(socket)
+            if len(msgs_in) > 1:
+                # 批量整体经管道传递     batch is piped as one list
+                logging.debug("ZMQ::FILO::{0}::{1} recv batch:{2}".format(me, conn, len(msgs_in)))
+                pipe_in.send(msgs_in)
+            else:
+                logging.debug("ZMQ::FILO::{0}::{1} recv:{2}".format(me, conn, msgs_in[0]))
+                pipe_in.send(msgs_in[0])
+                logging.debug("ZMQ::FILO::{0}::{1}::PIPE IN send:{2}".format(me, conn, msgs_in[0]))
+    # ------------------------------------- DRAIN
+    # 关闭信号之前的确认、应答、发布消息照常发出；已到达套接字的消息写入持久化缓冲（如有），下次启动时回放
+    deadline = time.time() + timeout / 1000
+    while has_out and pipe_out.poll(0):
+        send_out(pipe_out.recv())
+    while (spool is not None) and socket.poll(0, zmq.POLLIN):
+        recv_tokens(socket, spool)
+    if spool is not None:
+        spool.close()
+    if outbox is not None:
+        outbox.close(max(0, int((deadline - time.time()) * 1000)))
+    socket.close(linger=max(0, int((deadline - time.time()) * 1000)))
+    context.term()
+    logging.debug("ZMQ::FILO::{0}::{1} stopped".format(me, conn))
 
 
 class ZMQ:
-    def __init__(self, conn: (URL, str)):
+    def __init__(self, conn: (URL, str), direct: bool = None, router: bool = None, workers: int = None,
+                 batch: dict = None, hwm: dict = None, overflow: dict = None, spool: str = None,
+                 reliable: dict = None):
+        """
+        :param conn: (URL, str)     # 套接字    "tcp://<hostname>:<port>"
+        :param direct: bool         # 直连模式（套接字在调用者进程内），默认 CONFIG.MQ_DIRECT
+        :param router: bool         # 请求应答使用 ROUTER/DEALER 并发模式，默认 CONFIG.MQ_ROUTER
+        :param workers: int         # ROUTER 模式应答线程数，默认 CONFIG.MQ_WORKERS
+        :param batch: dict          # PUSH 自动批量 {"size": int, "linger": int(毫秒)}，默认 CONFIG.MQ_BATCH
+        :param hwm: dict            # 高水位 {"send": int, "recv": int}，默认 CONFIG.MQ_HWM
+        :param overflow: dict       # 发送溢出策略 {"policy": str, "depth": int}，默认 CONFIG.MQ_OVERFLOW
+        :param spool: str           # PUSH/PULL 持久化缓冲目录，默认 CONFIG.MQ_SPOOL，None 为不持久化
+        :param reliable: dict       # PUSH/PULL 确认重发 {"timeout": int(毫秒), "retries": int, "batch": int}，
+                                    # 默认 CONFIG.MQ_RELIABLE，None 为不确认；
+                                    # 启用持久化缓冲时默认 CONFIG.MQ_SPOOL_RELIABLE，收到对端确认后才在持久化缓冲中确认
+        """
         if isinstance(conn, str):
             self.conn = URL(conn)
         else:
@@ -156,47 +832,332 @@ class ZMQ:
         # Check
         if self.conn.scheme not in ["tcp", "pgm", "inproc"]:
             raise ValueError("Invalid scheme{0}.".format(self.conn.scheme))
-        self.pipe_in = Pipe()                           # PIPE IN
-        self.pipe_out = Pipe()                          # PIPE OUT
-        self.queue_ctrl = Queue(CONFIG.MQ_MAX_DEPTH)    # QUEUE CTRL
-        self.active = False                             # 激活状态
-        self.initialed = None                           # 初始化模式
-        self.process = None                             # 队列进程
+        if direct is None:
+            self.direct = CONFIG.MQ_DIRECT
+        else:
+            self.direct = direct
+        if self.direct:
+            self.pipe_in = None                             # PIPE IN
+            self.pipe_out = None                            # PIPE OUT
+        else:
+            self.pipe_in = Pipe()                           # PIPE IN
+            self.pipe_out = Pipe()                          # PIPE OUT
+        self.pipe_ctrl = None                               # PIPE CTRL，每次启动队列进程时新建
+        if router is None:
+            self.router = CONFIG.MQ_ROUTER
+        else:
+            self.router = router
+        if workers is None:
+            self.workers = CONFIG.MQ_WORKERS
+        else:
+            self.workers = workers
+        self.active = False                                 # 激活状态
+        self.initialed = None                               # 初始化模式
+        self.process = None                                 # 队列进程
+        self.socket = None                                  # 直连套接字
+        self.sequence = 0                                   # ROUTER 模式请求关联编号
+        self.control = None                                 # ROUTER 模式代理控制套接字
+        self.pool = []                                      # ROUTER 模式代理及应答线程
+        self.stop = None                                    # ROUTER 模式停止信号
+        self.served = None                                  # ROUTER 模式已应答计数
+        self.reply_func = None                              # ROUTER 模式应答函数
+        if batch is None:
+            self.batch = CONFIG.MQ_BATCH
+        else:
+            self.batch = batch
+        self.batched = []                                   # 自动批量待发送消息
+        self.batch_timer = None                             # 自动批量等待计时
+        self.batch_lock = threading.Lock()                  # 自动批量发送锁（计时线程与调用者共用套接字）
+        self.buffer = deque()                               # 批量接收后待取出消息
+        if hwm is None:
+            self.hwm = CONFIG.MQ_HWM
+        else:
+            self.hwm = hwm
+        if overflow is None:
+            self.overflow = CONFIG.MQ_OVERFLOW
+        else:
+            self.overflow = overflow
+        self.outbox = None                                  # 直连模式发送缓冲
+        self.counters = RawArray("q", len(STATS))           # 发送缓冲计数，队列进程共享
+        if spool is None:
+            self.spool_path = CONFIG.MQ_SPOOL
+        else:
+            self.spool_path = spool
+        self.spool = None                                   # 持久化缓冲
+        if reliable is None:
+            self.reliable = CONFIG.MQ_RELIABLE
+        else:
+            self.reliable = reliable
+        if (self.reliable is None) and (self.spool_path is not None):
+            self.reliable = CONFIG.MQ_SPOOL_RELIABLE        # 发出不等于送达：持久化缓冲须待对端确认
+        self.inflight = None                                # 直连模式 PUSH 在途表
+        self.tracked = False                                # PUSH/PULL 启用持久化缓冲或确认重发
+        self.tokens = deque()                               # 接收缓冲中消息的确认标识（序号 或 (身份, 编号)）
+        self.delivered = []                                 # 已取出未确认的确认标识
+        self.acks = {}                                      # 待批量发出的确认 {身份: [编号, ]}
+        self.acks_count = 0                                 # 待批量发出的确认数
 
-    def release(self):
+    def stats(self) -> dict:
+        """
+        :return: dict   # {"depth": 发送缓冲深度, "dropped": 丢弃数, "spilled": 溢出到磁盘数, "sent": 发送数,
+                        #  "inflight": 在途数, "redelivered": 重发数, "dead": 超过重试次数放弃数,
+                        #  "buffered": 接收缓冲深度}
+        """
+        rt = dict(zip(STATS, self.counters))
+        rt["buffered"] = len(self.buffer)
+        return rt
+
+    def release(self, timeout: int = None):
+        """
+        # 关闭端点：在期限内发出缓冲及在途消息，队列进程排空后自行退出，超过期限才终止
+        :param timeout: int         # 关闭期限（毫秒），默认 CONFIG.MQ_LINGER
+        """
+        if timeout is None:
+            timeout = CONFIG.MQ_LINGER
+        deadline = time.time() + timeout / 1000
+        if self.active and (self.initialed in ["PUSH"]):
+            self.flush()
+        if self.active and (self.initialed in ["PULL"]):
+            self._flush_acks()
+        if (self.spool is not None) and (self.socket is not None) and (self.initialed in ["PULL"]):
+            # 关闭前将已到达套接字的消息写入持久化缓冲，下次启动时回放
+            while self.socket.poll(0, zmq.POLLIN):
+                recv_tokens(self.socket, self.spool)
+        if self.inflight is not None:
+            self.inflight.close(max(0, int((deadline - time.time()) * 1000)))
+            self.inflight = None
+        if self.spool is not None:
+            self.spool.close()
+        self.spool = None
+        if self.outbox is not None:
+            self.outbox.close(max(0, int((deadline - time.time()) * 1000)))
+            self.outbox = None
+        if self.socket is not None:
+            self.socket.close(linger=max(0, int((deadline - time.time()) * 1000)))
+            self.socket = None
+        if self.control is not None:
+            self.stop.set()
+            self.control.send(b"TERMINATE")
+            for thread in self.pool:
+                thread.join()
+            self.control.close(linger=0)
+            self.control = None
+            self.pool = []
         if isinstance(self.process, Process):
-            self.queue_ctrl.put(False)
-            time.sleep(CONFIG.MQ_BLOCK_TIME)
-            self.process.terminate()
-        while not self.queue_ctrl.empty():
-            self.queue_ctrl.get()
+            # 队列进程仍在送出的消息丢弃（持久化缓冲中未确认的下次启动时回放）
+            stop_process(self.process, self.pipe_ctrl[0], timeout, self.pipe_in[1])
+            for end in self.pipe_ctrl:
+                end.close()
+            self.pipe_ctrl = None
         self.process = None
         self.initialed = None
         self.active = False
+        self.buffer.clear()
+        self.tracked = False
+        self.tokens.clear()
+        self.delivered = []
+        self.acks = {}
+        self.acks_count = 0
 
     close = release
 
     def start(self, me: str):
         self.release()
         is_active = True
-        while self.queue_ctrl.full():
-            time.sleep(CONFIG.MQ_BLOCK_TIME)
+        if (self.spool_path is not None) and (me in ["PUSH", "PULL"]):
+            self.spool = SPOOL(self.spool_path)
+            replayed = self.spool.replay()
         else:
-            self.queue_ctrl.put(is_active)
-        if me in ["REPLY", "SUBSCRIBE", "PULL"]:
+            replayed = []
+        reliable = self.reliable if me in ["PUSH", "PULL"] else None
+        self.tracked = (self.spool is not None) or (reliable is not None)
+        if self.router and (me in ["REQUEST", "REPLY"]):
+            self.start_router(me)
+            self.initialed = me
+            self.active = is_active
+            return
+        if self.direct:
+            # 进程内共享上下文，inproc 端点可在同一进程的 ZMQ 对象间互通
+            self.socket = direct_socket(zmq.Context.instance(), str(self.conn), me, self.hwm, reliable is not None)
+            if me in ["PUSH", "PUBLISH"]:
+                self.outbox = Outbox(self.socket, self.overflow, self.counters)
+            if (reliable is not None) and (me in ["PUSH"]):
+                self.inflight = Inflight(self.socket, self.outbox, reliable, self.spool, self.counters)
+            self.initialed = me
+            self.active = is_active
+            self._replay(me, replayed)
+            return
+        self.pipe_ctrl = Pipe()
+        spool_path = None if self.spool is None else self.spool_path
+        if me in ["REPLY", "PUBLISH", "PULL"]:
             self.process = Process(target=first_in_last_out,
                                    name="zmq.{0}".format(me),
-                                   args=(str(self.conn), me, self.queue_ctrl, self.pipe_in[0], self.pipe_out[1]))
+                                   args=(str(self.conn), me, self.pipe_ctrl[1], self.pipe_in[0], self.pipe_out[1],
+                                         self.hwm, self.overflow, self.counters, spool_path, reliable))
         else:
             self.process = Process(target=first_out_last_in,
                                    name="zmq.{0}".format(me),
-                                   args=(str(self.conn), me, self.queue_ctrl, self.pipe_in[0], self.pipe_out[1]))
-        self.process.start()
+                                   args=(str(self.conn), me, self.pipe_ctrl[1], self.pipe_in[0], self.pipe_out[1],
+                                         self.hwm, self.overflow, self.counters, spool_path, reliable))
+        with process_lock:
+            self.process.start()
         self.initialed = me
         self.active = is_active
+        self._replay(me, replayed)
+
+    def _replay(self, me: str, replayed: list):
+        # 回放上次未确认的消息：PULL 先于新消息取出，PUSH 先于新消息重发
+        if len(replayed) == 0:
+            return
+        logging.warning("ZMQ::{0}::{1} replay spooled:{2}".format(me, self.conn, len(replayed)))
+        for seq, frames in replayed:
+            if me in ["PULL"]:
+                self.buffer.append(frames_to_msg(frames))
+                self.tokens.append(seq)
+            else:
+                self._send_tracked(me, [frames_to_msg(frames)], False, [seq])
+
+    def _send_tracked(self, me: str, msgs: list, batch: bool, seqs: list = None):
+        """
+        # 先写入持久化缓冲，再发出；直连模式登记在途，收到确认后在持久化缓冲中确认
+        :param msgs: list           # [MSG, ]
+        :param batch: bool          # 是否作为一个批量发出
+        :param seqs: list           # 已在持久化缓冲中的序号（回放），None 为新写入
+        """
+        frames_list = [msg_to_frames(msg) for msg in msgs]
+        if (seqs is None) and (self.spool is not None):
+            seqs = [self.spool.append(msg_frames) for msg_frames in frames_list]
+        if self.socket is None:
+            self.pipe_out[0].send((seqs, msgs if batch else msgs[0]))
+            logging.debug("ZMQ::{0}::{1}::PIPE OUT send spooled:{2}".format(me, self.conn, seqs))
+        else:
+            self.inflight.send(frames_list, batch, seqs)
+            logging.debug("ZMQ::{0}::{1} send inflight:{2}".format(me, self.conn, len(frames_list)))
+
+    def start_router(self, me: str):
+        context = zmq.Context.instance()
+        if me in ["REQUEST"]:
+            self.socket = context.socket(zmq.DEALER)
+            self.socket.connect(str(self.conn))
+            logging.debug("ZMQ::ROUTER::{0} connect:{1}".format(me, self.conn))
+            return
+        # REPLY: ROUTER 前端 --> 代理 --> DEALER 后端 --> N 个 REP 应答线程
+        backend_conn = "inproc://babelor.router.{0}".format(next(router_sequence))
+        frontend = context.socket(zmq.ROUTER)
+        frontend.bind(str(self.conn))
+        backend = context.socket(zmq.DEALER)
+        backend.bind(backend_conn)
+        self.control = context.socket(zmq.PAIR)
+        self.control.bind("{0}.ctrl".format(backend_conn))
+        control = context.socket(zmq.PAIR)
+        control.connect("{0}.ctrl".format(backend_conn))
+        self.stop = threading.Event()
+        self.served = threading.Semaphore(0)
+        self.pool = [threading.Thread(target=router_broker, name="zmq.ROUTER", args=(frontend, backend, control),
+                                      daemon=True)]
+        for i in range(0, self.workers, 1):
+            self.pool.append(threading.Thread(target=router_worker, name="zmq.ROUTER.{0}".format(i),
+                                              args=(self, backend_conn), daemon=True))
+        for thread in self.pool:
+            thread.start()
+        logging.debug("ZMQ::ROUTER::{0} bind:{1} workers:{2}".format(me, self.conn, self.workers))
+
+    def _send(self, me: str, msg: MSG):
+        if (self.spool is not None) or (self.inflight is not None):
+            self._send_tracked(me, [msg], False)
+        elif self.socket is None:
+            self.pipe_out[0].send(msg)
+            logging.debug("ZMQ::{0}::{1}::PIPE OUT send:{2}".format(me, self.conn, msg))
+        elif self.outbox is None:
+            frames_out = send_msg(self.socket, msg)
+            logging.debug("ZMQ::{0}::{1} send frames:{2}".format(me, self.conn, frames_out))
+        else:
+            frames_out = msg_to_frames(msg)
+            self.outbox.offer(frames_out)
+            logging.debug("ZMQ::{0}::{1} send frames:{2}".format(me, self.conn, len(frames_out)))
+
+    def _send_many(self, me: str, msgs: list):
+        if (self.spool is not None) or (self.inflight is not None):
+            self._send_tracked(me, msgs, True)
+        elif self.socket is None:
+            self.pipe_out[0].send(list(msgs))
+            logging.debug("ZMQ::{0}::{1}::PIPE OUT send batch:{2}".format(me, self.conn, len(msgs)))
+        elif self.outbox is None:
+            frames_out = send_msgs(self.socket, msgs)
+            logging.debug("ZMQ::{0}::{1} send batch:{2} frames:{3}".format(me, self.conn, len(msgs), frames_out))
+        else:
+            frames_out = msgs_to_frames(msgs)
+            self.outbox.offer(frames_out)
+            logging.debug("ZMQ::{0}::{1} send batch:{2} frames:{3}".format(me, self.conn, len(msgs),
+                                                                           len(frames_out)))
+
+    def _recv(self, me: str) -> MSG:
+        if len(self.buffer) == 0:
+            self.buffer.extend(self._recv_many(me))
+        return self._pop()
+
+    def _pop(self) -> MSG:
+        if self.tracked:
+            self.delivered.append(self.tokens.popleft())
+        return self.buffer.popleft()
+
+    def _recv_many(self, me: str) -> list:
+        if ((self.acks_count > 0) or ((self.spool is not None) and (self.spool.pending > 0))) and (not self._wait(0)):
+            self._flush_acks()      # 即将阻塞等待，先发出累积的确认
+            if self.spool is not None:
+                self.spool.sync()   # 及 fsync 累积的确认记录
+        if self.socket is None:
+            msg_in = self.pipe_in[1].recv()
+            if self.tracked:
+                tokens, msg_in = msg_in
+                self.tokens.extend(tokens)
+            if isinstance(msg_in, list):
+                logging.debug("ZMQ::{0}::{1}::PIPE IN recv batch:{2}".format(me, self.conn, len(msg_in)))
+                return msg_in
+            logging.debug("ZMQ::{0}::{1}::PIPE IN recv:{2}".format(me, self.conn, msg_in))
+            return [msg_in]
+        elif self.tracked:
+            tokens, msgs_in = recv_tokens(self.socket, self.spool)
+            self.tokens.extend(tokens)
+            logging.debug("ZMQ::{0}::{1} recv tracked:{2}".format(me, self.conn, len(tokens)))
+            return msgs_in
+        else:
+            msgs_in = recv_msgs(self.socket)
+            logging.debug("ZMQ::{0}::{1} recv:{2}".format(me, self.conn, len(msgs_in)))
+            return msgs_in
+
+    def _wait(self, timeout: (int, None)) -> bool:
+        """
+        :param timeout: (int, None)     # 等待时间（毫秒），None 为一直等待
+        :return: bool                   # 是否有数据可读
+        """
+        if self.socket is None:
+            return self.pipe_in[1].poll(None if timeout is None else timeout / 1000)
+        else:
+            return self.socket.poll(timeout, zmq.POLLIN) > 0
+
+    def poll(self, timeout: int = None, pipes: list = None) -> bool:
+        """
+        # 等待可取出的消息，可同时等待调用者的管道（控制信号、处理结果等），任一可读即返回
+        :param timeout: int         # 等待时间（毫秒），None 为一直等待
+        :param pipes: list          # [Pipe, ]，由调用者检查哪个可读
+        :return: bool               # 是否有消息可取出
+        """
+        if len(self.buffer) > 0:
+            return True
+        if (self.acks_count > 0) and (not self._wait(0)):
+            self._flush_acks()
+        source = self.pipe_in[1].fileno() if self.socket is None else self.socket
+        poller = zmq.Poller()
+        poller.register(source, zmq.POLLIN)
+        for pipe in [] if pipes is None else pipes:
+            poller.register(pipe.fileno(), zmq.POLLIN)
+        return source in dict(poller.poll(timeout)).keys()
 
     def request(self, msg: MSG):        # 先出后进::请求  ZMQ::FOLI::REQUEST
         me = "REQUEST"
+        if self.router:
+            return self.request_many([msg])[0]
         if self.initialed is None:
             self.start(me)
         elif self.initialed not in [me]:
@@ -204,16 +1165,53 @@ class ZMQ:
             self.start(me)
         # -----------------------------
         if self.active:
-            self.pipe_out[0].send(msg)
-            logging.debug("ZMQ::{0}::{1}::PIPE OUT send:{2}".format(me, self.conn, msg))
-            msg_in = self.pipe_in[1].recv()
-            logging.debug("ZMQ::{0}::{1}::PIPE IN recv:{2}".format(me, self.conn, msg_in))
-            return msg_in
+            self._send(me, msg)
+            return self._recv(me)
+        else:
+            self.release()
+
+    def request_many(self, msgs: list):     # 并发请求，应答按请求顺序返回，任一应答出错则收齐后抛出 RuntimeError
+        me = "REQUEST"
+        if not self.router:
+            return [self.request(msg) for msg in msgs]
+        if self.initialed is None:
+            self.start(me)
+        elif self.initialed not in [me]:
+            self.release()
+            self.start(me)
+        # -----------------------------
+        if self.active:
+            pending = {}
+            for i, msg in enumerate(msgs):
+                self.sequence += 1
+                correlation = str(self.sequence).encode("ascii")
+                pending[correlation] = i
+                self.socket.send_multipart([correlation, b""] + msg_to_frames(msg), copy=False)
+            logging.debug("ZMQ::ROUTER::{0}::{1} send requests:{2}".format(me, self.conn, len(msgs)))
+            msgs_in = [None] * len(msgs)
+            errors = []
+            while len(pending) > 0:
+                envelope, frames = split_envelope(self.socket.recv_multipart(copy=False))
+                if len(envelope) > 0 and (envelope[-1] in pending.keys()):
+                    idx = pending.pop(envelope[-1])
+                    try:
+                        msgs_in[idx] = reply_to_msg(frames, self.conn)
+                    except RuntimeError as e:
+                        errors.append(e)    # 先收齐其余应答，以免残留为过期应答
+                else:
+                    logging.warning("ZMQ::ROUTER::{0}::{1} drop stale reply:{2}".format(me, self.conn, envelope))
+            if len(errors) > 0:
+                raise errors[0]
+            return msgs_in
         else:
             self.release()
 
     def reply(self, func: callable):        # 先进后出::反馈  ZMQ::FILO::REPLY
+        """
+        # ROUTER 模式：首次调用启动代理及应答线程，每次调用更新应答函数并等待一次应答完成
+        """
         me = "REPLY"
+        self.reply_func = func
         if self.initialed is None:
             self.start(me)
         elif self.initialed not in [me]:
@@ -221,11 +1219,12 @@ class ZMQ:
             self.start(me)
         # -----------------------------
         if self.active:
-            msg_in = self.pipe_in[1].recv()
-            logging.debug("ZMQ::{0}::{1}::PIPE IN recv:{2}".format(me, self.conn, msg_in))
-            msg_out = func(msg_in)
-            self.pipe_out[0].send(msg_out)
-            logging.debug("ZMQ::{0}::{1}::PIPE OUT send:{2}".format(me, self.conn, msg_out))
+            if self.router:
+                self.served.acquire()
+            else:
+                msg_in = self._recv(me)
+                msg_out = func(msg_in)
+                self._send(me, msg_out)
         else:
             self.release()
 
@@ -238,11 +1237,53 @@ class ZMQ:
             self.start(me)
         # -----------------------------
         if self.active:
-            self.pipe_out[0].send(msg)
-            logging.debug("ZMQ::{0}::{1}::PIPE OUT send:{2}".format(me, self.conn, msg))
+            if self.batch is None:
+                self._send(me, msg)
+            else:
+                # 自动批量：达到批量大小或等待时间后作为一个多帧消息发送
+                with self.batch_lock:
+                    self.batched.append(msg)
+                    if len(self.batched) >= self.batch["size"]:
+                        self._flush()
+                    elif self.batch_timer is None:
+                        self.batch_timer = threading.Timer(self.batch["linger"] / 1000, self.flush)
+                        self.batch_timer.daemon = True
+                        self.batch_timer.start()
+        else:
+            self.release()
+
+    def push_many(self, msgs: list):     # 批量推出，作为一个多帧消息发送    ZMQ::FOLI::PUSH
+        me = "PUSH"
+        if self.initialed is None:
+            self.start(me)
+        elif self.initialed not in [me]:
+            self.release()
+            self.start(me)
+        # -----------------------------
+        if self.active:
+            with self.batch_lock:
+                self._flush()
+                if len(msgs) > 0:
+                    self._send_many(me, msgs)
         else:
             self.release()
 
+    def flush(self):
+        with self.batch_lock:
+            self._flush()
+            if self.outbox is not None:
+                self.outbox.drain(CONFIG.MQ_LINGER)
+            if self.inflight is not None:
+                self.inflight.service()
+
+    def _flush(self):
+        if self.batch_timer is not None:
+            self.batch_timer.cancel()
+            self.batch_timer = None
+        if len(self.batched) > 0:
+            self._send_many("PUSH", self.batched)
+            self.batched = []
+
     def pull(self):     # 只进::拉入    ZMQ::FILO::PULL
         me = "PULL"
         if self.initialed is None:
@@ -252,13 +1293,104 @@ class ZMQ:
             self.start(me)
         # -----------------------------
         if self.active:
-            msg_in = self.pipe_in[1].recv()
-            logging.debug("ZMQ::{0}::{1}::PIPE IN recv:{2}".format(me, self.conn, msg_in))
-            return msg_in
+            self.ack()
+            return self._recv(me)
         else:
             self.release()
             return None
 
+    def ack(self, tokens: list = None):
+        """
+        # 确认已取出的消息处理完成，下一次 pull/pull_many 时自动确认
+        # 持久化缓冲：未确认的在下次启动时回放；可靠模式：确认累积到 batch 条或即将阻塞等待时批量发回发送端
+        :param tokens: list         # detach 取走的确认标识，None 为全部已取出未确认的消息
+        """
+        if tokens is None:
+            tokens = self.detach()
+        if len(tokens) == 0:
+            return
+        if self.spool is not None:
+            self.spool.ack(tokens)
+        elif self.reliable is not None:
+            for identity, msg_id in tokens:
+                self.acks.setdefault(identity, []).append(msg_id)
+            self.acks_count += len(tokens)
+            if self.acks_count >= self.reliable["batch"]:
+                self._flush_acks()
+
+    def nack(self, tokens: list = None):
+        """
+        # 否认已取出的消息：可靠模式下发送端立即重发（计入重试次数）；
+        # 有持久化缓冲时消息已在本地落盘，保持未确认，下次启动时回放
+        :param tokens: list         # detach 取走的确认标识，None 为全部已取出未确认的消息
+        """
+        if tokens is None:
+            tokens = self.detach()
+        if len(tokens) == 0:
+            return
+        if (self.spool is None) and (self.reliable is not None):
+            nacks = {}
+            for identity, msg_id in tokens:
+                nacks.setdefault(identity, []).append(msg_id)
+            self._send_acks(NACK_MARK, nacks)
+            logging.debug("ZMQ::PULL::{0} nack:{1}".format(self.conn, len(tokens)))
+
+    def detach(self) -> list:
+        """
+        # 取走已取出未确认消息的确认标识，下一次 pull 不再自动确认；并发处理时由调用者按标识 ack/nack
+        :return: list               # [确认标识, ]，未启用持久化缓冲或确认重发时为空
+        """
+        tokens, self.delivered = self.delivered, []
+        return tokens
+
+    def _flush_acks(self):
+        if self.acks_count > 0:
+            self._send_acks(ACK_MARK, self.acks)
+            logging.debug("ZMQ::PULL::{0} ack:{1}".format(self.conn, self.acks_count))
+            self.acks = {}
+            self.acks_count = 0
+
+    def _send_acks(self, mark: bytes, acks: dict):
+        if self.socket is None:
+            self.pipe_out[0].send((mark, acks))
+        else:
+            send_acks(self.socket, acks, mark)
+
+    def pull_many(self, max_n: int, timeout: int = None):    # 批量拉入    ZMQ::FILO::PULL
+        """
+        :param max_n: int           # 最多取出的消息数
+        :param timeout: int         # 等待时间（毫秒）；None 为等待至少一条后取出已到达的消息
+        :return: list               # [MSG, ]，超时可能为空
+        """
+        me = "PULL"
+        if self.initialed is None:
+            self.start(me)
+        elif self.initialed not in [me]:
+            self.release()
+            self.start(me)
+        # -----------------------------
+        if self.active:
+            self.ack()
+            msgs_in = []
+            deadline = None if timeout is None else time.time() + timeout / 1000
+            while len(msgs_in) < max_n:
+                if len(self.buffer) > 0:
+                    msgs_in.append(self._pop())
+                    continue
+                if deadline is None:
+                    wait = None if len(msgs_in) == 0 else 0
+                else:
+                    wait = max(0, int((deadline - time.time()) * 1000))
+                if (self.acks_count > 0) and (not self._wait(0)):
+                    self._flush_acks()
+                if not self._wait(wait):
+                    break
+                self.buffer.extend(self._recv_many(me))
+            return msgs_in
+        else:
+            self.release()
+            return []
+
     def publish(self, msg: MSG):    # 先进后出::发布    ZMQ::FILO::PUBLISH
         me = "PUBLISH"
         if self.initialed is None:
@@ -268,8 +1400,7 @@ class ZMQ:
             self.start(me)
         # -----------------------------
         if self.active:
-            self.pipe_out[0].send(msg)
-            logging.debug("ZMQ::{0}::{1}::PIPE OUT send:{2}".format(me, self.conn, msg))
+            self._send(me, msg)
         else:
             self.release()
 
@@ -282,8 +1413,213 @@ class ZMQ:
             self.start(me)
         # -----------------------------
         if self.active:
-            msg_in = self.pipe_in[1].recv()
-            logging.debug("ZMQ::{0}::{1}::PIPE IN recv:{2}".format(me, self.conn, msg_in))
-            return msg_in
+            return self._recv(me)
         else:
             self.release()
+
+
+class AsyncZMQ:
+    def __init__(self, conn: (URL, str), router: bool = None, workers: int = None):
+        """
+        # 基于 zmq.asyncio 的协程接口，单个事件循环可驱动多个端点
+        :param conn: (URL, str)     # 套接字    "tcp://<hostname>:<port>"
+        :param router: bool         # 请求应答使用 ROUTER/DEALER 并发模式，默认 CONFIG.MQ_ROUTER
+        :param workers: int         # ROUTER 模式并发应答数，默认 CONFIG.MQ_WORKERS
+        """
+        if isinstance(conn, str):
+            self.conn = URL(conn)
+        else:
+            self.conn = conn
+        # Check
+        if self.conn.scheme not in ["tcp", "pgm", "inproc"]:
+            raise ValueError("Invalid scheme{0}.".format(self.conn.scheme))
+        if router is None:
+            self.router = CONFIG.MQ_ROUTER
+        else:
+            self.router = router
+        if workers is None:
+            self.workers = CONFIG.MQ_WORKERS
+        else:
+            self.workers = workers
+        self.active = False                                 # 激活状态
+        self.initialed = None                               # 初始化模式
+        self.socket = None                                  # 协程套接字
+        self.sequence = 0                                   # ROUTER 模式请求关联编号
+        self.pending = {}                                   # ROUTER 模式待应答 {关联编号: Future}
+        self.reader = None                                  # ROUTER 模式应答读取任务
+        self.buffer = deque()                               # 批量接收后待取出消息
+
+    def release(self):
+        # 先停止应答读取任务并使待应答请求失败，再关闭套接字，以免请求方永久等待
+        if (self.reader is not None) and (not self.reader.done()):
+            self.reader.cancel()
+        self.reader = None
+        pending, self.pending = self.pending, {}
+        for correlation, future in pending.items():
+            if not (future.done() or future.get_loop().is_closed()):
+                future.set_exception(RuntimeError("ZMQ::ASYNC::ROUTER::{0} released, request:{1} unanswered.".format(
+                    self.conn, correlation.decode("ascii"))))
+        if self.socket is not None:
+            self.socket.close(linger=CONFIG.MQ_LINGER)
+            self.socket = None
+        self.initialed = None
+        self.active = False
+        self.buffer.clear()
+
+    close = release
+
+    def start(self, me: str):
+        self.release()
+        context = zmq.asyncio.Context.instance()
+        if self.router and (me in ["REQUEST"]):
+            self.socket = context.socket(zmq.DEALER)
+            self.socket.connect(str(self.conn))
+        elif self.router and (me in ["REPLY"]):
+            self.socket = context.socket(zmq.ROUTER)
+            self.socket.bind(str(self.conn))
+        else:
+            self.socket = direct_socket(context, str(self.conn), me)
+        self.initialed = me
+        self.active = True
+
+    def _init(self, me: str):
+        if self.initialed not in [me]:
+            self.start(me)
+
+    async def _send(self, me: str, msg: MSG):
+        frames_out = msg_to_frames(msg)
+        await self.socket.send_multipart(frames_out, copy=False)
+        logging.debug("ZMQ::ASYNC::{0}::{1} send frames:{2}".format(me, self.conn, len(frames_out)))
+
+    async def _recv(self, me: str) -> MSG:
+        if len(self.buffer) > 0:
+            return self.buffer.popleft()
+        msgs_in = frames_to_msgs(await self.socket.recv_multipart(copy=False))
+        logging.debug("ZMQ::ASYNC::{0}::{1} recv:{2}".format(me, self.conn, len(msgs_in)))
+        self.buffer.extend(msgs_in[1:])
+        return msgs_in[0]
+
+    async def request(self, msg: MSG):      # 先出后进::请求  ZMQ::ASYNC::REQUEST
+        me = "REQUEST"
+        self._init(me)
+        if self.router:
+            # 并发请求：按关联编号匹配乱序应答
+            self.sequence += 1
+            correlation = str(self.sequence).encode("ascii")
+            future = asyncio.get_running_loop().create_future()
+            self.pending[correlation] = future
+            await self.socket.send_multipart([correlation, b""] + msg_to_frames(msg), copy=False)
+            if (self.reader is None) or self.reader.done():
+                self.reader = asyncio.ensure_future(self._read_replies(me))
+            return await future
+        await self._send(me, msg)
+        return await self._recv(me)
+
+    async def _read_replies(self, me: str):
+        while len(self.pending) > 0:
+            envelope, frames = split_envelope(await self.socket.recv_multipart(copy=False))
+            future = self.pending.pop(envelope[-1], None) if len(envelope) > 0 else None
+            if future is None:
+                logging.warning("ZMQ::ASYNC::ROUTER::{0}::{1} drop stale reply:{2}".format(me, self.conn, envelope))
+            elif not future.done():
+                try:
+                    future.set_result(reply_to_msg(frames, self.conn))
+                except RuntimeError as e:
+                    future.set_exception(e)
+
+    async def reply(self, func: callable, times: int = None):   # 先进后出::反馈  ZMQ::ASYNC::REPLY
+        """
+        # 应答循环，直到 release 或达到次数；ROUTER 模式下最多 workers 个请求并发处理，应答乱序返回
+        :param func: callable       # 处理函数，普通函数或协程函数  func(MSG) -> MSG
+        :param times: int           # 应答次数，None 为持续应答
+        :return: None
+        """
+        me = "REPLY"
+        self._init(me)
+        count = 0
+        if self.router:
+            semaphore = asyncio.Semaphore(self.workers)
+            tasks = set()
+            while self.active and ((times is None) or (count < times)):
+                await semaphore.acquire()
+                envelope, frames = split_envelope(await self.socket.recv_multipart(copy=False))
+                task = asyncio.ensure_future(self._serve(me, func, envelope, frames, semaphore))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                count += 1
+            if len(tasks) > 0:
+                await asyncio.gather(*tasks)
+            return
+        while self.active and ((times is None) or (count < times)):
+            msg_in = await self._recv(me)
+            msg_out = func(msg_in)
+            if asyncio.iscoroutine(msg_out):
+                msg_out = await msg_out
+            await self._send(me, msg_out)
+            count += 1
+
+    async def _serve(self, me: str, func: callable, envelope: list, frames: list, semaphore: asyncio.Semaphore):
+        try:
+            try:
+                msg_out = func(frames_to_msg(frames))
+                if asyncio.iscoroutine(msg_out):
+                    msg_out = await msg_out
+                frames_out = msg_to_frames(msg_out)
+            except Exception as e:
+                logging.exception("ZMQ::ASYNC::ROUTER::{0}::{1} reply func error:{2}".format(me, self.conn, e))
+                frames_out = error_to_frames(e)
+            await self.socket.send_multipart(envelope + [b""] + frames_out, copy=False)
+            logging.debug("ZMQ::ASYNC::ROUTER::{0}::{1} send frames:{2}".format(me, self.conn, len(frames_out)))
+        finally:
+            semaphore.release()
+
+    async def push(self, msg: MSG):         # 只出::推出    ZMQ::ASYNC::PUSH
+        me = "PUSH"
+        self._init(me)
+        await self._send(me, msg)
+
+    async def push_many(self, msgs: list):  # 批量推出，作为一个多帧消息发送    ZMQ::ASYNC::PUSH
+        me = "PUSH"
+        self._init(me)
+        frames_out = msgs_to_frames(msgs)
+        await self.socket.send_multipart(frames_out, copy=False)
+        logging.debug("ZMQ::ASYNC::{0}::{1} send batch:{2} frames:{3}".format(me, self.conn, len(msgs),
+                                                                              len(frames_out)))
+
+    async def pull(self):                   # 只进::拉入    ZMQ::ASYNC::PULL
+        me = "PULL"
+        self._init(me)
+        return await self._recv(me)
+
+    async def pull_many(self, max_n: int, timeout: int = None):    # 批量拉入    ZMQ::ASYNC::PULL
+        """
+        :param max_n: int           # 最多取出的消息数
+        :param timeout: int         # 等待时间（毫秒）；None 为等待至少一条后取出已到达的消息
+        :return: list               # [MSG, ]，超时可能为空
+        """
+        me = "PULL"
+        self._init(me)
+        msgs_in = []
+        deadline = None if timeout is None else time.time() + timeout / 1000
+        while len(msgs_in) < max_n:
+            if len(self.buffer) > 0:
+                msgs_in.append(self.buffer.popleft())
+                continue
+            if deadline is None:
+                wait = None if len(msgs_in) == 0 else 0
+            else:
+                wait = max(0, int((deadline - time.time()) * 1000))
+            if not await self.socket.poll(wait, zmq.POLLIN):
+                break
+            self.buffer.extend(frames_to_msgs(await self.socket.recv_multipart(copy=False)))
+        return msgs_in
+
+    async def publish(self, msg: MSG):      # 先进后出::发布    ZMQ::ASYNC::PUBLISH
+        me = "PUBLISH"
+        self._init(me)
+        await self._send(me, msg)
+
+    async def subscribe(self):              # 先出后进::订阅  ZMQ::ASYNC::SUBSCRIBE
+        me = "SUBSCRIBE"
+        self._init(me)
+        return await self._recv(me)
@@ -0,0 +1,278 @@
+# coding=utf-8
+# Copyright 2019 StrTrek Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# System Required
+import os
+import time
+import zlib
+import struct
+import logging
+try:
+    import fcntl                # POSIX：目录锁，确认者与回收者互斥      POSIX only: directory lock
+except ImportError:
+    fcntl = None
+# Global Parameters
+from Babelor.Config import CONFIG
+
+
+RECORD_HEAD = struct.Struct("<II")      # 记录头：消息体长度(4) + CRC32(4)
+RECORD_BODY = struct.Struct("<QI")      # 消息体：序号(8) + 帧数(4)，其后 [帧长(8) + 帧] * 帧数
+FRAME_HEAD = struct.Struct("<Q")        # 帧长
+ACK_RECORD = struct.Struct("<Q")        # 确认记录：序号(8)
+
+
+class SPOOL:
+    def __init__(self, path: str, segment: int = None, sync: dict = None):
+        """
+        # 持久化缓冲：追加写入的分段日志，按批 fsync，确认后回收，启动时回放未确认消息
+        # 目录下 <段号>.log 为消息段（唯一写入者），<段号>.ack 为对应段的确认记录（唯一确认者）
+        # 段号 = (序号 - 1) // 段容量，写入者与确认者可在不同进程，无需共享状态
+        # 确认者打开确认文件与回收者删除段经目录下 lock 文件互斥（fcntl.flock），以免回收后留下孤立的确认文件
+        :param path: str            # 目录
+        :param segment: int         # 段容量（消息数），默认 CONFIG.MQ_SPOOL_SEGMENT
+        :param sync: dict           # fsync 批量 {"count": int, "interval": int(毫秒)}，默认 CONFIG.MQ_SPOOL_SYNC
+        """
+        if segment is None:
+            segment = CONFIG.MQ_SPOOL_SEGMENT
+        if sync is None:
+            sync = CONFIG.MQ_SPOOL_SYNC
+        self.path = path
+        self.segment = segment
+        self.sync_count = sync["count"]
+        self.sync_interval = sync["interval"] / 1000
+        os.makedirs(self.path, exist_ok=True)
+        self.log = None                 # 写入中的消息段
+        self.log_id = None              # 写入中的段号
+        self.seq = None                 # 最后写入的序号
+        self.acks = {}                  # 确认记录文件 {段号: file}
+        self.lock = None                # 目录锁文件
+        self.pending = 0                # 未 fsync 的记录数
+        self.synced = time.time()       # 上次 fsync 时间
+
+    def _name(self, segment_id: int, suffix: str) -> str:
+        return os.path.join(self.path, "{0:016d}.{1}".format(segment_id, suffix))
+
+    def _lock(self):
+        if fcntl is None:
+            return
+        if self.lock is None:
+            self.lock = open(os.path.join(self.path, "lock"), "ab")
+        fcntl.flock(self.lock.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(self):
+        if self.lock is not None:
+            fcntl.flock(self.lock.fileno(), fcntl.LOCK_UN)
+
+    def segments(self) -> list:
+        """
+        :return: list   # 现存消息段段号，升序
+        """
+        return sorted([int(name[:-4]) for name in os.listdir(self.path) if name.endswith(".log")])
+
+    def _acked(self, segment_id: int) -> set:
+        try:
+            with open(self._name(segment_id, "ack"), "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return set()
+        size = len(data) - len(data) % ACK_RECORD.size      # 忽略未写完的尾部
+        return set(seq for seq, in ACK_RECORD.iter_unpack(data[:size]))
+
+    def _records(self, segment_id: int):
+        """
+        # 按序读取消息段，遇到未写完或校验失败的尾部即停止
+        :return: generator  # (序号, [bytes, ], 结束位置)
+        """
+        with open(self._name(segment_id, "log"), "rb") as file:
+            position = 0
+            while True:
+                head = file.read(RECORD_HEAD.size)
+                if len(head) < RECORD_HEAD.size:
+                    return
+                size, crc = RECORD_HEAD.unpack(head)
+                body = file.read(size)
+                if (len(body) < size) or (zlib.crc32(body) != crc):
+                    logging.warning("SPOOL::{0} torn record at segment:{1} offset:{2}".format(self.path, segment_id,
+                                                                                            position))
+                    return
+                seq, count = RECORD_BODY.unpack_from(body)
+                offset, frames = RECORD_BODY.size, []
+                for i in range(0, count, 1):
+                    length, = FRAME_HEAD.unpack_from(body, offset)
+                    offset += FRAME_HEAD.size
+                    frames.append(body[offset:offset + length])
+                    offset += length
+                position += RECORD_HEAD.size + size
+                yield seq, frames, position
+
+    def replay(self) -> list:
+        """
+        # 回放全部未确认消息
+        :return: list   # [(序号, [bytes, ]), ]，按序号升序
+        """
+        unacked = []
+        for segment_id in self.segments():
+            acked = self._acked(segment_id)
+            for seq, frames, position in self._records(segment_id):
+                if seq not in acked:
+                    unacked.append((seq, frames))
+        logging.debug("SPOOL::{0} replay:{1}".format(self.path, len(unacked)))
+        return unacked
+
+    def _open(self):
+        # 续写最后一个段：截去未写完的尾部，序号接续
+        segments = self.segments()
+        if len(segments) == 0:
+            self.seq = 0
+            self._roll(0)
+        else:
+            self.log_id = segments[-1]
+            self.seq = self.log_id * self.segment
+            end = 0
+            for seq, frames, position in self._records(self.log_id):
+                self.seq, end = seq, position
+            self.log = open(self._name(self.log_id, "log"), "r+b")
+            self.log.truncate(end)
+            self.log.seek(end)
+        self.compact()
+
+    def _roll(self, segment_id: int):
+        if self.log is not None:
+            self._sync()
+            self.log.close()
+        self.log_id = segment_id
+        self.log = open(self._name(segment_id, "log"), "ab")
+        # 新建段需 fsync 目录，确保段文件本身在掉电后存在
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def append(self, frames: list) -> int:
+        """
+        # 追加一条消息，写入操作系统缓冲后返回（进程崩溃不丢失），按 sync 批量 fsync（掉电不丢失）
+        :param frames: list         # [bytes, memoryview, zmq.Frame, ]
+        :return: int                # 序号
+        """
+        if self.log is None:
+            self._open()
+        seq = self.seq + 1
+        segment_id = (seq - 1) // self.segment
+        if segment_id != self.log_id:
+            self._roll(segment_id)
+            self.compact()
+        views = [memoryview(frame).cast("B") for frame in frames]
+        parts = [RECORD_BODY.pack(seq, len(views))]
+        for view in views:
+            parts.append(FRAME_HEAD.pack(view.nbytes))
+            parts.append(view)
+        size, crc = 0, 0
+        for part in parts:
+            size += len(part)
+            crc = zlib.crc32(part, crc)
+        self.log.write(RECORD_HEAD.pack(size, crc))
+        for part in parts:
+            self.log.write(part)
+        self.log.flush()
+        self.seq = seq
+        self._pending()
+        return seq
+
+    def ack(self, seqs: list):
+        """
+        # 确认消息（已送达/已处理），确认记录按 sync 批量 fsync；已回收段的确认忽略
+        :param seqs: list           # [序号, ]
+        """
+        for seq in seqs:
+            segment_id = (seq - 1) // self.segment
+            if segment_id not in self.acks.keys():
+                # 检查段存在与打开确认文件之间，段不能被回收
+                self._lock()
+                try:
+                    if not os.path.exists(self._name(segment_id, "log")):
+                        continue
+                    self.acks[segment_id] = open(self._name(segment_id, "ack"), "ab")
+                finally:
+                    self._unlock()
+                # 确认大体按序进行，打开新段的确认文件时关闭更早的
+                for old_id in [old_id for old_id in self.acks.keys() if old_id < segment_id]:
+                    self._sync()
+                    self.acks.pop(old_id).close()
+            self.acks[segment_id].write(ACK_RECORD.pack(seq))
+        for file in self.acks.values():
+            file.flush()
+        if len(seqs) > 0:
+            self._pending(len(seqs))
+
+    def _pending(self, count: int = 1):
+        self.pending += count
+        if (self.pending >= self.sync_count) or (time.time() - self.synced >= self.sync_interval):
+            self._sync()
+
+    def idle(self) -> (int, None):
+        """
+        # 空闲时调用：未 fsync 的记录已到间隔则 fsync，否则返回剩余时间，供调用者作为轮询超时
+        :return: (int, None)        # 距下次 fsync 的时间（毫秒），None 为没有未 fsync 的记录
+        """
+        if self.pending == 0:
+            return None
+        wait = int((self.synced + self.sync_interval - time.time()) * 1000)
+        if wait <= 0:
+            self._sync()
+            return None
+        return wait
+
+    def _sync(self):
+        if self.log is not None:
+            os.fsync(self.log.fileno())
+        for file in self.acks.values():
+            os.fsync(file.fileno())
+        self.pending = 0
+        self.synced = time.time()
+
+    sync = _sync
+
+    def compact(self):
+        """
+        # 回收全部消息已确认的段（保留写入中的段，以接续序号）
+        """
+        self._lock()
+        try:
+            for segment_id in self.segments():
+                if segment_id == self.log_id:
+                    break
+                first = segment_id * self.segment + 1
+                acked = self._acked(segment_id)
+                if all((seq in acked) for seq in range(first, first + self.segment, 1)):
+                    if segment_id in self.acks.keys():
+                        self.acks.pop(segment_id).close()
+                    os.remove(self._name(segment_id, "log"))
+                    os.remove(self._name(segment_id, "ack"))
+                    logging.debug("SPOOL::{0} compact segment:{1}".format(self.path, segment_id))
+        finally:
+            self._unlock()
+
+    def close(self):
+        self._sync()
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        for file in self.acks.values():
+            file.close()
+        self.acks = {}
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
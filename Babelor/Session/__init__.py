@@ -15,3 +15,6 @@
 
 # Inner Required
 from Babelor.Session.MessageQueue import ZMQ as MQ
+from Babelor.Session.MessageQueue import AsyncZMQ as AsyncMQ
+from Babelor.Session.MessageQueue import stop_process
+from Babelor.Session.Spool import SPOOL
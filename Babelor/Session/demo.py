@@ -14,14 +14,23 @@
 # limitations under the License.
 
 # System Required
+import json
 import time
+import shutil
+import asyncio
 import logging
-from multiprocessing import Process
+import tempfile
+import threading
+from itertools import count as counter
+from multiprocessing import Process, Queue
 # Outer Required
+import numpy as np
+import pandas as pd
 # Inner Required
-from Babelor.Session import MQ
+from Babelor.Session import MQ, AsyncMQ
 from Babelor.Presentation import MSG, URL
 # Global Parameters
+from Babelor.Config import CONFIG
 logging.basicConfig(level=logging.WARNING,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
 
@@ -97,7 +106,411 @@ def demo_publish_subscribe():
     try_subscribe()
 
 
+def bench_pull(url: str, direct: bool, count: int):
+    mq = MQ(url, direct=direct)
+    latency = []
+    start = None
+    for i in range(0, count, 1):
+        msg = mq.pull()
+        if start is None:
+            start = time.time()
+        latency.append(time.time() - float(msg.activity))
+    cost = time.time() - start
+    mq.release()
+    latency.sort()
+    logging.warning("DEMO::{0} count:{1} msgs/s:{2:.0f} p50:{3:.3f}ms p99:{4:.3f}ms".format(
+        "DIRECT" if direct else "PROCESS", count, count / cost,
+        latency[len(latency) // 2] * 1000, latency[int(len(latency) * 0.99)] * 1000))
+
+
+def demo_direct_benchmark(count: int = 20000, rate: int = 10000):
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    msg.destination = URL("tcp://127.0.0.1:10001")
+    msg.add_datum("This is a test string", path="str.txt")
+    for port, direct in [(15011, False), (15012, True)]:
+        process = Process(target=bench_pull, args=("tcp://*:{0}".format(port), direct, count))
+        process.start()
+        mq = MQ("tcp://127.0.0.1:{0}".format(port), direct=direct)
+        start = time.time()
+        for i in range(0, count, 1):
+            delay = start + i / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            msg.activity = str(time.time())
+            mq.push(msg)
+        process.join()
+        mq.release()
+
+
+async def try_async_endpoints(endpoints: int, times: int):
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    pullers = [AsyncMQ("inproc://async.{0}".format(i)) for i in range(0, endpoints, 1)]
+    pushers = [AsyncMQ("inproc://async.{0}".format(i)) for i in range(0, endpoints, 1)]
+    repliers = [AsyncMQ("inproc://async.rr.{0}".format(i)) for i in range(0, endpoints, 1)]
+    requesters = [AsyncMQ("inproc://async.rr.{0}".format(i)) for i in range(0, endpoints, 1)]
+
+    async def push(mq: AsyncMQ):
+        for i in range(0, times, 1):
+            await mq.push(msg)
+
+    async def pull(mq: AsyncMQ):
+        for i in range(0, times, 1):
+            await mq.pull()
+
+    async def request(mq: AsyncMQ):
+        for i in range(0, times, 1):
+            await mq.request(msg)
+
+    start = time.time()
+    await asyncio.gather(*([pull(mq) for mq in pullers] + [push(mq) for mq in pushers] +
+                           [mq.reply(try_reply_func, times) for mq in repliers] +
+                           [request(mq) for mq in requesters]))
+    cost = time.time() - start
+    for mq in pullers + pushers + repliers + requesters:
+        mq.release()
+    logging.warning("DEMO::ASYNC endpoints:{0} msgs:{1} cost:{2:.3f}s msgs/s:{3:.0f}".format(
+        endpoints * 4, endpoints * times * 2, cost, endpoints * times * 2 / cost))
+
+
+def demo_async_endpoints(endpoints: int = 200, times: int = 100):
+    asyncio.run(try_async_endpoints(endpoints, times))
+
+
+def try_slow_reply_func(msg: MSG):
+    time.sleep(0.01)
+    msg.destination = URL().init("oracle")
+    return msg
+
+
+def try_router_reply(url: str, router: bool, count: int):
+    mq = MQ(url, direct=True, router=router, workers=8)
+    for i in range(0, count, 1):
+        mq.reply(try_slow_reply_func)
+    time.sleep(1)
+    mq.release()
+
+
+def demo_router_request_reply(count: int = 200):
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    for port, router in [(15021, False), (15022, True)]:
+        process = Process(target=try_router_reply, args=("tcp://*:{0}".format(port), router, count))
+        process.start()
+        mq = MQ("tcp://127.0.0.1:{0}".format(port), direct=True, router=router)
+        msgs = []
+        for i in range(0, count, 1):
+            msg.activity = str(i)
+            msgs.append(MSG(msg.to_bytes()))
+        start = time.time()
+        msgs = mq.request_many(msgs)
+        cost = time.time() - start
+        is_ordered = [m.activity for m in msgs] == [str(i) for i in range(0, count, 1)]
+        mq.release()
+        process.join()
+        logging.warning("DEMO::{0} requests:{1} cost:{2:.3f}s ordered:{3}".format(
+            "ROUTER" if router else "REQ/REP", count, cost, is_ordered))
+
+
+def try_pull_many(url: str, direct: bool, count: int):
+    mq = MQ(url, direct=direct)
+    received = 0
+    while received < count:
+        received += len(mq.pull_many(1000, timeout=1000))
+    mq.release()
+
+
+def demo_batch_push_pull(count: int = 50000, size: int = 100):
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    msg.add_datum("row event", path="event.txt")
+    cases = [
+        ("SINGLE", 15031, None),
+        ("PUSH_MANY", 15032, None),
+        ("AUTO", 15033, {"size": size, "linger": 5}),
+        ("PROCESS SINGLE", 15034, None),
+        ("PROCESS AUTO", 15035, {"size": size, "linger": 5}),
+    ]
+    for name, port, batch in cases:
+        direct = not name.startswith("PROCESS")
+        process = Process(target=try_pull_many, args=("tcp://*:{0}".format(port), direct, count))
+        process.start()
+        mq = MQ("tcp://127.0.0.1:{0}".format(port), direct=direct, batch=batch)
+        start = time.time()
+        if name in ["PUSH_MANY"]:
+            for i in range(0, count, size):
+                mq.push_many([msg] * size)
+        else:
+            for i in range(0, count, 1):
+                mq.push(msg)
+        mq.flush()
+        process.join()
+        cost = time.time() - start
+        mq.release()
+        logging.warning("DEMO::BATCH::{0} count:{1} cost:{2:.3f}s msgs/s:{3:.0f}".format(name, count, cost,
+                                                                                    count / cost))
+
+
+def try_slow_pull(url: str, count: int):
+    mq = MQ(url, direct=True, hwm={"send": 100, "recv": 100})
+    for i in range(0, count, 1):
+        mq.pull_many(100, timeout=1000)
+        time.sleep(0.01)
+    mq.release()
+
+
+def demo_backpressure(count: int = 20000):
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    msg.add_datum("row event", path="event.txt")
+    for port, policy in [(15041, "drop-newest"), (15042, "drop-oldest"), (15043, "spill"), (15044, "block")]:
+        process = Process(target=try_slow_pull, args=("tcp://*:{0}".format(port), 50))
+        process.start()
+        mq = MQ("tcp://127.0.0.1:{0}".format(port), direct=True, hwm={"send": 100, "recv": 100},
+                overflow={"policy": policy, "depth": 1000})
+        start = time.time()
+        for i in range(0, count, 1):
+            mq.push(msg)
+        cost = time.time() - start
+        logging.warning("DEMO::BACKPRESSURE::{0} push:{1} cost:{2:.3f}s stats:{3}".format(policy, count, cost,
+                                                                                         mq.stats()))
+        process.join()
+        mq.release()
+
+
+def try_spool_pull(url: str, spool: str, sync: dict, count: int):
+    if sync is not None:
+        CONFIG.MQ_SPOOL_SYNC = sync
+    mq = MQ(url, direct=True, spool=spool)
+    for i in range(0, count, 1):
+        mq.pull()
+    mq.ack()
+    mq.release()
+
+
+def demo_spool_benchmark(count: int = 20000):
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    msg.add_datum("row event", path="event.txt")
+    cases = [("OFF", None), ("BATCH", {"count": 256, "interval": 50}), ("EVERY", {"count": 1, "interval": 0})]
+    for i, (name, sync) in enumerate(cases):
+        url = "tcp://127.0.0.1:{0}".format(15051 + i)
+        path = tempfile.mkdtemp(prefix="babelor.spool.")
+        pull_spool = None if sync is None else "{0}/pull".format(path)
+        push_spool = None if sync is None else "{0}/push".format(path)
+        process = Process(target=try_spool_pull, args=(url, pull_spool, sync, count))
+        process.start()
+        if sync is not None:
+            CONFIG.MQ_SPOOL_SYNC = sync
+        mq = MQ(url, direct=True, spool=push_spool)
+        start = time.time()
+        for j in range(0, count, 1):
+            mq.push(msg)
+        process.join()
+        cost = time.time() - start
+        mq.release()
+        shutil.rmtree(path)
+        logging.warning("DEMO::SPOOL::{0} count:{1} cost:{2:.3f}s msgs/s:{3:.0f}".format(name, count, cost,
+                                                                                    count / cost))
+
+
+def try_reliable_pull(url: str, reliable: dict, count: int):
+    mq = MQ(url, direct=True, reliable=reliable)
+    for i in range(0, count, 1):
+        mq.pull()
+    mq.ack()
+    mq.release()
+
+
+def demo_reliable_push_pull(count: int = 20000):
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    msg.add_datum("row event", path="event.txt")
+    cases = [("OFF", None), ("ACK EVERY", {"timeout": 30000, "retries": 3, "batch": 1}),
+             ("ACK BATCH", {"timeout": 30000, "retries": 3, "batch": 100})]
+    for i, (name, reliable) in enumerate(cases):
+        url = "tcp://127.0.0.1:{0}".format(15061 + i)
+        process = Process(target=try_reliable_pull, args=(url, reliable, count))
+        process.start()
+        mq = MQ(url, direct=True, reliable=reliable)
+        start = time.time()
+        for j in range(0, count, 1):
+            mq.push(msg)
+        process.join()
+        mq.flush()
+        cost = time.time() - start
+        logging.warning("DEMO::RELIABLE::{0} count:{1} cost:{2:.3f}s msgs/s:{3:.0f} stats:{4}".format(
+            name, count, cost, count / cost, mq.stats()))
+        mq.release()
+
+
+def demo_mode_switch(count: int = 200, drained: int = 1000):
+    # 模式切换（release + start）速率，及关闭时排空在途消息
+    for i, direct in enumerate([True, False]):
+        mq = MQ("tcp://127.0.0.1:{0}".format(15081 + i), direct=direct)
+        start = time.time()
+        for j in range(0, count, 1):
+            mq.start("PULL" if j % 2 else "PUSH")
+        mq.release()
+        cost = time.time() - start
+        logging.warning("DEMO::MODE SWITCH::{0} count:{1} cost:{2:.3f}s switches/s:{3:.0f}".format(
+            "DIRECT" if direct else "PROCESS", count, cost, count / cost))
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    puller = MQ("tcp://*:15083", direct=True)
+    puller.start("PULL")
+    pusher = MQ("tcp://127.0.0.1:15083", direct=False)
+    for i in range(0, drained, 1):
+        pusher.push(msg)
+    start = time.time()
+    pusher.release()
+    cost = time.time() - start
+    received = len(puller.pull_many(drained, timeout=CONFIG.MQ_LINGER))
+    logging.warning("DEMO::MODE SWITCH::DRAIN pushed:{0} received:{1} release:{2:.3f}s".format(
+        drained, received, cost))
+    puller.release()
+
+
+BENCH_PATTERNS = ["PUSH/PULL", "REQUEST/REPLY", "PUBLISH/SUBSCRIBE"]
+BENCH_TRANSPORTS = ["tcp", "inproc"]
+BENCH_SIZES = [100, 10 * 1024, 1024 * 1024, 100 * 1024 * 1024]
+BENCH_DATUMS = ["str", "bytes", "ndarray", "DataFrame"]
+BENCH_ENCODINGS = ["json", "xml"]
+bench_sequence = counter(15100)     # 每个用例独立端点，避免端口/inproc 地址重新绑定
+
+
+def bench_datum(datum: str, size: int):
+    # 构造指定类型、约 size 字节的数据
+    if datum in ["str"]:
+        return "x" * size
+    elif datum in ["bytes"]:
+        return bytes(size)
+    elif datum in ["ndarray"]:
+        return np.zeros(max(1, size // 8))
+    else:
+        return pd.DataFrame({"value": np.zeros(max(1, size // 8))})
+
+
+def bench_percentile(latency: list, q: float) -> float:
+    return latency[min(len(latency) - 1, int(len(latency) * q))] * 1000
+
+
+def bench_peer(pattern: str, url: str, count: int, ready: Queue, result: Queue):
+    """
+    # 对端：PULL / REPLY / SUBSCRIBE，单向模式按消息内发送时刻统计延迟
+    :param result: Queue    # (延迟列表[秒], 首条发送时刻, 末条接收时刻)
+    """
+    me = {"PUSH/PULL": "PULL", "REQUEST/REPLY": "REPLY", "PUBLISH/SUBSCRIBE": "SUBSCRIBE"}[pattern]
+    mq = MQ(url, direct=True)
+    mq.start(me)
+    ready.put(True)
+    latency, first = [], None
+    for i in range(0, count, 1):
+        if me in ["REPLY"]:
+            mq.reply(try_reply_func)
+            continue
+        msg = mq.pull() if me in ["PULL"] else mq.subscribe()
+        sent = float(msg.activity)
+        latency.append(time.time() - sent)
+        if first is None:
+            first = sent
+    result.put((latency, first, time.time()))
+    mq.release()
+
+
+def bench_case(pattern: str, transport: str, datum: str, encoding: str, size: int, count: int) -> dict:
+    """
+    :return: dict   # {"pattern", "transport", "datum", "encoding", "size", "wire_size", "count",
+                    #  "p50_ms", "p99_ms", "msgs_per_s", "mb_per_s"}
+    """
+    port = next(bench_sequence)
+    if transport in ["inproc"]:
+        bind_url = connect_url = "inproc://babelor.bench.{0}".format(port)
+    else:
+        bind_url, connect_url = "tcp://*:{0}".format(port), "tcp://127.0.0.1:{0}".format(port)
+    tpe, CONFIG.MSG_TPE = CONFIG.MSG_TPE, encoding
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    msg.add_datum(bench_datum(datum, size), path="bench")
+    msg.activity = str(time.time())
+    wire_size = len(msg.to_bytes())
+    ready, result = Queue(), Queue()
+    # tcp 对端在独立进程（不争用 GIL），inproc 须同一进程（共享上下文）
+    peer_cls = threading.Thread if transport in ["inproc"] else Process
+    mq = MQ(connect_url if pattern != "PUBLISH/SUBSCRIBE" else bind_url, direct=True)
+    if pattern in ["PUBLISH/SUBSCRIBE"]:
+        mq.start("PUBLISH")
+        peer = peer_cls(target=bench_peer, args=(pattern, connect_url, count, ready, result))
+    else:
+        peer = peer_cls(target=bench_peer, args=(pattern, bind_url, count, ready, result))
+    peer.start()
+    ready.get()
+    if pattern in ["PUBLISH/SUBSCRIBE"]:
+        time.sleep(0.2)     # 等待订阅生效     slow joiner
+    rtt = []
+    start = time.time()
+    for i in range(0, count, 1):
+        msg.activity = str(time.time())
+        if pattern in ["PUSH/PULL"]:
+            mq.push(msg)
+        elif pattern in ["PUBLISH/SUBSCRIBE"]:
+            mq.publish(msg)
+        else:
+            sent = time.time()
+            mq.request(msg)
+            rtt.append(time.time() - sent)
+    if pattern in ["REQUEST/REPLY"]:
+        latency, first, last = rtt, start, time.time()
+        result.get()
+    else:
+        latency, first, last = result.get()
+    peer.join()
+    mq.release()
+    CONFIG.MSG_TPE = tpe
+    latency.sort()
+    cost = max(last - first, 1e-9)
+    return {"pattern": pattern, "transport": transport, "datum": datum, "encoding": encoding, "size": size,
+            "wire_size": wire_size, "count": count,
+            "p50_ms": round(bench_percentile(latency, 0.50), 3), "p99_ms": round(bench_percentile(latency, 0.99), 3),
+            "msgs_per_s": round(count / cost, 1), "mb_per_s": round(count * size / cost / 1024 / 1024, 3)}
+
+
+def demo_mq_benchmark(output: str = None, patterns: list = None, transports: list = None, sizes: list = None,
+                      datums: list = None, encodings: list = None, budget: int = 64 * 1024 * 1024,
+                      max_count: int = 2000):
+    """
+    # MQ 基准：模式 × 传输 × 数据类型 × 封装 × 大小，每个用例输出一行 JSON
+    :param output: str          # JSON Lines 输出文件（追加），None 为仅输出日志
+    :param budget: int          # 每个用例的数据总量（字节），用于决定消息数
+    :param max_count: int       # 每个用例最多消息数（至少 3 条）
+    """
+    results = []
+    for pattern in BENCH_PATTERNS if patterns is None else patterns:
+        for transport in BENCH_TRANSPORTS if transports is None else transports:
+            for encoding in BENCH_ENCODINGS if encodings is None else encodings:
+                for datum in BENCH_DATUMS if datums is None else datums:
+                    for size in BENCH_SIZES if sizes is None else sizes:
+                        count = max(3, min(max_count, budget // size))
+                        rt = bench_case(pattern, transport, datum, encoding, size, count)
+                        logging.warning("DEMO::BENCH {0}".format(json.dumps(rt)))
+                        results.append(rt)
+                        if output is not None:
+                            with open(output, "a") as file:
+                                file.write(json.dumps(rt) + "\n")
+    return results
+
+
 if __name__ == '__main__':
     demo_push_pull()
     # demo_request_reply()
     # demo_publish_subscribe()
+    # demo_direct_benchmark()
+    # demo_async_endpoints()
+    # demo_router_request_reply()
+    # demo_batch_push_pull()
+    # demo_backpressure()
+    # demo_spool_benchmark()
+    # demo_reliable_push_pull()
+    # demo_mq_benchmark(output="bench_output.txt")
+    # demo_mode_switch()
@@ -17,7 +17,7 @@
 import json
 from xml.etree import ElementTree
 # Outer Required
-# import msgpack
+import msgpack
 # Inner Required
 # Global Parameters
 from Babelor.Config import CONFIG
@@ -39,7 +39,7 @@ def etree2dict(root: ElementTree.Element) -> dict:
         if ini_tag is None:
             ini_tag = child.tag
         if ini_tag == child.tag:
-            if len(child.getchildren()) > 0:
+            if len(child) > 0:
                 child_dt = etree2dict(child)
                 child_dt.update(child.attrib)
             else:
@@ -48,7 +48,7 @@ def etree2dict(root: ElementTree.Element) -> dict:
         else:
             dt[ini_tag] = lt
             ini_tag = child.tag
-            if len(child.getchildren()) > 0:
+            if len(child) > 0:
                 child_dt = etree2dict(child)
                 child_dt.update(child.attrib)
             else:
@@ -60,11 +60,59 @@ def etree2dict(root: ElementTree.Element) -> dict:
 
 
 def xml2json(xml: str) -> str:
-    return dict2json(etree2dict(ElementTree.fromstring(xml.strip())))
+    return dict2json(xml2dict(xml))
 
 
-def xml2dict(xml: str) -> dict:
-    return etree2dict(ElementTree.fromstring(xml.strip()))
+def xml2dict(xml: (str, bytes)) -> dict:
+    """
+    增量解析 XML，结果与 etree2dict(ElementTree.fromstring(xml)) 一致，已处理的元素即时从父元素摘除并释放
+    :param xml: (str, bytes)
+    :return: dict
+    """
+    start, end = 0, len(xml)
+    while (start < end) and xml[start:start + 1].isspace():     # 不复制输入，等价于 xml.strip()
+        start += 1
+    while (end > start) and xml[end - 1:end].isspace():
+        end -= 1
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    stack = []      # [[dt, lt, ini_tag, elem], ]   与 etree2dict 相同的分组状态
+    rt = {}
+    for offset in range(start, end, CONFIG.XML_PARSE_CHUNK):
+        parser.feed(xml[offset:min(offset + CONFIG.XML_PARSE_CHUNK, end)])
+        rt = _iter_xml_events(parser, stack, rt)
+    parser.close()
+    return _iter_xml_events(parser, stack, rt)
+
+
+def _iter_xml_events(parser: ElementTree.XMLPullParser, stack: list, rt: dict) -> dict:
+    for event, elem in parser.read_events():
+        if event == "start":
+            stack.append([{}, [], None, elem])
+            continue
+        dt, lt, ini_tag, elem = stack.pop()
+        if ini_tag is not None:
+            dt[ini_tag] = lt
+            value = dt
+        else:
+            value = elem.text
+        # ----------------------------------------------------------------------
+        if len(stack) == 0:
+            rt = dt
+        else:
+            if ini_tag is not None:
+                dt.update(elem.attrib)
+            parent = stack[-1]
+            if parent[2] is None:
+                parent[2] = elem.tag
+            if parent[2] == elem.tag:
+                parent[1].append(value)
+            else:
+                parent[0][parent[2]] = parent[1]
+                parent[1] = [value]
+                parent[2] = elem.tag
+            del parent[3][:]        # 父元素不再持有已处理的子元素     detach the consumed child from its parent
+        elem.clear()
+    return rt
 
 
 def dict2etree(dt: dict, tag=CONFIG.XML_ROOT_TAG, parent=None) -> ElementTree.Element:
@@ -79,21 +127,82 @@ def dict2etree(dt: dict, tag=CONFIG.XML_ROOT_TAG, parent=None) -> ElementTree.El
                     dict2etree(lt_child, key, root)
                 else:
                     child = ElementTree.SubElement(root, key)
-                    child.text = lt_child
+                    child.text = etree_text(lt_child)
         elif isinstance(dt[key], dict):
             dict2etree(dt[key], key, root)
         else:
             child = ElementTree.SubElement(root, key)
-            child.text = dt[key]
+            child.text = etree_text(dt[key])
     return root
 
 
+def etree_text(value) -> (str, None):
+    if value is None:
+        return None
+    elif isinstance(value, str):
+        return value
+    else:
+        return str(value)
+
+
 def json2xml(js: str) -> str:
-    return ElementTree.tostring(dict2etree(json2dict(js)), encoding=CONFIG.Coding).decode(CONFIG.Coding)
+    return dict2xml(json2dict(js))
 
 
 def dict2xml(dt: dict) -> str:
-    return ElementTree.tostring(dict2etree(dt), encoding=CONFIG.Coding).decode(CONFIG.Coding)
+    """
+    增量生成 XML，结果与 ElementTree.tostring(dict2etree(dt)) 一致，不构建 ElementTree
+    :param dt: dict
+    :return: str
+    """
+    return "".join(iter_xml(dt))
+
+
+def iter_xml(dt: dict, tag=CONFIG.XML_ROOT_TAG):
+    """
+    按片段生成 XML 字符串
+    :param dt: dict
+    :param tag: str     # 元素标签
+    :return: generator of str
+    """
+    is_empty = True
+    for piece in _iter_xml_children(dt):
+        if is_empty:
+            yield "<{0}>".format(tag)
+            is_empty = False
+        yield piece
+    if is_empty:
+        yield "<{0} />".format(tag)
+    else:
+        yield "</{0}>".format(tag)
+
+
+def _iter_xml_children(dt: dict):
+    for key in dt.keys():
+        if isinstance(dt[key], list):
+            children = dt[key]
+        else:
+            children = [dt[key]]
+        for child in children:
+            if isinstance(child, dict):
+                # dict2etree 中以根标签命名的子字典不挂载到父节点     dict2etree drops nested root tags
+                if key not in [CONFIG.XML_ROOT_TAG]:
+                    yield from iter_xml(child, key)
+            else:
+                text = etree_text(child)
+                if text:
+                    yield "<{0}>".format(key)
+                    yield xml_escape(text)
+                    yield "</{0}>".format(key)
+                else:
+                    yield "<{0} />".format(key)
+
+
+def xml_escape(text: str) -> str:
+    if ("&" in text) or ("<" in text) or (">" in text):
+        return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    else:
+        return text
 
 
 def extract_multi_values_from_keys(dt, *args):
@@ -163,9 +272,9 @@ def extract_from_key(*args, **kwargs):
         return rt
 
 
-# def dict2msgpack(dt: dict) -> str:
-#     return msgpack.packb(dt)
+def dict2msgpack(dt: dict) -> bytes:
+    return msgpack.packb(dt, use_bin_type=True)
 
 
-# def msgpack2dict(msg_pack: str) -> dict:
-#     return msgpack.unpackb(msg_pack)
+def msgpack2dict(msg_pack: bytes) -> dict:
+    return msgpack.unpackb(msg_pack, raw=False)
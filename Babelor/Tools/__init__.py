@@ -15,7 +15,8 @@
 
 # Inner Required
 from Babelor.Tools.Conversion import json2dict, json2xml,\
-    dict2json, dict2xml, dict2etree,\
+    dict2json, dict2xml, dict2etree, iter_xml,\
     etree2dict, \
-    xml2dict, xml2json  # ,msgpack2dict, dict2msgpack
+    xml2dict, xml2json, \
+    msgpack2dict, dict2msgpack
 from Babelor.Tools.Schedule import TASKS
@@ -14,9 +14,9 @@
 # limitations under the License.
 
 # Inner Required
-from Babelor.Presentation import MSG, URL, CASE
-from Babelor.Application import TEMPLE
-from Babelor.Session import MQ
+from Babelor.Presentation import MSG, URL, CASE, ROUTE
+from Babelor.Application import TEMPLE, AsyncTEMPLE
+from Babelor.Session import MQ, AsyncMQ
 from Babelor.Tools import TASKS
 
 # Let users know if they're missing any of hard dependencies
@@ -25,6 +25,7 @@ hard_dependencies = (
     "numpy",            # python array computing                解释器：数组分析
     "sqlalchemy",       # python database connector             SQL 连接器
     "zmq",              # python binding for 0mq                消息中间件
+    "msgpack",          # python binding for msgpack            二进制消息封装
     "xlrd",             # python excel file read connector      EXCEL 读连接器 (XLS)
     "xlwt",             # python excel file write connector     EXCEL 写连接器 (XLS)
     "pyftpdlib",        # python async ftp server               FTPD 服务器
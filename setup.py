@@ -47,12 +47,21 @@ INSTALL_REQUIRED = [
     "pandas>=0.23.4",           # python data analysis and statical     解释器：关系和标签类数据分析和统计
     "python-dateutil>=2.7.5",   # python data util                      解释器：通用数据结构
     "pyzmq>=17.1.2",            # python binding for 0mq                消息中间件
+    "msgpack>=0.6.0",           # python binding for msgpack            二进制消息封装
     "pyftpdlib>=1.5.4",         # python async ftp server               FTPD 服务器
     "xlrd>=1.2.0",              # python excel file read connector      EXCEL 读连接器 (XLS)
     "xlwt>=1.3.0",              # python excel file write connector     EXCEL 写连接器 (XLS)
     "openpyxl>=2.5.3",          # python excel file connector           EXCEL 连接器 (XLSX)
 ]
 
+# 库可选外部包
+# Extra Required
+EXTRAS_REQUIRED = {
+    "arrow": ["pyarrow>=0.13.0", ],     # python binding for apache arrow       列式数据传输
+    "zstd": ["zstandard>=0.11.0", ],    # python binding for zstandard          数据压缩 (zstd)
+    "lz4": ["lz4>=2.1.0", ],            # python binding for lz4                数据压缩 (lz4)
+}
+
 # 库分类
 CLASSIFIERS = [
     # 开发状态
@@ -176,6 +185,7 @@ if __name__ == '__main__':
         include_package_data=True,              # 库包含数据
         zip_safe=True,                          # 压缩安全
         install_requires=INSTALL_REQUIRED,      # 安装外部依赖库
+        extras_require=EXTRAS_REQUIRED,         # 安装可选依赖库
     )   # 封库    Packaged
 
 
@@ -0,0 +1,282 @@
+# coding=utf-8
+# Copyright 2019 StrTrek Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# System Required
+import os
+# Outer Required
+import numpy as np
+import pandas as pd
+import pytest
+# Inner Required
+from xml.etree import ElementTree
+from Babelor.Presentation import MSG, URL, CASE, DATUM, ARGS
+from Babelor.Presentation import Datum
+from Babelor.Presentation.Datum import split_coding, ndarray_to_stream
+from Babelor.Tools import xml2dict, dict2xml
+from Babelor.Tools.Conversion import etree2dict
+# Global Parameters
+from Babelor.Config import CONFIG
+
+
+CODECS = ["json", "xml", "msgpack"]
+
+
+@pytest.fixture(params=CODECS)
+def codec(request):
+    msg_tpe = CONFIG.MSG_TPE
+    CONFIG.MSG_TPE = request.param
+    yield request.param
+    CONFIG.MSG_TPE = msg_tpe
+
+
+def sample_msg() -> MSG:
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    msg.destination = URL("file:///tmp/babelor/")
+    msg.case = CASE("{0}#{1}".format(msg.origination, msg.destination))
+    msg.activity = "init"
+    msg.add_datum("中文UTF-8编码测试", path="str.txt")
+    msg.add_datum(os.urandom(1024), path="bytes.bin")
+    msg.add_datum(np.arange(0, 64, dtype=np.float64).reshape((8, 8)), path="ndarray.npy")
+    msg.add_datum(None, path="none.txt")
+    msg.add_args("select * from dual", path="query.sql")
+    return msg
+
+
+def assert_same(new_msg: MSG, msg: MSG):
+    assert str(new_msg.origination) == str(msg.origination)
+    assert str(new_msg.destination) == str(msg.destination)
+    assert str(new_msg.case) == str(msg.case)
+    assert new_msg.activity == msg.activity
+    assert new_msg.dt_count == msg.dt_count
+    assert new_msg.args_count == msg.args_count
+    assert new_msg.read_args(0) == msg.read_args(0)
+    for i in range(0, msg.dt_count, 1):
+        new_datum, datum = new_msg.read_datum(i), msg.read_datum(i)
+        assert new_datum["path"] == datum["path"]
+        if isinstance(datum["stream"], np.ndarray):
+            assert np.array_equal(new_datum["stream"], datum["stream"])
+        else:
+            assert new_datum["stream"] == datum["stream"]
+
+
+def test_msg_bytes(codec):
+    msg = sample_msg()
+    assert_same(MSG(msg.to_bytes()), msg)
+
+
+def test_msg_string(codec):
+    msg = sample_msg()
+    assert_same(MSG(str(msg)), msg)
+
+
+def test_msg_frames(codec):
+    msg = sample_msg()
+    new_msg = MSG()
+    new_msg.from_frames(msg.to_frames())
+    assert_same(new_msg, msg)
+
+
+def test_datum_args_string(codec):
+    msg = sample_msg()
+    datum = DATUM(str(msg.data))
+    arguments = ARGS(str(msg.arguments))
+    assert datum.count == msg.dt_count
+    assert datum.read(0) == msg.read_datum(0)
+    assert arguments.read(0) == msg.read_args(0)
+
+
+@pytest.mark.parametrize("dataframe_tpe", ["arrow", "pickle"])
+def test_dataframe(codec, dataframe_tpe, monkeypatch):
+    monkeypatch.setattr(CONFIG, "DATAFRAME_PICKLE", True)
+    dataframe_tpe, CONFIG.DATAFRAME_TPE = CONFIG.DATAFRAME_TPE, dataframe_tpe
+    try:
+        df = pd.DataFrame({"ID": np.arange(0, 10, 1), "NAME": ["name-{0}".format(i) for i in range(0, 10, 1)]})
+        msg = MSG()
+        msg.add_datum(df, "dataframe.xlsx")
+        new_df = MSG(msg.to_bytes()).read_datum(0)["stream"]
+    finally:
+        CONFIG.DATAFRAME_TPE = dataframe_tpe
+    assert new_df.equals(df.astype(str))
+
+
+def test_dataframe_pickle_disabled(codec, monkeypatch):
+    df = pd.DataFrame({"ID": np.arange(0, 10, 1)})
+    monkeypatch.setattr(CONFIG, "DATAFRAME_TPE", "pickle")
+    with pytest.raises(PermissionError):
+        MSG().add_datum(df, "dataframe.xlsx")
+    monkeypatch.setattr(CONFIG, "DATAFRAME_PICKLE", True)
+    msg = MSG()
+    msg.add_datum(df, "dataframe.xlsx")
+    message = msg.to_bytes()
+    monkeypatch.setattr(CONFIG, "DATAFRAME_PICKLE", False)
+    with pytest.raises(PermissionError):                # 默认拒绝解封收到的 pickle
+        MSG(message).read_datum(0)
+
+
+@pytest.mark.parametrize("chunk", [7, 64 * 1024])
+def test_xml2dict_chunks(chunk):
+    xml = dict2xml({"row": [{"id": str(i), "name": "<name & {0}>".format(i), "empty": None} for i in range(0, 50, 1)],
+                    "path": ["a.txt", "b.txt"], "nested": {"level": [{"leaf": "x"}]}})
+    xml = "\n  {0}<!-- tail -->\n".format(xml.replace("<row>", '<row kind="r">'))
+    chunk, CONFIG.XML_PARSE_CHUNK = CONFIG.XML_PARSE_CHUNK, chunk
+    try:
+        assert xml2dict(xml) == etree2dict(ElementTree.fromstring(xml.strip()))
+        assert xml2dict(xml.encode(CONFIG.Coding)) == etree2dict(ElementTree.fromstring(xml.strip()))
+    finally:
+        CONFIG.XML_PARSE_CHUNK = chunk
+
+
+@pytest.fixture
+def lazy():
+    msg_lazy = CONFIG.MSG_LAZY
+    CONFIG.MSG_LAZY = True
+    yield
+    CONFIG.MSG_LAZY = msg_lazy
+
+
+def test_lazy_forward_untouched(codec, lazy):
+    message = sample_msg().to_bytes()
+    assert MSG(message).to_bytes() is message
+
+
+@pytest.mark.parametrize("mutate", [
+    lambda msg: setattr(msg.origination, "port", 99),
+    lambda msg: setattr(msg.case, "timestamp", "2019-01-01 00:00:00.000000"),
+    lambda msg: msg.data.add(b"babelor", "add.bin"),
+    lambda msg: msg.data.remove(0),
+    lambda msg: msg.arguments.add("select 1 from dual", "add.sql"),
+    lambda msg: msg.add_datum(b"babelor", "add.bin"),
+])
+def test_lazy_nested_mutation(codec, lazy, mutate):
+    msg = sample_msg()
+    message = msg.to_bytes()
+    new_msg = MSG(message)
+    mutate(new_msg)
+    expected = new_msg.to_dict()
+    new_message = new_msg.to_bytes()
+    assert new_message != message
+    decoded = MSG(new_message)
+    assert str(decoded.origination) == str(expected["head"]["origination"])
+    assert str(decoded.case) == str(expected["head"]["case"])
+    assert decoded.data.count == new_msg.data.count
+    assert decoded.arguments.count == new_msg.arguments.count
+
+
+def test_lazy_nested_mutation_frames(codec, lazy):
+    frames = sample_msg().to_frames()
+    new_msg = MSG()
+    new_msg.from_frames(frames)
+    assert new_msg.to_frames() is frames
+    new_msg.destination.path = "/tmp/other"
+    new_frames = new_msg.to_frames()
+    assert new_frames is not frames
+    decoded = MSG()
+    decoded.from_frames(new_frames)
+    assert str(decoded.destination) == str(new_msg.destination)
+
+
+@pytest.fixture(params=["zlib", "zstd", "lz4"])
+def compress_codec(request):
+    if (request.param not in ["zlib"]) and (getattr(Datum, request.param) is None):
+        pytest.skip("{0} is not installed.".format(request.param))
+    yield request.param
+
+
+def test_compress_roundtrip(codec, compress_codec):
+    compress = {"codec": compress_codec}
+    msg = MSG()
+    msg.add_datum(b"babelor" * 1024, path="bytes.bin", compress=compress)
+    msg.add_datum("中文UTF-8编码测试" * 512, path="str.txt", compress=compress)
+    msg.add_datum(np.zeros((32, 32), dtype=np.float64), path="ndarray.npy", compress=compress)
+    msg.add_datum(os.urandom(1024), path="random.bin", compress=compress)
+    msg.add_datum(b"babelor" * 1024, path="small.bin", compress={"codec": compress_codec, "threshold": 65536})
+    codings = [split_coding(coding) for coding in msg.data.coding]
+    assert [compressed for compressed, coding in codings] == [compress_codec] * 3 + [None, None]   # 压缩无益或低于阈值
+    assert codings[1][1] == "utf-8"
+    assert_same(MSG(msg.to_bytes()), msg)
+    new_msg = MSG()
+    new_msg.from_frames(msg.to_frames())
+    assert_same(new_msg, msg)
+
+
+def test_compress_chunk(codec, compress_codec):
+    msg = MSG()
+    msg.add_chunk(b"babelor" * 1024, "chunk.bin", 1, 3, 7168, 21504, compress={"codec": compress_codec})
+    assert split_coding(msg.data.coding[0])[0] == compress_codec
+    chunk = MSG(msg.to_bytes()).read_chunk(0)
+    assert (chunk["seq"], chunk["count"], chunk["offset"], chunk["size"]) == (1, 3, 7168, 21504)
+    assert (chunk["path"], chunk["stream"]) == ("chunk.bin", b"babelor" * 1024)
+
+
+def test_compress_hooks(monkeypatch):
+    stats = []
+    monkeypatch.setattr(Datum, "compress_hooks", [stats.append])
+    monkeypatch.setattr(CONFIG, "DATUM_COMPRESS", {"codec": "zlib", "threshold": 1024})
+    msg = MSG()
+    msg.add_datum(b"babelor" * 1024, path="bytes.bin")          # 默认压缩策略
+    msg.add_datum(b"babelor", path="small.bin")                 # 低于阈值，不压缩也不统计
+    assert [(st["action"], st["codec"], st["size"]) for st in stats] == [("compress", "zlib", 7168)]
+    assert stats[0]["compressed"] < stats[0]["size"]
+    assert stats[0]["ratio"] == stats[0]["size"] / stats[0]["compressed"]
+    assert MSG(msg.to_bytes()).read_datum(0)["stream"] == b"babelor" * 1024
+    assert [(st["action"], st["size"], st["compressed"]) for st in stats[1:]] == [
+        ("decompress", 7168, stats[0]["compressed"])]
+
+
+ARRAYS = {
+    "fortran": np.asfortranarray(np.arange(0, 64, dtype=np.float64).reshape((8, 8))),
+    "slice": np.arange(0, 256, dtype=np.int32).reshape((16, 16))[::2, 1::3],
+    "transpose": np.arange(0, 24, dtype=">f4").reshape((2, 3, 4)).T,
+    "structured": np.array([(1, 0.5, b"babelor"), (2, 1.5, b"temple")],
+                           dtype=[("id", "<i4"), ("value", "<f8"), ("name", "S8")]),
+    "empty": np.zeros((0, 3), dtype=np.int64),
+}
+
+
+@pytest.mark.parametrize("name", list(ARRAYS.keys()))
+def test_ndarray_layout(codec, name):
+    arr = ARRAYS[name]
+    is_fortran = arr.flags.f_contiguous and not arr.flags.c_contiguous
+    msg = MSG()
+    msg.add_datum(arr, path="{0}.npy".format(name))
+    for new_msg in [MSG(msg.to_bytes()), MSG(str(msg))]:
+        new_arr = new_msg.read_datum(0)["stream"]
+        assert (new_arr.dtype, new_arr.shape) == (arr.dtype, arr.shape)
+        assert new_arr.tolist() == arr.tolist()
+        assert new_arr.flags["F_CONTIGUOUS" if is_fortran else "C_CONTIGUOUS"]      # 按原内存布局还原
+        assert not new_arr.flags.writeable                          # 只读视图，修改前须 copy()
+        with pytest.raises(ValueError):
+            new_arr[...] = 0
+        writable = new_arr.copy()
+        writable[...] = 0
+        assert new_msg.read_datum(0)["stream"].tolist() == arr.tolist()
+
+
+def test_ndarray_stream_copy():
+    arr = ARRAYS["fortran"]
+    stream, header = ndarray_to_stream(arr)
+    assert header["fortran_order"] and np.shares_memory(np.frombuffer(stream, dtype=np.uint8), arr)   # 连续数组不拷贝
+    arr = ARRAYS["slice"]
+    stream, header = ndarray_to_stream(arr)
+    assert not (header["fortran_order"] or np.shares_memory(np.frombuffer(stream, dtype=np.uint8), arr))
+
+
+def test_ndarray_object_dtype():
+    msg = MSG()
+    with pytest.raises(ValueError):
+        msg.add_datum(np.array([1, "babelor", None], dtype=object), path="object.npy")
+    with pytest.raises(ValueError):
+        msg.add_datum(np.array([(1, None)], dtype=[("id", "<i4"), ("value", "O")]), path="object.npy")
@@ -0,0 +1,70 @@
+# coding=utf-8
+# Copyright 2019 StrTrek Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# System Required
+import os
+import random
+# Outer Required
+import pytest
+# Inner Required
+from Babelor.Presentation import MSG
+from Babelor.Data import FILE
+# Global Parameters
+from Babelor.Config import CONFIG
+
+
+@pytest.fixture
+def chunks(tmp_path, monkeypatch):
+    monkeypatch.chdir("/")                      # "file:///<path>" 解析为相对路径
+    chunk_size, CONFIG.DATUM_CHUNK_SIZE = CONFIG.DATUM_CHUNK_SIZE, 1024
+    stream = os.urandom(10 * 1024 + 100)
+    (tmp_path / "source").mkdir()
+    (tmp_path / "source" / "big.bin").write_bytes(stream)
+    msg = MSG()
+    msg.add_args("", path="big.bin")
+    msgs = list(FILE("file://{0}".format(tmp_path / "source")).read_iter(msg))[1:]
+    yield stream, [MSG(msg_chunk.to_bytes()) for msg_chunk in msgs], tmp_path / "target"
+    CONFIG.DATUM_CHUNK_SIZE = chunk_size
+
+
+def test_chunks_in_order(chunks):
+    stream, msgs, target = chunks
+    assert len(msgs) == 11
+    for msg in msgs:
+        FILE("file://{0}".format(target)).write(msg)
+    assert (target / "big.bin").read_bytes() == stream
+    assert sorted(os.listdir(target)) == ["big.bin"]
+
+
+def test_chunks_out_of_order(chunks):
+    stream, msgs, target = chunks
+    random.Random(0).shuffle(msgs)
+    msgs.sort(key=lambda msg: msg.read_chunk(0)["seq"] != 0)
+    msgs.reverse()                              # seq 0 last, the final chunk arrives early
+    for i, msg in enumerate(msgs):
+        FILE("file://{0}".format(target)).write(msg)
+        if i < len(msgs) - 1:
+            assert not (target / "big.bin").exists()
+    assert (target / "big.bin").read_bytes() == stream
+    assert sorted(os.listdir(target)) == ["big.bin"]
+
+
+def test_chunks_duplicated(chunks):
+    stream, msgs, target = chunks
+    for msg in msgs[:5] + msgs[:5] + msgs[5:]:
+        FILE("file://{0}".format(target)).write(msg)
+    FILE("file://{0}".format(target)).write(msgs[3])   # 完成后的重投块被忽略
+    assert (target / "big.bin").read_bytes() == stream
+    assert sorted(os.listdir(target)) == ["big.bin"]
@@ -0,0 +1,461 @@
+# coding=utf-8
+# Copyright 2019 StrTrek Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# System Required
+import os
+import time
+import signal
+import tempfile
+import asyncio
+import threading
+from multiprocessing import Process, Pipe
+# Outer Required
+import zmq
+import pytest
+# Inner Required
+from Babelor.Presentation import MSG, URL
+from Babelor.Session import MQ
+from Babelor.Session.MessageQueue import AsyncZMQ, send_acks, BATCH_MARK, msg_to_frames, msgs_to_frames, \
+    split_frames, frames_to_msgs, stop_process
+from Babelor.Session.Spool import SPOOL
+# Global Parameters
+from Babelor.Config import CONFIG
+
+
+def reply_func(msg: MSG):
+    if msg.activity == "error":
+        raise ValueError("bad request")
+    msg.destination = URL().init("oracle")
+    return msg
+
+
+def sample_msgs(activities: list) -> list:
+    msgs = []
+    for activity in activities:
+        msg = MSG()
+        msg.origination = URL("tcp://127.0.0.1:10001")
+        msg.activity = activity
+        msgs.append(msg)
+    return msgs
+
+
+@pytest.mark.parametrize("multipart", [False, True])
+def test_batch_frames(multipart, monkeypatch):
+    monkeypatch.setattr(CONFIG, "MQ_MULTIPART", multipart)
+    msgs = sample_msgs(["0", "1", "2"])
+    msgs[1].add_datum(b"babelor", path="a.bin")
+    msgs[1].add_datum(b"", path="b.bin")
+    frames = [zmq.Frame(bytes(frame)) for frame in msgs_to_frames(msgs)]
+    assert frames[0].bytes.startswith(BATCH_MARK)
+    assert [len(msg_frames) for msg_frames in split_frames(frames)] == [len(msg_to_frames(msg)) for msg in msgs]
+    new_msgs = frames_to_msgs(frames)
+    assert [msg.activity for msg in new_msgs] == ["0", "1", "2"]
+    assert [new_msgs[1].read_datum(i)["stream"] for i in range(0, 2, 1)] == [b"babelor", b""]
+    single = [zmq.Frame(bytes(frame)) for frame in msg_to_frames(msgs[1])]
+    assert [msg.activity for msg in frames_to_msgs(single)] == ["1"]          # 单条消息原样兼容
+
+
+def test_push_many_pull_many():
+    puller = MQ("tcp://*:20471", direct=True)
+    puller.start("PULL")
+    pusher = MQ("tcp://127.0.0.1:20471", direct=True)
+    try:
+        pusher.push_many(sample_msgs(["0", "1", "2", "3", "4"]))
+        pusher.push(sample_msgs(["5"])[0])                  # 批量与单条混合
+        pusher.push_many([])
+        pusher.push_many(sample_msgs(["6", "7"]))
+        assert [msg.activity for msg in puller.pull_many(3)] == ["0", "1", "2"]   # 批量跨越取出上限
+        assert puller.pull().activity == "3"
+        msgs = []
+        while len(msgs) < 4:
+            msgs += puller.pull_many(10, 1000)
+        assert [msg.activity for msg in msgs] == ["4", "5", "6", "7"]
+        assert puller.pull_many(10, 100) == []
+    finally:
+        pusher.release()
+        puller.release()
+
+
+def test_auto_batch_size():
+    receiver = zmq.Context.instance().socket(zmq.PULL)
+    receiver.bind("tcp://*:20472")
+    pusher = MQ("tcp://127.0.0.1:20472", direct=True, batch={"size": 3, "linger": 50})
+    try:
+        for msg in sample_msgs([str(i) for i in range(0, 7, 1)]):
+            pusher.push(msg)
+        batches = []
+        while receiver.poll(1000):
+            frames = receiver.recv_multipart(copy=False)
+            batches.append([msg.activity for msg in frames_to_msgs(frames)])
+            if sum([len(batch) for batch in batches]) >= 7:
+                break
+    finally:
+        pusher.release()
+        receiver.close(linger=0)
+    assert batches == [["0", "1", "2"], ["3", "4", "5"], ["6"]]      # 达到批量大小即发送，余下等待后发送
+
+
+def test_router_reply_error():
+    replier = MQ("tcp://*:20411", direct=True, router=True, workers=4)
+    thread = threading.Thread(target=lambda: [replier.reply(reply_func) for i in range(0, 4, 1)])
+    thread.start()
+    requester = MQ("tcp://127.0.0.1:20411", direct=True, router=True)
+    try:
+        with pytest.raises(RuntimeError, match="ValueError: bad request"):
+            requester.request_many(sample_msgs(["0", "error", "2"]))
+        msg = requester.request(sample_msgs(["3"])[0])      # 出错后的应答不残留
+        assert msg.activity == "3"
+        assert msg.destination.scheme == "oracle"
+    finally:
+        thread.join(5)
+        requester.release()
+        replier.release()
+
+
+def test_async_router_reply_error():
+    async def run():
+        replier = AsyncZMQ("tcp://*:20412", router=True, workers=4)
+        requester = AsyncZMQ("tcp://127.0.0.1:20412", router=True)
+        serving = asyncio.ensure_future(replier.reply(reply_func, times=3))
+        try:
+            results = await asyncio.wait_for(asyncio.gather(
+                *[requester.request(msg) for msg in sample_msgs(["0", "error", "2"])], return_exceptions=True), 5)
+            await serving
+        finally:
+            requester.release()
+            replier.release()
+        return results
+    results = asyncio.run(run())
+    assert [msg.activity for msg in [results[0], results[2]]] == ["0", "2"]
+    assert isinstance(results[1], RuntimeError)
+
+
+def test_async_release_fails_pending():
+    silent = zmq.Context.instance().socket(zmq.ROUTER)     # 收到请求但从不应答
+    silent.bind("tcp://*:20413")
+
+    async def run():
+        requester = AsyncZMQ("tcp://127.0.0.1:20413", router=True)
+        requests = [asyncio.ensure_future(requester.request(msg)) for msg in sample_msgs(["0", "1"])]
+        while len(requester.pending) < 2:
+            await asyncio.sleep(0.01)
+        reader = requester.reader
+        requester.release()
+        results = await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), 5)
+        await asyncio.sleep(0)
+        return results, reader
+    try:
+        results, reader = asyncio.run(run())
+    finally:
+        silent.close(linger=0)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert reader.cancelled()
+
+
+def test_spool_acked_by_receiver(tmp_path):
+    push_spool, pull_spool = str(tmp_path / "push"), str(tmp_path / "pull")
+    pusher = MQ("tcp://127.0.0.1:20414", direct=True, spool=push_spool)
+    for msg in sample_msgs(["0", "1", "2"]):
+        pusher.push(msg)
+    pusher.release(200)
+    # 已交给套接字但无接收方确认：保留在持久化缓冲中
+    assert [seq for seq, frames in SPOOL(push_spool).replay()] == [1, 2, 3]
+    puller = MQ("tcp://*:20414", direct=True, spool=pull_spool)
+    pusher = MQ("tcp://127.0.0.1:20414", direct=True, spool=push_spool)
+    try:
+        pusher.push(sample_msgs(["3"])[0])      # 先回放未确认的消息
+        assert [puller.pull().activity for i in range(0, 4, 1)] == ["0", "1", "2", "3"]
+        puller.ack()
+        pusher.flush()
+    finally:
+        pusher.release(1000)
+        puller.release()
+    assert SPOOL(push_spool).replay() == []
+    assert SPOOL(pull_spool).replay() == []
+
+
+def wait_stats(pusher: MQ, key: str, value: int, timeout: float = 5) -> dict:
+    # 直连 PUSH 在调用时处理确认/否认及超时重发
+    deadline = time.time() + timeout
+    while (pusher.stats()[key] != value) and (time.time() < deadline):
+        pusher.flush()
+        time.sleep(0.01)
+    return pusher.stats()
+
+
+def test_reliable_nack_redelivers():
+    reliable = {"timeout": 10000, "retries": 3, "batch": 1}
+    puller = MQ("tcp://*:20461", direct=True, reliable=reliable)
+    puller.start("PULL")
+    pusher = MQ("tcp://127.0.0.1:20461", direct=True, reliable=reliable)
+    try:
+        pusher.push(sample_msgs(["0"])[0])
+        assert puller.pull().activity == "0"
+        puller.nack(puller.detach())                        # 远早于可见性超时，立即重发
+        assert wait_stats(pusher, "redelivered", 1)["inflight"] == 1
+        assert puller.pull().activity == "0"
+        puller.ack(puller.detach())
+        stats = wait_stats(pusher, "inflight", 0)
+    finally:
+        pusher.release(200)
+        puller.release()
+    assert (stats["inflight"], stats["redelivered"], stats["dead"]) == (0, 1, 0)
+
+
+def test_reliable_timeout_redelivers():
+    reliable = {"timeout": 200, "retries": 3, "batch": 1}
+    puller = MQ("tcp://*:20462", direct=True, reliable=reliable)
+    puller.start("PULL")
+    pusher = MQ("tcp://127.0.0.1:20462", direct=True, reliable=reliable)
+    try:
+        pusher.push(sample_msgs(["0"])[0])
+        assert puller.pull().activity == "0"
+        tokens = puller.detach()                            # 不确认，等待可见性超时
+        time.sleep(0.3)
+        assert wait_stats(pusher, "redelivered", 1)["redelivered"] == 1
+        assert puller.pull().activity == "0"
+        puller.ack(tokens + puller.detach())
+        stats = wait_stats(pusher, "inflight", 0)
+    finally:
+        pusher.release(200)
+        puller.release()
+    assert (stats["inflight"], stats["redelivered"], stats["dead"]) == (0, 1, 0)
+
+
+def test_reliable_retry_limit():
+    silent = zmq.Context.instance().socket(zmq.ROUTER)     # 收到消息但从不确认
+    silent.bind("tcp://*:20463")
+    pusher = MQ("tcp://127.0.0.1:20463", direct=True, reliable={"timeout": 50, "retries": 2, "batch": 1})
+    try:
+        pusher.push(sample_msgs(["0"])[0])
+        stats = wait_stats(pusher, "dead", 1)
+        received = 0
+        while silent.poll(200):
+            silent.recv_multipart()
+            received += 1
+    finally:
+        pusher.release(200)
+        silent.close(linger=0)
+    assert (stats["inflight"], stats["redelivered"], stats["dead"]) == (0, 2, 1)
+    assert received == 3                                    # 首次发送及 2 次重发
+
+
+def test_reliable_duplicate_ack(tmp_path):
+    receiver = zmq.Context.instance().socket(zmq.ROUTER)
+    receiver.bind("tcp://*:20464")
+    spool = str(tmp_path / "push")
+    pusher = MQ("tcp://127.0.0.1:20464", direct=True, spool=spool,
+                reliable={"timeout": 10000, "retries": 3, "batch": 1})
+    try:
+        for msg in sample_msgs(["0", "1"]):
+            pusher.push(msg)
+        ids = []
+        for i in range(0, 2, 1):
+            assert receiver.poll(5000)
+            frames = receiver.recv_multipart()
+            identity = frames[0]
+            ids.append(frames[1])
+        for i in range(0, 2, 1):                            # 重复确认，及未知编号的确认
+            send_acks(receiver, {identity: [ids[0], b"99"]})
+        stats = wait_stats(pusher, "inflight", 1)
+        time.sleep(0.1)
+        pusher.flush()
+        assert pusher.stats()["inflight"] == 1
+    finally:
+        pusher.release(200)
+        receiver.close(linger=0)
+    assert (stats["redelivered"], stats["dead"]) == (0, 0)
+    assert [seq for seq, frames in SPOOL(spool).replay()] == [int(ids[1])]
+
+
+def test_spool_ack_compact_race(tmp_path, monkeypatch):
+    # 写入者与确认者各自打开同一目录；确认者检查段存在之后、打开确认文件之前，写入者回收该段
+    path = str(tmp_path)
+    writer = SPOOL(path, segment=2)
+    acker = SPOOL(path, segment=2)
+    for i in range(0, 4, 1):
+        writer.append([str(i).encode("ascii")])
+    acker.ack([1, 2])
+    acker.ack([3])                                              # 第 0 段已全部确认，其确认文件已关闭
+    exists = os.path.exists
+    compacting = []
+
+    def exists_then_compact(name):
+        rt = exists(name)
+        if (name == writer._name(0, "log")) and (len(compacting) == 0):
+            compacting.append(threading.Thread(target=writer.compact))
+            compacting[0].start()
+            compacting[0].join(0.2)
+        return rt
+    monkeypatch.setattr(os.path, "exists", exists_then_compact)
+    acker.ack([2])                                              # 重复确认
+    monkeypatch.setattr(os.path, "exists", exists)
+    compacting[0].join()
+    names = os.listdir(path)
+    assert [name for name in names if name.endswith(".ack") and (name[:-4] + ".log") not in names] == []
+    assert writer.segments() == [1]
+    acker.ack([4])
+    writer.close()
+    acker.close()
+    assert SPOOL(path, segment=2).replay() == []
+
+def test_spool_idle_sync(tmp_path):
+    spool = SPOOL(str(tmp_path), sync={"count": 1000, "interval": 20})
+    spool.append([b"frame"])
+    assert spool.pending == 1
+    assert 0 < spool.idle() <= 20
+    time.sleep(0.03)
+    assert spool.idle() is None     # 空闲时到间隔即 fsync
+    assert spool.pending == 0
+    spool.close()
+
+
+def overflow_run(policy: str, count: int = 20, depth: int = 3) -> tuple:
+    # 接收方暂不取出，发送方按溢出策略缓冲；随后取出全部，发送方关闭时排空缓冲
+    conn = "inproc://babelor.outbox.{0}".format(policy)
+    hwm = {"send": 1, "recv": 1}
+    puller = MQ(conn, direct=True, hwm=hwm)
+    puller.start("PULL")
+    pusher = MQ(conn, direct=True, hwm=hwm, overflow={"policy": policy, "depth": depth})
+    for msg in sample_msgs([str(i) for i in range(0, count, 1)]):
+        pusher.push(msg)
+    stats = pusher.stats()
+    thread = threading.Thread(target=pusher.release, args=(3000,))
+    thread.start()
+    received = []
+    while puller.poll(500):
+        received.append(int(puller.pull().activity))
+    thread.join()
+    puller.release()
+    return stats, pusher.stats(), received
+
+
+def test_overflow_drop_newest():
+    stats, stats_closed, received = overflow_run("drop-newest")
+    # inproc 管道容量为两端高水位之和（2 条），其后 3 条进入缓冲
+    assert (stats["sent"], stats["depth"], stats["dropped"]) == (2, 3, 15)
+    assert received == [0, 1, 2, 3, 4]                          # 先到的送出，新消息丢弃
+    assert (stats_closed["sent"], stats_closed["depth"]) == (5, 0)
+
+
+def test_overflow_drop_oldest():
+    stats, stats_closed, received = overflow_run("drop-oldest")
+    assert (stats["sent"], stats["depth"], stats["dropped"]) == (2, 3, 15)
+    assert received == [0, 1, 17, 18, 19]                       # 缓冲保留最新的 depth 条
+    assert (stats_closed["sent"], stats_closed["depth"]) == (5, 0)
+
+
+def test_overflow_spill(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    stats, stats_closed, received = overflow_run("spill")
+    assert (stats["sent"], stats["depth"], stats["spilled"]) == (2, 18, 15)
+    assert received == list(range(0, 20, 1))                   # 溢出到磁盘的按序回放，不丢弃
+    assert (stats_closed["dropped"], stats_closed["depth"], stats_closed["sent"]) == (0, 0, 20)
+    assert [name for name in os.listdir(str(tmp_path)) if name.startswith("babelor.spill.")] == []
+
+
+def test_overflow_block():
+    puller = MQ("inproc://babelor.outbox.block", direct=True, hwm={"send": 1, "recv": 1})
+    puller.start("PULL")
+    pusher = MQ("inproc://babelor.outbox.block", direct=True, hwm={"send": 1, "recv": 1},
+                overflow={"policy": "block", "depth": 3})
+    received = []
+
+    def pull_later():
+        time.sleep(0.2)
+        for i in range(0, 10, 1):
+            received.append(int(puller.pull().activity))
+    thread = threading.Thread(target=pull_later)
+    thread.start()
+    start = time.time()
+    for msg in sample_msgs([str(i) for i in range(0, 10, 1)]):
+        pusher.push(msg)
+    assert time.time() - start >= 0.15                          # 高水位时阻塞等待接收方
+    thread.join()
+    stats = pusher.stats()
+    pusher.release()
+    puller.release()
+    assert received == list(range(0, 10, 1))
+    assert (stats["sent"], stats["dropped"], stats["spilled"], stats["depth"]) == (10, 0, 0, 0)
+
+
+def slow_release(port: int, timeout: int, count: int = 10, interval: float = 0.2) -> tuple:
+    # 慢接收方每隔 interval 秒取出一条；大消息超过内核缓冲，关闭时仍有消息排队
+    receiver = zmq.Context.instance().socket(zmq.PULL)
+    receiver.setsockopt(zmq.RCVHWM, 1)
+    receiver.bind("tcp://*:{0}".format(port))
+    received = []
+    is_stop = threading.Event()
+
+    def receive():
+        while not is_stop.is_set():
+            if receiver.poll(50):
+                received.append(frames_to_msgs(receiver.recv_multipart(copy=False))[0].activity)
+                time.sleep(interval)
+    thread = threading.Thread(target=receive)
+    thread.start()
+    pusher = MQ("tcp://127.0.0.1:{0}".format(port), hwm={"send": 1, "recv": 1},
+                overflow={"policy": "block", "depth": 1})
+    for msg in sample_msgs([str(i) for i in range(0, count, 1)]):
+        msg.add_datum(bytes(4 * 1024 * 1024), path="payload.bin")
+        pusher.push(msg)
+    process = pusher.process
+    queued = count - len(received)
+    start = time.time()
+    pusher.release(timeout)
+    elapsed = time.time() - start
+    time.sleep(interval * count)                                  # 已送达内核缓冲的消息继续取出
+    is_stop.set()
+    thread.join()
+    receiver.close(linger=0)
+    return queued, elapsed, process, received
+
+
+def test_release_drains_before_deadline():
+    queued, elapsed, process, received = slow_release(20481, 5000)
+    assert queued > 1
+    assert elapsed < 5                                              # 排空后即返回，不等到期限
+    assert process.exitcode == 0
+    assert received == [str(i) for i in range(0, 10, 1)]
+
+
+def test_release_stops_at_deadline():
+    queued, elapsed, process, received = slow_release(20482, 100, count=6, interval=0.5)
+    assert queued > 1
+    assert elapsed < (100 + CONFIG.MQ_POLL_TIME) / 1000 + 0.5          # 期限到后即返回
+    assert elapsed < queued * 0.5                                   # 不等慢接收方取完排队的消息
+    assert not process.is_alive()
+
+
+def ctrl_child(pipe_ctrl: Pipe, delay: float):
+    # 收到关闭期限后再用 delay 秒才退出
+    pipe_ctrl.recv()
+    time.sleep(delay)
+
+
+@pytest.mark.parametrize("delay, timeout, is_stopped", [(0.05, 1000, True), (10, 100, False)])
+def test_stop_process(delay, timeout, is_stopped):
+    pipe_ctrl = Pipe()
+    process = Process(target=ctrl_child, args=(pipe_ctrl[1], delay))
+    process.start()
+    start = time.time()
+    assert stop_process(process, pipe_ctrl[0], timeout) == is_stopped
+    elapsed = time.time() - start
+    if is_stopped:
+        assert process.exitcode == 0
+        assert elapsed < timeout / 1000                                 # 期限内退出即返回
+    else:
+        assert process.exitcode == -signal.SIGTERM                      # 超过期限才终止
+        assert (timeout + CONFIG.MQ_POLL_TIME) / 1000 <= elapsed < 2
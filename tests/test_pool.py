@@ -0,0 +1,72 @@
+# coding=utf-8
+# Copyright 2019 StrTrek Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# System Required
+import threading
+# Outer Required
+# Inner Required
+from Babelor.Presentation import URL
+from Babelor.Application.Pool import POOL
+
+
+def factory(conn: URL):
+    return object()
+
+
+def get_in_thread(pool: POOL, conn: URL) -> object:
+    handles = []
+    thread = threading.Thread(target=lambda: handles.append(pool.get(conn, factory)))
+    thread.start()
+    thread.join()
+    return handles[0]
+
+
+def test_reuse_per_thread():
+    pool = POOL(idle_time=3600, check_time=3600, max_age=None, capacity=None)
+    conn = URL("tcp://127.0.0.1:20401")
+    handle = pool.get(conn, factory)
+    assert pool.get(conn, factory) is handle
+    assert get_in_thread(pool, conn) is not handle
+    assert pool.stats()["hits"] == 1
+
+
+def test_overflow_keeps_other_threads():
+    pool = POOL(idle_time=3600, check_time=3600, max_age=None, capacity=1)
+    conn = URL("tcp://127.0.0.1:20402")
+    handle = pool.get(conn, factory)
+    other = URL("tcp://127.0.0.1:20403")
+    get_in_thread(pool, other)
+    # 其他线程的新句柄超出容量：本线程句柄被标记，未被其他线程释放
+    assert pool.stats()["size"] == 2
+    assert pool.stats()["stale"] == 1
+    assert pool.stats()["overflow"] == 0
+    # 所属线程下次使用时释放并重建
+    assert pool.get(conn, factory) is not handle
+    assert pool.stats()["overflow"] == 1
+
+
+def test_idle_and_invalidate_by_owner():
+    pool = POOL(idle_time=0, check_time=0, max_age=None, capacity=None)
+    conn = URL("tcp://127.0.0.1:20404")
+    handle = pool.get(conn, factory)
+    get_in_thread(pool, URL("tcp://127.0.0.1:20405"))
+    assert pool.stats()["evicted"] == 0
+    assert pool.stats()["stale"] == 1
+    assert pool.get(conn, factory) is not handle
+    assert pool.stats()["evicted"] == 1
+    pool.idle_time = 3600
+    assert pool.invalidate(conn) == 1
+    assert pool.stats()["invalidated"] == 1
+    assert pool.close() == 1
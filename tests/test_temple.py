@@ -0,0 +1,333 @@
+# coding=utf-8
+# Copyright 2019 StrTrek Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# System Required
+import os
+import time
+import random
+import asyncio
+import threading
+from multiprocessing import Pipe
+# Outer Required
+import zmq
+import pytest
+# Inner Required
+from Babelor.Presentation import MSG, URL, CASE, ROUTE
+from Babelor.Session import MQ
+from Babelor.Application import Temple
+from Babelor.Application.Temple import TEMPLE, AsyncTEMPLE, Congregation, Confession, Fanout, Pipeline, is_mq
+# Global Parameters
+from Babelor.Config import CONFIG
+
+
+CODECS = ["json", "xml", "msgpack"]
+
+
+@pytest.fixture(params=CODECS)
+def codec(request):
+    msg_tpe = CONFIG.MSG_TPE
+    CONFIG.MSG_TPE = request.param
+    yield request.param
+    CONFIG.MSG_TPE = msg_tpe
+
+
+CASE_SHARED = CASE("tcp://127.0.0.1:10001#tcp://127.0.0.1:20100")
+
+
+def joined_msg(route: ROUTE, activity: str) -> MSG:
+    msg = MSG()
+    msg.origination = URL("tcp://127.0.0.1:10001")
+    msg.case = CASE_SHARED
+    msg.activity = activity
+    msg.route = route
+    return msg
+
+
+def data_msg(path: str) -> MSG:
+    msg = MSG()
+    msg.add_datum(b"babelor", path=path)
+    return msg
+
+
+def join_once(fanout: Fanout, msg_head: MSG, path: str, count: int, confessed: list):
+    # 模拟信徒：登记回报，汇合，处理完毕投票
+    confession = Confession(lambda is_ok: confessed.append((path, is_ok)))
+    fanout.hold(confession)
+    joined = fanout.join(msg_head, data_msg(path), count)
+    fanout.hold(None)
+    confession.vote(True)
+    return joined
+
+
+def test_route_batch(codec):
+    route = ROUTE().set_join(2).add("dest", "destination", "file:///tmp/babelor/")
+    msg = MSG(joined_msg(route, "a").to_bytes())
+    assert (msg.route.join, msg.route.batch) == (2, route.batch)
+    assert ROUTE(route.to_string()).batch == route.batch
+
+
+def test_joined_dispatch_by_case():
+    pipes = [Pipe() for i in range(0, 4, 1)]
+    congregation = Congregation([pipe[0] for pipe in pipes], ordered=False, prefetch=10)
+    route = ROUTE().set_join(3).add("dest", "destination", "file:///tmp/babelor/")
+    chosen = set()
+    for i in range(0, 3, 1):
+        msg = joined_msg(route, str(i))
+        chosen.add(congregation.choose(msg))
+        congregation.dispatch(msg, [i])
+    assert len(chosen) == 1
+
+
+def test_prefetch_least_pending():
+    pipes = [Pipe() for i in range(0, 2, 1)]
+    congregation = Congregation([pipe[0] for pipe in pipes], ordered=False, prefetch=2)
+    for i in range(0, 4, 1):
+        assert congregation.is_free()
+        congregation.dispatch(joined_msg(None, str(i)), [i])
+    assert [len(pending) for pending in congregation.pending] == [2, 2]
+    assert not congregation.is_free()
+    assert [pipes[i][1].recv()[0] for i in range(0, 2, 1)] == [1, 2]
+    pipes[1][1].send((2, True))
+    assert congregation.confessed() == [([1], True)]
+    assert congregation.is_free()
+    congregation.dispatch(joined_msg(None, "4"), [4])
+    assert [len(pending) for pending in congregation.pending] == [2, 2]
+
+
+def test_ordered_holds_when_pinned_full():
+    pipes = [Pipe() for i in range(0, 2, 1)]
+    congregation = Congregation([pipe[0] for pipe in pipes], ordered=True, prefetch=1)
+    pinned = congregation.choose(joined_msg(None, "0"))
+    congregation.dispatch(joined_msg(None, "0"), ["0"])
+    congregation.dispatch(joined_msg(None, "1"), ["1"])         # 同一 case，所在信徒已满时暂存，暂停拉入
+    assert (congregation.held is not None) and not congregation.is_free()
+    assert len(congregation.pending[1 - pinned]) == 0
+    pipes[pinned][1].recv()
+    pipes[pinned][1].send((1, True))
+    congregation.confessed()
+    assert congregation.is_free() and (list(congregation.pending[pinned].keys()) == [2])
+
+
+def test_deferred_frees_slot():
+    pipe = Pipe()
+    congregation = Congregation([pipe[0]], ordered=False, prefetch=1)
+    congregation.dispatch(joined_msg(None, "a"), ["a"])
+    assert not congregation.is_free()
+    pipe[1].send((1, None))
+    assert congregation.confessed() == []
+    assert congregation.is_free() and (congregation.outstanding() == 0)
+    pipe[1].send((1, True))
+    assert congregation.confessed() == [(["a"], True)]
+    congregation.dispatch(joined_msg(None, "b"), ["b"])
+    pipe[1].send((2, None))
+    congregation.confessed()
+    assert congregation.release() == ["b"]
+
+
+def test_join_defers_confession():
+    fanout = Fanout()
+    route = ROUTE().set_join(3)
+    confessed = []
+    assert join_once(fanout, joined_msg(route, "0"), "0", 3, confessed) is None
+    assert join_once(fanout, joined_msg(route, "1"), "1", 3, confessed) is None
+    assert confessed == [("0", None), ("1", None)]
+    msg, confessions = join_once(fanout, joined_msg(route, "2"), "2", 3, confessed)
+    assert [msg.read_datum(i)["path"] for i in range(0, msg.dt_count, 1)] == ["0", "1", "2"]
+    assert confessed[-1] == ("2", True)
+    for confession in confessions:
+        confession.vote(True)
+    assert sorted(confessed[-3:]) == [("0", True), ("1", True), ("2", True)]
+
+
+def test_join_dedupe_and_batch():
+    fanout = Fanout()
+    route, route_other = ROUTE().set_join(2), ROUTE().set_join(2)
+    confessed = []
+    assert join_once(fanout, joined_msg(route, "0"), "0", 2, confessed) is None
+    assert join_once(fanout, joined_msg(route, "0"), "0", 2, confessed) is None          # 重复投递
+    assert join_once(fanout, joined_msg(route_other, "1"), "1", 2, confessed) is None    # 同一 case 另一批次
+    msg, confessions = join_once(fanout, joined_msg(route, "1"), "1", 2, confessed)
+    assert msg.dt_count == 2
+    assert len(confessions) == 2
+    assert join_once(fanout, joined_msg(route, "0"), "0", 2, confessed) == (None, [])    # 完成后重复投递
+
+
+def test_join_timeout_nack(monkeypatch):
+    fanout = Fanout()
+    confessed = []
+    monkeypatch.setattr(CONFIG, "TEMPLE_JOIN_TIMEOUT", 0)
+    join_once(fanout, joined_msg(ROUTE().set_join(2), "0"), "0", 2, confessed)
+    join_once(fanout, joined_msg(ROUTE().set_join(2), "1"), "1", 2, confessed)
+    assert ("0", False) in confessed
+
+
+def test_is_mq_without_endpoint(monkeypatch):
+    monkeypatch.setattr("Babelor.Application.Temple.connector", None)      # 判断不得新建端点
+    assert is_mq(URL("tcp://127.0.0.1:10001"))
+    assert not is_mq(URL("file:///tmp/babelor/"))
+    assert not is_mq(None)
+
+
+def test_pipeline_failed(monkeypatch):
+    def stage(role: str, msg_head: MSG, msg: MSG, func: callable = None) -> MSG:
+        if msg_head.activity == msg.activity == "fail":
+            raise ValueError("fail")
+        return msg
+
+    def originate(role: str, msg_head: MSG):
+        for activity in ["ok", msg_head.activity, "ok"]:
+            msg = MSG()
+            msg.activity = activity
+            yield msg
+
+    monkeypatch.setattr(Temple, "originate", originate)
+    monkeypatch.setattr(Temple, "STAGES", [(name, stage) for name, func in Temple.STAGES])
+    done = {}
+    lock = threading.Lock()
+
+    def confess(sequence: int, is_ok: bool):
+        with lock:
+            done[sequence] = is_ok
+
+    pipeline = Pipeline("SENDER", None, confess)
+    for sequence in range(0, 200, 1):
+        pipeline.feed(sequence, joined_msg(None, "fail" if sequence % 3 == 0 else "ok"))
+    pipeline.close()
+    assert done == dict([(sequence, sequence % 3 != 0) for sequence in range(0, 200, 1)])
+    assert pipeline.failed == set()
+
+
+def test_ordered_workers(tmp_path, monkeypatch):
+    # 多个进程信徒按 case 有序：交错发送的各 case 消息在各自 case 内按发送顺序处理
+    monkeypatch.chdir("/")                      # "file:///<path>" 解析为相对路径
+    (tmp_path / "source.txt").write_bytes(b"babelor")
+    log_path = str(tmp_path / "order.log")
+    cases, count = 4, 15
+
+    def func(msg: MSG) -> MSG:
+        time.sleep(random.random() * 0.005)
+        with open(log_path, "a") as file:
+            file.write("{0} {1} {2}\n".format(msg.case.origination.port, msg.activity, os.getpid()))
+        return msg
+
+    temple = TEMPLE("tcp://*:20451")
+    temple.open(role="sender", func=func, workers=3, ordered=True, thread=False, pipelined=False)
+    mq = MQ("tcp://127.0.0.1:20451")
+    case_list = [CASE("tcp://127.0.0.1:{0}#tcp://127.0.0.1:20100".format(10001 + c)) for c in range(0, cases, 1)]
+    try:
+        for j in range(0, count, 1):
+            for case in case_list:
+                msg = MSG()
+                msg.case = case
+                msg.activity = str(j)
+                msg.origination = URL("file://{0}".format(tmp_path))
+                msg.add_args("", path="source.txt")
+                mq.push(msg)
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            if os.path.exists(log_path) and (len(open(log_path).read().splitlines()) >= cases * count):
+                break
+            time.sleep(0.05)
+    finally:
+        mq.release()
+        temple.stop()
+    records = [line.split(" ") for line in open(log_path).read().splitlines()]
+    assert len(records) == cases * count
+    for c in range(0, cases, 1):
+        port = str(10001 + c)
+        assert [int(activity) for p, activity, pid in records if p == port] == list(range(0, count, 1))
+        assert len(set([pid for p, activity, pid in records if p == port])) == 1
+
+
+async def async_dispatch(ordered: bool) -> tuple:
+    # a0 最慢，a1 处理失败；同一 case 的后续消息须等上一条完成（无论成败）
+    delays = {"a0": 0.1, "b0": 0.05, "a1": 0, "b1": 0, "a2": 0}
+    events = []
+
+    async def work(msg_head: MSG):
+        events.append(("start", msg_head.activity))
+        await asyncio.sleep(delays[msg_head.activity])
+        if msg_head.activity in ["a1"]:
+            raise ValueError(msg_head.activity)
+        events.append(("end", msg_head.activity))
+    temple = AsyncTEMPLE("tcp://*:20491")
+    temple._work = work
+    cases = {"a": CASE("tcp://127.0.0.1:10001#tcp://127.0.0.1:20494"),
+             "b": CASE("tcp://127.0.0.1:10001#tcp://127.0.0.1:20495")}
+    semaphore = asyncio.Semaphore(len(delays))
+    for activity in delays.keys():
+        msg = MSG()
+        msg.case = cases[activity[0]]
+        msg.activity = activity
+        await semaphore.acquire()
+        temple._dispatch(msg, semaphore, ordered)
+    assert semaphore.locked()
+    await asyncio.gather(*list(temple.tasks))
+    assert not semaphore.locked()                               # 成败均释放
+    return temple, events
+
+
+def test_async_dispatch_ordered():
+    temple, events = asyncio.run(async_dispatch(True))
+    starts = [activity for event, activity in events if event in ["start"]]
+    assert [activity for activity in starts if activity.startswith("a")] == ["a0", "a1", "a2"]
+    assert events.index(("start", "a1")) > events.index(("end", "a0"))
+    assert events.index(("start", "b1")) < events.index(("end", "a0"))      # 不同 case 之间并发
+    assert ("end", "a2") in events                                          # 上一条失败不阻塞
+    assert (temple.chains, temple.tasks) == ({}, set())
+
+
+def test_async_dispatch_unordered():
+    temple, events = asyncio.run(async_dispatch(False))
+    assert events.index(("start", "a2")) < events.index(("end", "a0"))
+    assert temple.chains == {}
+
+
+def test_async_mq_call_serialised(monkeypatch):
+    # 非 ROUTER 模式一个端点只有一个 REQ 套接字，同时发起的请求须逐条进行
+    monkeypatch.setattr(CONFIG, "MQ_ROUTER", False)
+    server = zmq.Context.instance().socket(zmq.REP)
+    server.bind("tcp://*:20492")
+    served = []
+
+    def echo():
+        while server.poll(1000):
+            frames = server.recv_multipart(copy=False)
+            time.sleep(0.02)
+            server.send_multipart(frames, copy=False)
+            served.append(len(frames))
+    thread = threading.Thread(target=echo)
+    thread.start()
+
+    async def call_all() -> list:
+        temple = AsyncTEMPLE("tcp://*:20493")
+        conn = URL("tcp://127.0.0.1:20492")
+        msgs = []
+        for i in range(0, 5, 1):
+            msg = MSG()
+            msg.activity = str(i)
+            msgs.append(msg)
+        try:
+            msgs_out = await asyncio.gather(*[temple._mq_call(conn, "REQUEST", msg) for msg in msgs])
+            assert (len(temple.sockets), len(temple.locks)) == (1, 1)
+        finally:
+            await temple.stop(0)
+        return [msg.activity for msg in msgs_out]
+    try:
+        assert asyncio.run(call_all()) == ["0", "1", "2", "3", "4"]
+    finally:
+        thread.join()
+        server.close(linger=0)
+    assert len(served) == 5